@@ -1,7 +1,7 @@
 from django.contrib import admin
 from .models import (
     PokemonSpecies, UserProfile, UserPokemon,
-    Battle, Item, UserItem
+    Battle, BattleArchive, BattleEvent, Item, SpeciesMatchup, UserItem
 )
 
 @admin.register(PokemonSpecies)
@@ -29,7 +29,9 @@ class UserProfileAdmin(admin.ModelAdmin):
     list_display = ['trainer_name', 'user', 'level', 'experience', 'coins', 'total_pokemon_caught']
     list_filter = ['level']
     search_fields = ['trainer_name', 'user__username', 'user__email']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['created_at', 'updated_at', 'pokemon_count', 'shiny_count',
+                       'common_count', 'rare_count', 'epic_count', 'legendary_count',
+                       'mythical_count', 'ultrabeast_count']
 
     fieldsets = (
         ('Trainer Info', {
@@ -44,6 +46,11 @@ class UserProfileAdmin(admin.ModelAdmin):
         ('Statistics', {
             'fields': ('total_pokemon_caught', 'battles_won', 'battles_lost')
         }),
+        ('Collection', {
+            'fields': ('pokemon_count', 'shiny_count', 'common_count', 'rare_count',
+                      'epic_count', 'legendary_count', 'mythical_count', 'ultrabeast_count'),
+            'classes': ('collapse',)
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
@@ -77,12 +84,34 @@ class UserPokemonAdmin(admin.ModelAdmin):
         }),
     )
 
+class BattleEventInline(admin.TabularInline):
+    model = BattleEvent
+    extra = 0
+    can_delete = False
+    readonly_fields = ['seq', 'turn', 'message', 'payload', 'created_at']
+
 @admin.register(Battle)
 class BattleAdmin(admin.ModelAdmin):
     list_display = ['trainer', 'battle_type', 'player_pokemon', 'opponent_pokemon', 'status', 'created_at']
     list_filter = ['battle_type', 'status', 'created_at']
     search_fields = ['trainer__username', 'player_pokemon__nickname', 'opponent_pokemon__name']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['created_at', 'updated_at', 'event_count']
+    inlines = [BattleEventInline]
+
+@admin.register(BattleArchive)
+class BattleArchiveAdmin(admin.ModelAdmin):
+    list_display = ['id', 'trainer', 'battle_type', 'opponent_pokemon', 'status', 'finished_at']
+    list_filter = ['battle_type', 'status']
+    search_fields = ['trainer__username', 'opponent_pokemon__name']
+    exclude = ['log']
+    readonly_fields = ['archived_at', 'events']
+
+@admin.register(SpeciesMatchup)
+class SpeciesMatchupAdmin(admin.ModelAdmin):
+    list_display = ['species', 'opponent', 'level', 'wins', 'draws', 'battles']
+    list_filter = ['level']
+    search_fields = ['species__name', 'opponent__name']
+    list_select_related = ['species', 'opponent']
 
 @admin.register(Item)
 class ItemAdmin(admin.ModelAdmin):
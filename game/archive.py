@@ -0,0 +1,56 @@
+"""
+Cold storage for finished battles.
+
+Finished battles are only ever read back from the trainer's history, but
+every row (and its BattleEvent log rows) stays in the hot tables forever.
+archive_battles() moves old ones into BattleArchive, one row per battle
+with the log compressed into a single blob, in short transactions so the
+Battle table is never locked for long.
+"""
+from itertools import groupby
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Battle, BattleArchive, BattleEvent
+
+ARCHIVE_BATCH_SIZE = 500
+
+def archive_battles(older_than, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move finished battles last touched more than `older_than` ago into
+    BattleArchive.
+
+    Works through the table in id order, one transaction per batch of
+    `batch_size` battles, and yields (battles, events, log_bytes) for each
+    batch so callers can report progress or pause between batches.
+    """
+    cutoff = timezone.now() - older_than
+    finished = Battle.objects.exclude(status='ongoing').filter(updated_at__lt=cutoff)
+    last_id = 0
+
+    while True:
+        with transaction.atomic():
+            battles = list(finished.filter(id__gt=last_id).order_by('id')[:batch_size])
+            if not battles:
+                return
+            last_id = battles[-1].id
+            ids = [battle.id for battle in battles]
+
+            events = BattleEvent.objects.filter(battle_id__in=ids).order_by('battle_id', 'seq')
+            logs = {
+                battle_id: list(battle_events)
+                for battle_id, battle_events in groupby(events, key=lambda event: event.battle_id)
+            }
+            archives = [BattleArchive.from_battle(battle, logs.get(battle.id, ())) for battle in battles]
+            # A batch that was archived but not deleted (e.g. a killed run)
+            # is simply archived again
+            BattleArchive.objects.bulk_create(archives, ignore_conflicts=True)
+
+            BattleEvent.objects.filter(battle_id__in=ids).delete()
+            # The events are the only rows pointing at a battle (see
+            # RAW_DELETE_RELATIONS in game.release) and Battle has no delete
+            # signals, so with the events gone the collector has nothing to do
+            Battle.objects.filter(id__in=ids)._raw_delete(Battle.objects.db)
+
+        yield len(battles), sum(map(len, logs.values())), sum(len(archive.log) for archive in archives)
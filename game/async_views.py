@@ -0,0 +1,93 @@
+"""
+Async versions of the wild-map JSON endpoints.
+
+These are the busiest, cheapest requests in the game. Under ASGI they run
+on the event loop, using the async ORM and cache APIs, instead of holding
+a sync worker thread each. Set ASYNC_CATCH_VIEWS to route the encounter
+and catch URLs here; responses are identical to the sync views.
+
+The async ORM has no transactions, so once the encounter is claimed the
+catch itself runs game.catch.resolve_catch() through sync_to_async, in
+the same single transaction as the sync view.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core import signing
+from django.http import JsonResponse
+
+from .catalog import aget_species_catalog
+from .catch import json_body, parse_throws, resolve_catch, roll_encounter
+from .encounters import aclaim_encounter, load_encounter
+from .models import UserProfile
+
+@login_required
+async def encounter_pokemon(request):
+    """Generate a random Pokemon encounter for the map"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method'})
+
+    user = await request.auser()
+    profile = await UserProfile.objects.aget(user_id=user.id)
+
+    # Check if user has pokeballs
+    if profile.pokeballs <= 0:
+        return JsonResponse({'success': False, 'message': "You don't have any Pokeballs!"})
+
+    # Check daily catch limit
+    await profile.arefresh_daily_catches()
+
+    if profile.daily_catches >= settings.DAILY_CATCH_LIMIT:
+        return JsonResponse({'success': False, 'message': "You've reached your daily catch limit!"})
+
+    sampler = (await aget_species_catalog()).encounter_sampler
+    if not len(sampler):
+        return JsonResponse({'success': False, 'message': 'No Pokemon species available!'})
+
+    return JsonResponse({
+        'success': True,
+        'pokemon': roll_encounter(user.id, sampler, profile.level),
+    })
+
+@login_required
+async def attempt_catch(request):
+    """Attempt to catch the encountered Pokemon (see views.attempt_catch)"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method'})
+
+    user = await request.auser()
+
+    data = json_body(request)
+    token = data.get('encounter')
+    if not token:
+        return JsonResponse({'success': False, 'message': 'No active encounter!'})
+
+    try:
+        species_id, wild_level, nonce = load_encounter(user.id, token)
+    except signing.SignatureExpired:
+        return JsonResponse({'success': False, 'message': 'Encounter expired!'})
+    except signing.BadSignature:
+        return JsonResponse({'success': False, 'message': 'No active encounter!'})
+
+    profile = await UserProfile.objects.aget(user_id=user.id)
+
+    # Check if user has pokeballs
+    if profile.pokeballs <= 0:
+        return JsonResponse({'success': False, 'message': "You don't have any Pokeballs!"})
+
+    # The daily limit is enforced at catch time (see views.attempt_catch)
+    await profile.arefresh_daily_catches()
+    if profile.daily_catches >= settings.DAILY_CATCH_LIMIT:
+        return JsonResponse({'success': False, 'message': "You've reached your daily catch limit!"})
+
+    wild_pokemon = (await aget_species_catalog()).get(species_id)
+    if wild_pokemon is None:
+        return JsonResponse({'success': False, 'message': 'Invalid Pokemon species!'})
+
+    # Reserve the encounter so it cannot be caught twice
+    if not await aclaim_encounter(nonce):
+        return JsonResponse({'success': False, 'message': 'This Pokemon is no longer here!'})
+
+    return await sync_to_async(resolve_catch)(
+        user, profile, wild_pokemon, wild_level, nonce, parse_throws(data, profile.pokeballs)
+    )
@@ -0,0 +1,344 @@
+"""
+Write-back store for ongoing battles.
+
+While a wild battle is running, its working copy (the Battle with its player
+Pokemon, queued log events and the visible log tail) lives in the configured
+Django cache under a TTL. Turns only touch the cache; the database is written
+once, in a single transaction, when the battle is won, lost or fled, or when
+the session expires.
+
+Auto-battles skip the session entirely: run_auto_battles() plays whole
+fights in memory and writes them all in one transaction.
+"""
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404
+from django.utils import timezone
+
+from .engine import (
+    COINS_PER_LEVEL, EXP_PER_LEVEL, BattleState, Combatant, auto_battle, resolve_turn
+)
+from .models import Battle, BattleEvent, UserPokemon, UserProfile
+
+BATTLE_SESSION_KEY = 'game:battle-session:{}'
+BATTLE_LOCK_KEY = 'game:battle-lock:{}'
+POKEMON_LOCK_KEY = 'game:pokemon-lock:{}'
+
+# Longest a request may hold a battle's (or a Pokemon's) lock, should it
+# die mid-turn
+BATTLE_LOCK_TIMEOUT = 10
+
+# An idle battle is abandoned (recorded as fled) after this many seconds
+BATTLE_SESSION_TTL = 15 * 60
+
+# Keep the cache entry longer than the session itself so an expired
+# session can still be flushed rather than silently dropped. The
+# expire_battles command has to run more often than this (see
+# DEPLOYMENT.md); 15 minutes leaves room for a 10-minute scheduler.
+BATTLE_SESSION_GRACE = 15 * 60
+
+class BattleSession:
+    """Cached working copy of one ongoing battle"""
+
+    def __init__(self, battle, log):
+        self.battle = battle
+        self.log = list(log)[-Battle.LOG_TAIL:]
+        self.touch()
+
+    def touch(self):
+        self.expires_at = time.time() + BATTLE_SESSION_TTL
+
+    @property
+    def expired(self):
+        return time.time() >= self.expires_at
+
+    @property
+    def events(self):
+        """Log tail to render: persisted events plus those still queued"""
+        return (self.log + self.battle._pending_events)[-Battle.LOG_TAIL:]
+
+    def engine_state(self):
+        """Snapshot the battle into the engine's plain records"""
+        battle = self.battle
+        return BattleState(
+            player=player_combatant(battle.player_pokemon),
+            opponent=wild_combatant(battle.opponent_pokemon, battle.opponent_level,
+                                    battle.opponent_hp),
+            turn=battle.turns,
+            status=battle.status,
+            experience_gained=battle.experience_gained,
+            coins_gained=battle.coins_gained,
+        )
+
+    def apply(self, state, events):
+        """Copy an engine state and the events it produced back onto the battle"""
+        battle = self.battle
+        battle.turns = state.turn
+        battle.status = state.status
+        battle.experience_gained = state.experience_gained
+        battle.coins_gained = state.coins_gained
+        battle.player_pokemon.current_hp = state.player.hp
+        battle.opponent_hp = state.opponent.hp
+        for event in events:
+            battle.add_to_log(event.message, **event.payload)
+
+    def play_turn(self, action, rng):
+        """Resolve one action against the cached battle (no database access)"""
+        state = self.engine_state()
+        events = resolve_turn(state, action, rng)
+        self.apply(state, events)
+        return events
+
+def _base_stats(species):
+    return (species.base_hp, species.base_attack, species.base_defense,
+            species.base_sp_attack, species.base_sp_defense, species.base_speed)
+
+def _types(species):
+    return (species.type1, species.type2) if species.type2 else (species.type1,)
+
+def player_combatant(pokemon):
+    ivs = (pokemon.iv_hp, pokemon.iv_attack, pokemon.iv_defense,
+           pokemon.iv_sp_attack, pokemon.iv_sp_defense, pokemon.iv_speed)
+    return Combatant.from_stats(
+        pokemon.display_name, pokemon.level, _types(pokemon.species),
+        _base_stats(pokemon.species), ivs, hp=pokemon.current_hp,
+    )
+
+def wild_combatant(species, level, hp=None):
+    return Combatant.from_stats(species.name, level, _types(species), _base_stats(species), hp=hp)
+
+def _key(battle_id):
+    return BATTLE_SESSION_KEY.format(battle_id)
+
+def start_battle_session(battle):
+    """Cache a freshly created (already saved) battle"""
+    session = BattleSession(battle, battle.recent_events())
+    save_battle_session(session)
+    return session
+
+def save_battle_session(session):
+    session.touch()
+    cache.set(_key(session.battle.id), session, BATTLE_SESSION_TTL + BATTLE_SESSION_GRACE)
+
+@contextmanager
+def battle_session_lock(battle_id, wait=0):
+    """
+    Hold a battle's lock around one load -> play -> save, so two requests
+    (a double-clicked action, say) can't each play or finish the same
+    cached session. Yields whether the lock was taken, after retrying for
+    up to `wait` seconds.
+    """
+    with _cache_lock(BATTLE_LOCK_KEY.format(battle_id), wait) as locked:
+        yield locked
+
+@contextmanager
+def pokemon_battle_lock(pokemon_id, wait=0):
+    """
+    Hold a Pokemon's lock while checking it is free and starting a battle
+    with it (or fighting a whole auto-battle run). Battles copy the
+    Pokemon's HP when they start and write it back when they end, so two
+    started together would each undo the other's damage. Yields whether
+    the lock was taken.
+    """
+    with _cache_lock(POKEMON_LOCK_KEY.format(pokemon_id), wait) as locked:
+        yield locked
+
+@contextmanager
+def _cache_lock(key, wait):
+    deadline = time.monotonic() + wait
+    locked = cache.add(key, True, BATTLE_LOCK_TIMEOUT)
+    while not locked and time.monotonic() < deadline:
+        time.sleep(0.05)
+        locked = cache.add(key, True, BATTLE_LOCK_TIMEOUT)
+    try:
+        yield locked
+    finally:
+        if locked:
+            cache.delete(key)
+
+def load_battle_session(battle_id, user):
+    """
+    Return the session for one of `user`'s battles. Call it under
+    battle_session_lock(), as an expired session is finished here.
+
+    Falls back to the database when nothing is cached (a finished battle,
+    a cold cache or an evicted entry). Raises Http404 for battles that do
+    not exist or belong to someone else.
+    """
+    session = cache.get(_key(battle_id))
+    if session is not None:
+        if session.battle.trainer_id != user.id:
+            raise Http404('No Battle matches the given query.')
+        if session.expired:
+            expire_battle_session(session)
+        return session
+
+    try:
+        battle = Battle.objects.select_related('player_pokemon__species', 'opponent_pokemon').get(
+            id=battle_id, trainer=user
+        )
+    except Battle.DoesNotExist:
+        raise Http404('No Battle matches the given query.')
+
+    session = BattleSession(battle, battle.recent_events())
+    if battle.status == 'ongoing':
+        save_battle_session(session)
+    return session
+
+def _record_results(trainer_id, pokemon, battles):
+    """Write the Pokemon's HP and the trainer's rewards for finished battles"""
+    won = [battle for battle in battles if battle.status == 'won']
+    lost = sum(battle.status == 'lost' for battle in battles)
+
+    pokemon_updates = {'current_hp': pokemon.current_hp}
+    if won:
+        pokemon_updates['battles_won'] = F('battles_won') + len(won)
+    UserPokemon.objects.filter(id=pokemon.id).update(**pokemon_updates)
+
+    if won or lost:
+        profile = UserProfile.objects.select_for_update().get(user_id=trainer_id)
+        profile.battles_won += len(won)
+        profile.battles_lost += lost
+        for battle in won:
+            profile.coins += battle.coins_gained
+            profile.add_experience(battle.experience_gained, save=False)
+        profile.save()
+
+def finish_battle_session(session):
+    """Persist a battle that has just ended and drop it from the cache"""
+    battle = session.battle
+
+    with transaction.atomic():
+        battle.save()
+        _record_results(battle.trainer_id, battle.player_pokemon, [battle])
+
+    # Hand the pending events over to the rendered log
+    session.log = session.events
+    cache.delete(_key(battle.id))
+
+def expire_battle_session(session):
+    """Close an abandoned battle as fled, keeping whatever happened in it"""
+    session.battle.status = 'fled'
+    session.battle.add_to_log("The battle timed out.")
+    finish_battle_session(session)
+
+def expire_stale_battles():
+    """
+    Close every ongoing battle that has been idle for longer than the TTL.
+
+    Returns the number of battles closed. Battles whose cache entry is gone
+    entirely are marked fled directly, as nothing else is left to save:
+    that happens when this has not run within BATTLE_SESSION_GRACE of the
+    session expiring, or the cache evicted the entry, and the turns played
+    since the battle started are lost.
+    """
+    cutoff = timezone.now() - timedelta(seconds=BATTLE_SESSION_TTL)
+    stale = Battle.objects.filter(status='ongoing', updated_at__lt=cutoff)
+
+    closed = 0
+    for battle_id in stale.values_list('id', flat=True).iterator():
+        with battle_session_lock(battle_id) as locked:
+            # A battle being played right now isn't idle
+            if not locked:
+                continue
+            session = cache.get(_key(battle_id))
+            if session is not None:
+                if not session.expired:
+                    continue
+                expire_battle_session(session)
+            else:
+                Battle.objects.filter(id=battle_id, status='ongoing').update(status='fled')
+        closed += 1
+    return closed
+
+def new_wild_battle(trainer, pokemon, catalog, rng=random):
+    """An unsaved wild battle against a random species near `pokemon`'s level"""
+    wild_species = rng.choice(catalog.species)
+    wild_level = rng.randint(max(1, pokemon.level - 5), pokemon.level + 5)
+
+    battle = Battle(
+        trainer=trainer,
+        battle_type='wild',
+        player_pokemon=pokemon,
+        opponent_pokemon=wild_species,
+        opponent_level=wild_level,
+    )
+    battle.add_to_log(f"A wild {wild_species.name} appeared!")
+    battle.add_to_log(f"Go, {pokemon.display_name}!")
+    return battle
+
+def run_auto_battles(trainer, pokemon, catalog, count, rng=random):
+    """
+    Fight up to `count` wild battles back to back with `pokemon`.
+
+    Stops early once the Pokemon faints. Every battle, log event and
+    reward is written in a single transaction at the end. Returns a list
+    of (battle, events) pairs.
+    """
+    results = []
+    for _ in range(count):
+        if pokemon.current_hp <= 0:
+            break
+        session = BattleSession(new_wild_battle(trainer, pokemon, catalog, rng), [])
+        state = session.engine_state()
+        session.apply(state, auto_battle(state, rng))
+        battle = session.battle
+        results.append((battle, list(battle._pending_events)))
+        battle._pending_events.clear()
+
+    battles = [battle for battle, _ in results]
+    with transaction.atomic():
+        Battle.objects.bulk_create(battles)
+        BattleEvent.objects.bulk_create([event for _, events in results for event in events])
+        _record_results(trainer.id, pokemon, battles)
+    return results
+
+def record_pvp_battle(players, winner, log):
+    """
+    Save a finished trainer-vs-trainer battle.
+
+    `players` is a pair of dicts (user_id, pokemon_id, species_id, level,
+    hp) and `winner` is 0, 1 or None if nobody won. `log` is a list of
+    (turn, message, payload) tuples. Each trainer gets their own Battle
+    row with the full log; HP and rewards are written as for wild battles.
+    """
+    turns = log[-1][0] if log else 0
+    battles = []
+    for side, (me, them) in enumerate(zip(players, players[::-1])):
+        if winner is None:
+            status = 'fled'
+        else:
+            status = 'won' if winner == side else 'lost'
+        battle = Battle(
+            trainer_id=me['user_id'],
+            battle_type='trainer',
+            status=status,
+            player_pokemon_id=me['pokemon_id'],
+            opponent_pokemon_id=them['species_id'],
+            opponent_level=them['level'],
+            opponent_hp=them['hp'],
+        )
+        if status == 'won':
+            battle.experience_gained = them['level'] * EXP_PER_LEVEL
+            battle.coins_gained = them['level'] * COINS_PER_LEVEL
+        for turn, message, payload in log:
+            battle.turns = turn
+            battle.add_to_log(message, **payload)
+        battle.turns = turns
+        battles.append(battle)
+
+    with transaction.atomic():
+        Battle.objects.bulk_create(battles)
+        BattleEvent.objects.bulk_create([event for battle in battles for event in battle._pending_events])
+        for battle, me in zip(battles, players):
+            battle._pending_events.clear()
+            pokemon = SimpleNamespace(id=me['pokemon_id'], current_hp=me['hp'])
+            _record_results(me['user_id'], pokemon, [battle])
+    return battles
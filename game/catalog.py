@@ -0,0 +1,112 @@
+"""
+Process-wide read-only cache of the Pokemon species catalog.
+
+Species rows almost never change at runtime, so each worker keeps one
+snapshot in memory. A version token in the shared Django cache is replaced
+once a species change is committed; workers compare it on access and
+rebuild their snapshot when it no longer matches.
+
+The cached PokemonSpecies instances are shared between requests and must be
+treated as read-only.
+"""
+import uuid
+from types import MappingProxyType
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.functional import cached_property
+
+CATALOG_VERSION_KEY = 'game:species-catalog-version'
+
+class SpeciesCatalog:
+    """Immutable snapshot of every PokemonSpecies with in-memory lookups"""
+
+    def __init__(self, species, version=None):
+        self.species = tuple(species)
+        self.version = version
+
+        by_type = {}
+        by_rarity = {}
+        for s in self.species:
+            by_type.setdefault(s.type1, []).append(s)
+            if s.type2 and s.type2 != s.type1:
+                by_type.setdefault(s.type2, []).append(s)
+            by_rarity.setdefault(s.rarity, []).append(s)
+
+        self.by_id = MappingProxyType({s.id: s for s in self.species})
+        self.by_pokedex_id = MappingProxyType({s.pokedex_id: s for s in self.species})
+        self.by_type = MappingProxyType({k: tuple(v) for k, v in by_type.items()})
+        self.by_rarity = MappingProxyType({k: tuple(v) for k, v in by_rarity.items()})
+
+    def __len__(self):
+        return len(self.species)
+
+    def __iter__(self):
+        return iter(self.species)
+
+    def get(self, species_id):
+        return self.by_id.get(species_id)
+
+    def get_by_pokedex_id(self, pokedex_id):
+        return self.by_pokedex_id.get(pokedex_id)
+
+    def of_type(self, type_name):
+        return self.by_type.get(type_name, ())
+
+    def of_rarity(self, rarity):
+        return self.by_rarity.get(rarity, ())
+
+    @cached_property
+    def encounter_sampler(self):
+        from .encounters import EncounterSampler
+        return EncounterSampler(self.species)
+
+    @cached_property
+    def evolution(self):
+        from .evolution import EvolutionGraph
+        return EvolutionGraph(self.species)
+
+_catalog = None
+
+def _load_catalog(version):
+    global _catalog
+    from .models import PokemonSpecies
+    catalog = SpeciesCatalog(PokemonSpecies.objects.all(), version)
+    _catalog = catalog
+    return catalog
+
+def get_species_catalog():
+    """Return this worker's catalog, rebuilding it if the version moved on"""
+    version = cache.get(CATALOG_VERSION_KEY)
+    catalog = _catalog
+    if catalog is None or catalog.version != version:
+        catalog = _load_catalog(version)
+    return catalog
+
+async def aget_species_catalog():
+    """Async get_species_catalog(); only a rebuild leaves the event loop"""
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    catalog = _catalog
+    if catalog is None or catalog.version != version:
+        catalog = await sync_to_async(_load_catalog)(version)
+    return catalog
+
+def bump_catalog_version():
+    """Invalidate the catalog in this worker and, via the cache, all others"""
+    global _catalog
+    _catalog = None
+    # A fresh token rather than incr() so an evicted key can never be
+    # mistaken for a version some worker already holds
+    cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+
+def invalidate_catalog():
+    """
+    Species changed in the current transaction. This worker drops its
+    snapshot right away, so it sees its own writes; the new version is
+    only published once the change commits, as a worker rebuilding before
+    then would read the old rows and keep them until the next bump.
+    """
+    global _catalog
+    _catalog = None
+    transaction.on_commit(bump_catalog_version)
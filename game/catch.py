@@ -0,0 +1,176 @@
+"""
+Catch resolution shared by the sync and async wild-map views.
+
+The views only decode the encounter token and check the cheap things
+first; resolve_catch() does everything that touches the database, in one
+transaction, so a catch either spends the balls, records the Pokemon and
+pays out, or does none of it. The async view runs it with sync_to_async,
+as the async ORM has no transactions.
+"""
+import json
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .encounters import catch_chance, release_encounter, roll_throws, roll_wild_level, sign_encounter
+from .leveling import level_up
+from .models import UserPokemon, UserProfile
+
+# Most balls a single "throw until caught" request may spend
+MAX_THROWS_PER_REQUEST = 10
+
+# Profile values read back after a catch attempt
+CATCH_RESULT_FIELDS = ('pokeballs', 'daily_catches', 'level', 'experience', 'pokemon_count')
+
+def json_body(request):
+    """Parse a JSON request body, treating anything malformed as empty"""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+def roll_encounter(user_id, sampler, trainer_level):
+    """One wild encounter as sent to the map"""
+    wild_pokemon = sampler.draw()
+    wild_level = roll_wild_level(trainer_level)
+    return {
+        'id': wild_pokemon.id,
+        'name': wild_pokemon.name,
+        'level': wild_level,
+        'rarity': wild_pokemon.rarity,
+        # Signed encounter to send back with the catch attempt
+        'token': sign_encounter(user_id, wild_pokemon.id, wild_level),
+    }
+
+def parse_throws(data, pokeballs):
+    try:
+        throws = int(data.get('throws', 1))
+    except (TypeError, ValueError):
+        throws = 1
+    return max(1, min(throws, MAX_THROWS_PER_REQUEST, pokeballs))
+
+def _catch_updates(balls_used, caught, exp_gained, coins_gained):
+    """F() updates for the profile after a round of throws"""
+    updates = {'pokeballs': F('pokeballs') - balls_used, 'updated_at': timezone.now()}
+    if caught:
+        updates.update(
+            daily_catches=F('daily_catches') + 1,
+            experience=F('experience') + exp_gained,
+            coins=F('coins') + coins_gained,
+        )
+    return updates
+
+def _caught_pokemon(owner, species, level):
+    """Field values for a newly caught UserPokemon"""
+    return {
+        'owner': owner,
+        'species': species,
+        'level': level,
+        'iv_hp': random.randint(0, 31),
+        'iv_attack': random.randint(0, 31),
+        'iv_defense': random.randint(0, 31),
+        'iv_speed': random.randint(0, 31),
+    }
+
+def _level_up(result):
+    """
+    (result, F() updates) for the trainer's level after a catch, from the
+    CATCH_RESULT_FIELDS row. The updates are empty without a level up.
+    """
+    pokeballs, daily_catches, level, experience, pokemon_count = result
+    new_level, coins, balls = level_up(level, experience)
+    if new_level == level:
+        return result, {}
+    updates = {'level': new_level, 'coins': F('coins') + coins, 'pokeballs': F('pokeballs') + balls}
+    return (pokeballs + balls, daily_catches, new_level, experience, pokemon_count), updates
+
+def _catch_refused(daily_catches):
+    """JSON reply when the conditional catch UPDATE matched no row"""
+    if daily_catches >= settings.DAILY_CATCH_LIMIT:
+        return JsonResponse({'success': False, 'message': "You've reached your daily catch limit!"})
+    return JsonResponse({'success': False, 'message': "You don't have any Pokeballs!"})
+
+def _catch_response(wild_pokemon, wild_level, caught, balls_used, result, leveled_up):
+    """JSON reply to a catch attempt; `result` holds CATCH_RESULT_FIELDS"""
+    pokeballs, daily_catches, level, _, pokemon_count = result
+    if caught:
+        message = f"Caught {wild_pokemon.name} (Level {wild_level})!"
+        if balls_used > 1:
+            message += f" It took {balls_used} Pokeballs."
+        if leveled_up:
+            message += f" You leveled up to Level {level}!"
+
+        return JsonResponse({
+            'success': True,
+            'message': message,
+            'pokeballs': pokeballs,
+            'daily_catches': daily_catches,
+            'pokemon_count': pokemon_count,
+            'exp_gained': wild_level * 10,
+            'coins_gained': wild_level * 5,
+            'balls_used': balls_used
+        })
+
+    # Failed catch
+    message = f"{wild_pokemon.name} broke free!"
+    if balls_used > 1:
+        message = f"{wild_pokemon.name} broke free from {balls_used} Pokeballs!"
+
+    return JsonResponse({
+        'success': False,
+        'message': message,
+        'pokeballs': pokeballs,
+        'daily_catches': daily_catches,
+        'balls_used': balls_used
+    })
+
+def resolve_catch(user, profile, wild_pokemon, wild_level, nonce, throws):
+    """
+    Throw up to `throws` balls at a claimed encounter and record the
+    outcome. Returns the JSON reply.
+
+    The balls are only spent if the trainer still has them and is under the
+    daily limit, and every counter is updated with F() expressions, so
+    concurrent catches from another tab can't overwrite each other. The
+    encounter is given back unless the Pokemon was caught, including when
+    the transaction fails.
+    """
+    chance = catch_chance(wild_pokemon.catch_rate, wild_level, profile.level)
+    caught, balls_used = roll_throws(chance, throws)
+
+    leveled_up = False
+    try:
+        with transaction.atomic():
+            updates = _catch_updates(balls_used, caught, wild_level * 10, wild_level * 5)
+            profiles = UserProfile.objects.filter(pk=profile.pk)
+            if not profiles.filter(
+                pokeballs__gte=balls_used, daily_catches__lt=settings.DAILY_CATCH_LIMIT
+            ).update(**updates):
+                release_encounter(nonce)
+                return _catch_refused(profiles.values_list('daily_catches', flat=True).get())
+
+            if caught:
+                # Collection counters are bumped by the UserPokemon signal
+                UserPokemon.objects.create(**_caught_pokemon(user, wild_pokemon, wild_level))
+
+            result = profiles.values_list(*CATCH_RESULT_FIELDS).get()
+
+            if caught:
+                # Check for level up; the level filter stops a concurrent catch
+                # from paying out the same levels twice
+                result, updates = _level_up(result)
+                if updates:
+                    leveled_up = bool(profiles.filter(level__lt=result[2]).update(**updates))
+    except Exception:
+        # Nothing was recorded, so the encounter can be thrown at again
+        release_encounter(nonce)
+        raise
+
+    if not caught:
+        release_encounter(nonce)
+    return _catch_response(wild_pokemon, wild_level, caught, balls_used, result, leveled_up)
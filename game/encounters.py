@@ -0,0 +1,150 @@
+"""
+Wild encounter generation for the map.
+
+Species are drawn with Vose's alias method, so a draw is two random numbers
+and two list lookups no matter how many species or how large the rarity
+weights are.
+
+Encounters are not stored server-side: they are handed to the client as
+signed tokens and checked again when a ball is thrown.
+"""
+import random
+import secrets
+
+from django.core import signing
+from django.core.cache import cache
+
+# Relative encounter weight for each rarity tier
+RARITY_WEIGHTS = {
+    'common': 50,
+    'rare': 25,
+    'epic': 15,
+    'legendary': 5,
+    'ultrabeast': 1,
+    'mythical': 1,
+}
+
+# Wild Pokemon never appear above this level
+MAX_WILD_LEVEL = 50
+
+# Each level the wild Pokemon has over the trainer cuts the catch chance by
+# this fraction, down to a floor
+CATCH_LEVEL_PENALTY = 0.05
+MIN_LEVEL_MODIFIER = 0.1
+
+# Encounters can be caught for this many seconds after they are rolled
+ENCOUNTER_MAX_AGE = 300
+
+ENCOUNTER_SALT = 'game.encounter'
+ENCOUNTER_NONCE_KEY = 'game:encounter-nonce:{}'
+
+class EncounterSampler:
+    """Weighted sampler over a fixed list of species (Vose alias table)"""
+
+    def __init__(self, species, weights=None):
+        weights = RARITY_WEIGHTS if weights is None else weights
+        self.species = tuple(species)
+        n = len(self.species)
+        self.prob = [0.0] * n
+        self.alias = [0] * n
+        if not n:
+            return
+
+        scaled = [weights.get(s.rarity, 1) for s in self.species]
+        total = sum(scaled)
+        scaled = [w * n / total for w in scaled]
+
+        small = [i for i, w in enumerate(scaled) if w < 1.0]
+        large = [i for i, w in enumerate(scaled) if w >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+
+        # Whatever is left over is 1.0 up to floating point error
+        for i in large + small:
+            self.prob[i] = 1.0
+
+    def __len__(self):
+        return len(self.species)
+
+    def draw(self, rng=random):
+        """Pick one species; O(1) and allocation free"""
+        i = rng.randrange(len(self.species))
+        if rng.random() < self.prob[i]:
+            return self.species[i]
+        return self.species[self.alias[i]]
+
+def roll_wild_level(trainer_level, rng=random):
+    """Pick a wild level scaled to the trainer"""
+    return rng.randint(1, min(trainer_level + 5, MAX_WILD_LEVEL))
+
+def catch_chance(catch_rate, wild_level, trainer_level):
+    """Probability that a single Pokeball catches the wild Pokemon"""
+    level_modifier = max(MIN_LEVEL_MODIFIER, 1 - (wild_level - trainer_level) * CATCH_LEVEL_PENALTY)
+    return (catch_rate / 255) * level_modifier
+
+def _encounter_salt(trainer_id):
+    # Tokens are only valid for the trainer they were rolled for
+    return f'{ENCOUNTER_SALT}:{trainer_id}'
+
+def sign_encounter(trainer_id, species_id, level):
+    """
+    Encode an encounter as a short-lived, tamper-proof token.
+
+    The token carries a random nonce so each encounter can be caught at
+    most once; the timestamp is added by the signer.
+    """
+    nonce = secrets.token_urlsafe(6)
+    return signing.dumps([species_id, level, nonce], salt=_encounter_salt(trainer_id), compress=True)
+
+def load_encounter(trainer_id, token):
+    """
+    Decode a token from sign_encounter() into (species_id, level, nonce).
+
+    Raises signing.SignatureExpired for stale encounters and
+    signing.BadSignature for anything that was not issued by us.
+    """
+    payload = signing.loads(token, salt=_encounter_salt(trainer_id), max_age=ENCOUNTER_MAX_AGE)
+    try:
+        species_id, level, nonce = payload
+    except (TypeError, ValueError):
+        raise signing.BadSignature('Malformed encounter')
+    return species_id, level, nonce
+
+def claim_encounter(nonce):
+    """
+    Reserve an encounter for a catch attempt.
+
+    Returns False if the encounter was already caught or another throw at it
+    is in flight. Used nonces only need to be remembered until the token
+    would have expired anyway, which keeps the set small.
+    """
+    return cache.add(ENCOUNTER_NONCE_KEY.format(nonce), True, ENCOUNTER_MAX_AGE)
+
+def release_encounter(nonce):
+    """Give an encounter back after a failed throw so it can be retried"""
+    cache.delete(ENCOUNTER_NONCE_KEY.format(nonce))
+
+async def aclaim_encounter(nonce):
+    return await cache.aadd(ENCOUNTER_NONCE_KEY.format(nonce), True, ENCOUNTER_MAX_AGE)
+
+def roll_throws(chance, throws, rng=random):
+    """
+    Throw up to `throws` balls, stopping at the first catch.
+
+    Each throw is rolled exactly as a separate request would roll it.
+    Returns (caught, balls_used).
+    """
+    caught = False
+    balls_used = 0
+    while balls_used < throws and not caught:
+        balls_used += 1
+        caught = rng.random() < chance
+    return caught, balls_used
@@ -0,0 +1,132 @@
+"""
+Evolution chains, precomputed from PokemonSpecies.evolves_from.
+
+The graph is built once per species catalog snapshot (see
+SpeciesCatalog.evolution), so it is rebuilt exactly when the catalog is,
+and lookups never touch the database.
+"""
+from collections import Counter, defaultdict
+from functools import reduce
+from itertools import groupby
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .catalog import get_species_catalog
+from .models import UserPokemon, UserProfile
+
+class EvolutionGraph:
+    """Next stage, chain root, depth and full chain of every species"""
+
+    def __init__(self, species):
+        species = list(species)
+        by_id = {s.id: s for s in species}
+
+        children = defaultdict(list)
+        for s in species:
+            if s.evolves_from_id in by_id:
+                children[s.evolves_from_id].append(s)
+
+        # Species.evolutions.first() order: the lowest Pokedex number
+        self._next = {
+            parent_id: min(evolutions, key=lambda s: s.pokedex_id)
+            for parent_id, evolutions in children.items()
+        }
+
+        self._root = {}
+        self._depth = {}
+        for s in species:
+            stage, depth, seen = s, 0, {s.id}
+            while stage.evolves_from_id in by_id and stage.evolves_from_id not in seen:
+                stage = by_id[stage.evolves_from_id]
+                seen.add(stage.id)
+                depth += 1
+            self._root[s.id] = stage
+            self._depth[s.id] = depth
+
+        self._by_id = by_id
+
+    def next_stage(self, species_id):
+        """The species `species_id` evolves into, or None"""
+        return self._next.get(species_id)
+
+    def root(self, species_id):
+        """The first stage of `species_id`'s chain"""
+        return self._root.get(species_id)
+
+    def depth(self, species_id):
+        """0 for a first stage, 1 for its evolution, and so on"""
+        return self._depth.get(species_id, 0)
+
+    def chain(self, species_id):
+        """Every stage from the root through `species_id` to its last evolution"""
+        stages = []
+        stage = self._by_id.get(species_id)
+        while stage is not None and stage not in stages:
+            stages.append(stage)
+            stage = self._by_id.get(stage.evolves_from_id)
+        stages.reverse()
+
+        stage = self.next_stage(species_id)
+        while stage is not None and stage not in stages:
+            stages.append(stage)
+            stage = self.next_stage(stage.id)
+        return tuple(stages)
+
+    def evolvable(self):
+        """(species, next stage) for every species that can evolve by level, deepest first"""
+        pairs = [
+            (self._by_id[species_id], evolution)
+            for species_id, evolution in self._next.items()
+            if self._by_id[species_id].evolution_level
+        ]
+        pairs.sort(key=lambda pair: -self.depth(pair[0].id))
+        return pairs
+
+def evolve_all(pokemon):
+    """
+    Evolve every Pokemon in the `pokemon` queryset that has reached its
+    species' evolution level, by one stage, like UserPokemon.evolve().
+
+    Runs one UPDATE per evolution depth, deepest first so nothing evolves
+    twice: Case/When picks each row's next species and stats from its
+    current species. A grouped count per depth, taken before its UPDATE,
+    gives the collection counter changes, applied once per trainer.
+    Returns the number of Pokemon evolved.
+    """
+    graph = get_species_catalog().evolution
+    evolved = 0
+    rarities = defaultdict(Counter)
+    with transaction.atomic():
+        for _, pairs in groupby(graph.evolvable(), key=lambda pair: graph.depth(pair[0].id)):
+            pairs = list(pairs)
+            stage = pokemon.filter(reduce(or_, (
+                Q(species_id=species.id, level__gte=species.evolution_level) for species, _ in pairs
+            )))
+            counts = stage.order_by().values_list('owner_id', 'species_id').annotate(n=Count('id'))
+            if not counts:
+                continue
+
+            evolution_of = {species.id: (species, evolution) for species, evolution in pairs}
+            for owner_id, species_id, count in counts:
+                species, evolution = evolution_of[species_id]
+                if evolution.rarity != species.rarity:
+                    rarities[owner_id][species.rarity] -= count
+                    rarities[owner_id][evolution.rarity] += count
+
+            # Every When reads the row as it was before this UPDATE
+            updates = {'species_id': [], **{field: [] for field in UserPokemon.STAT_FIELDS}}
+            for species, evolution in pairs:
+                updates['species_id'].append(When(species_id=species.id, then=Value(evolution.id)))
+                for field, value in UserPokemon.stat_updates(evolution).items():
+                    updates[field].append(When(species_id=species.id, then=value))
+            evolved += stage.update(
+                updated_at=timezone.now(),
+                **{field: Case(*whens, output_field=IntegerField()) for field, whens in updates.items()},
+            )
+
+        for owner_id, changes in rarities.items():
+            UserProfile.update_collection_counts(owner_id, rarities=changes)
+    return evolved
@@ -0,0 +1,88 @@
+"""
+Streaming export of UserPokemon collections.
+
+Rows are read with values_list() (species joined in the same query) through
+a chunked iterator, which is a server-side cursor on PostgreSQL, and encoded
+a batch at a time. Nothing holds more than one chunk of the collection, so
+memory stays flat however many Pokemon are exported.
+"""
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+# (column name, UserPokemon lookup), in export order
+EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('pokedex_id', 'species__pokedex_id'),
+    ('species', 'species__name'),
+    ('nickname', 'nickname'),
+    ('level', 'level'),
+    ('experience', 'experience'),
+    ('type1', 'species__type1'),
+    ('type2', 'species__type2'),
+    ('rarity', 'species__rarity'),
+    ('is_shiny', 'is_shiny'),
+    ('is_favorite', 'is_favorite'),
+    ('iv_hp', 'iv_hp'),
+    ('iv_attack', 'iv_attack'),
+    ('iv_defense', 'iv_defense'),
+    ('iv_sp_attack', 'iv_sp_attack'),
+    ('iv_sp_defense', 'iv_sp_defense'),
+    ('iv_speed', 'iv_speed'),
+    ('iv_total', 'iv_total'),
+    ('current_hp', 'current_hp'),
+    ('max_hp', 'max_hp'),
+    ('attack', 'attack_stat'),
+    ('defense', 'defense_stat'),
+    ('sp_attack', 'sp_attack_stat'),
+    ('sp_defense', 'sp_defense_stat'),
+    ('speed', 'speed_stat'),
+    ('total_stats', 'total_stats'),
+    ('battles_won', 'battles_won'),
+    ('battles_lost', 'battles_lost'),
+    ('caught_at', 'caught_at'),
+)
+
+# Rows fetched per database round trip, and encoded per yielded chunk
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_BATCH_SIZE = 500
+
+def export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield one tuple per Pokemon, in EXPORT_COLUMNS order"""
+    rows = queryset.order_by('id').values_list(*(lookup for _, lookup in EXPORT_COLUMNS))
+    return rows.iterator(chunk_size=chunk_size)
+
+def _batched(lines, size=EXPORT_BATCH_SIZE):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+def ndjson_chunks(rows):
+    """One JSON object per line"""
+    names = [name for name, _ in EXPORT_COLUMNS]
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    return _batched(encoder.encode(dict(zip(names, row))) + '\n' for row in rows)
+
+class _Echo:
+    """A csv.writer target that hands each formatted line straight back"""
+
+    def write(self, value):
+        return value
+
+def csv_chunks(rows):
+    """A header line, then one CSV line per row"""
+    writer = csv.writer(_Echo())
+    header = writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    yield header
+    yield from _batched(writer.writerow(row) for row in rows)
+
+# format -> (encoder, content type, file extension)
+EXPORT_FORMATS = {
+    'ndjson': (ndjson_chunks, 'application/x-ndjson', 'ndjson'),
+    'csv': (csv_chunks, 'text/csv', 'csv'),
+}
@@ -0,0 +1,60 @@
+"""
+Trainer leveling.
+
+UserProfile.experience is the trainer's lifetime total and never goes
+down. Levels come from a precomputed table of the total experience each
+level needs, so any grant, however large, resolves with one bisect
+instead of a loop over the levels it crosses. Level-up rewards are
+tabulated the same way, as running totals, so the reward for jumping
+from one level to another is a subtraction.
+
+Nothing here touches the ORM; callers apply the result with F() updates
+or on a loaded profile.
+"""
+from bisect import bisect_right
+
+TRAINER_MAX_LEVEL = 100
+
+# Going from level L to L + 1 takes L * LEVEL_EXP_STEP experience
+LEVEL_EXP_STEP = 1000
+
+# Rewards for reaching each level: coins per level reached, and balls
+LEVEL_UP_COINS_PER_LEVEL = 100
+LEVEL_UP_POKEBALLS = 5
+
+# LEVEL_THRESHOLDS[L - 1] is the total experience level L needs
+LEVEL_THRESHOLDS = tuple(
+    LEVEL_EXP_STEP * level * (level - 1) // 2 for level in range(1, TRAINER_MAX_LEVEL + 1)
+)
+
+# _REWARD_COINS[L - 1] is every coin earned on the way to level L
+_REWARD_COINS = tuple(
+    LEVEL_UP_COINS_PER_LEVEL * (level * (level + 1) // 2 - 1) for level in range(1, TRAINER_MAX_LEVEL + 1)
+)
+
+def level_for(experience):
+    """The level `experience` total experience reaches"""
+    return max(1, bisect_right(LEVEL_THRESHOLDS, experience))
+
+def level_up(level, experience):
+    """
+    (new level, coins, pokeballs) for a trainer at `level` who now has
+    `experience` in total. A trainer never loses a level, and the rewards
+    cover every level crossed.
+    """
+    new_level = max(level, level_for(experience))
+    if new_level == level:
+        return level, 0, 0
+    coins = _REWARD_COINS[new_level - 1] - _REWARD_COINS[level - 1]
+    return new_level, coins, (new_level - level) * LEVEL_UP_POKEBALLS
+
+def level_progress(level, experience):
+    """
+    (experience into `level`, experience the level takes) for progress
+    bars; the second is 0 at TRAINER_MAX_LEVEL.
+    """
+    if level >= TRAINER_MAX_LEVEL:
+        return 0, 0
+    start = LEVEL_THRESHOLDS[level - 1]
+    span = LEVEL_THRESHOLDS[level] - start
+    return min(max(experience - start, 0), span), span
@@ -0,0 +1,31 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from game.archive import ARCHIVE_BATCH_SIZE, archive_battles
+
+class Command(BaseCommand):
+    help = 'Move finished battles older than the retention window into the compressed battle archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='Keep finished battles from the last this many days in the Battle table')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE,
+                            help='Battles moved per transaction')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches, to leave room for live traffic')
+
+    def handle(self, *args, **options):
+        total_battles = total_events = total_bytes = 0
+        for battles, events, log_bytes in archive_battles(timedelta(days=options['days']), options['batch_size']):
+            total_battles += battles
+            total_events += events
+            total_bytes += log_bytes
+            self.stdout.write(f'Archived {total_battles} battles so far')
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {total_battles} battles ({total_events} log events, '
+            f'{total_bytes / 1024:.1f} KiB compressed)'
+        ))
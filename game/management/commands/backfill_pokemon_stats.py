@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from game.models import UserPokemon
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the stored stat columns of every UserPokemon in SQL, e.g. after '
+        'bulk-editing levels, IVs or species outside the ORM'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows per UPDATE (by id range)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = UserPokemon.objects.aggregate(last=Max('id'))['last'] or 0
+        updates = UserPokemon.stat_updates()
+
+        updated = 0
+        for start in range(0, last_id, batch_size):
+            updated += UserPokemon.objects.filter(id__gt=start, id__lte=start + batch_size).update(**updates)
+
+        self.stdout.write(self.style.SUCCESS(f'Recomputed stats for {updated} Pokemon'))
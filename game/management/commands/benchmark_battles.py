@@ -0,0 +1,40 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from game.engine import BattleState, Combatant, resolve_turn
+
+class Command(BaseCommand):
+    help = 'Time game.engine turn resolution on synthetic battles, with no database access'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--battles', type=int, default=100000,
+                            help='Battles to play to completion')
+        parser.add_argument('--level', type=int, default=25,
+                            help='Level of both combatants')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        level = options['level']
+        base = (80, 82, 83, 100, 100, 80)
+
+        outcomes = {'won': 0, 'lost': 0}
+        turns = 0
+        start = time.perf_counter()
+        for _ in range(options['battles']):
+            state = BattleState(
+                Combatant.from_stats('Player', level, ('normal',), base, (15,) * 6),
+                Combatant.from_stats('Opponent', level, ('normal',), base),
+            )
+            while state.ongoing:
+                resolve_turn(state, 'attack', rng)
+            outcomes[state.status] += 1
+            turns += state.turn
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f'{options["battles"]} battles, {turns} turns in {elapsed:.2f}s '
+            f'(won {outcomes["won"]}, lost {outcomes["lost"]})'
+        )
+        self.stdout.write(self.style.SUCCESS(f'{elapsed / max(1, turns) * 1e6:.2f} us/turn'))
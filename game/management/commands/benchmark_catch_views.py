@@ -0,0 +1,102 @@
+import asyncio
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncRequestFactory, RequestFactory
+from django.utils import timezone
+from game import async_views, views
+from game.models import UserProfile
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests/sec of the sync (WSGI) and async (ASGI) encounter and catch views '
+        'at the same concurrency. Views are called in-process, so HTTP parsing and the '
+        'server itself are left out; use a real server and load generator for end-to-end numbers.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000,
+                            help='Encounter + catch request pairs per path')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Sync worker threads, and concurrent requests on the event loop')
+        parser.add_argument('--path', choices=['both', 'sync', 'async'], default='both')
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(username=f'benchmark-{uuid.uuid4().hex[:12]}')
+        # A throwaway trainer that can't run out of balls or daily catches
+        UserProfile.objects.filter(user=user).update(
+            pokeballs=10 ** 9, daily_catches=-10 ** 9, last_catch_reset=timezone.now().date()
+        )
+
+        try:
+            results = {}
+            if options['path'] in ('both', 'sync'):
+                results['WSGI (sync)'] = self.run_sync(user, options)
+            if options['path'] in ('both', 'async'):
+                results['ASGI (async)'] = asyncio.run(self.run_async(user, options))
+        finally:
+            user.delete()
+
+        pairs = options['requests']
+        for name, elapsed in results.items():
+            self.stdout.write(
+                f'{name:<14} {2 * pairs / elapsed:10.1f} req/s '
+                f'({pairs} encounter+catch pairs, {options["workers"]} concurrent)'
+            )
+        if len(results) == 2:
+            sync_time, async_time = results.values()
+            self.stdout.write(self.style.SUCCESS(f'Async/sync throughput: {sync_time / async_time:.2f}x'))
+
+    def run_sync(self, user, options):
+        factory = RequestFactory()
+
+        def post(view, path, data):
+            request = factory.post(path, json.dumps(data), content_type='application/json')
+            request.user = user
+            return json.loads(view(request).content)
+
+        remaining = iter(range(options['requests']))
+
+        def worker():
+            try:
+                for _ in remaining:
+                    encounter = post(views.encounter_pokemon, '/catch/encounter/', {})
+                    post(views.attempt_catch, '/catch/attempt/',
+                         {'encounter': encounter['pokemon']['token']})
+            finally:
+                connections.close_all()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['workers']) as pool:
+            for future in [pool.submit(worker) for _ in range(options['workers'])]:
+                future.result()
+        return time.perf_counter() - start
+
+    async def run_async(self, user, options):
+        factory = AsyncRequestFactory()
+
+        async def auser():
+            return user
+
+        async def post(view, path, data):
+            request = factory.post(path, json.dumps(data), content_type='application/json')
+            request.user = user
+            request.auser = auser
+            return json.loads((await view(request)).content)
+
+        remaining = iter(range(options['requests']))
+
+        async def worker():
+            for _ in remaining:
+                encounter = await post(async_views.encounter_pokemon, '/catch/encounter/', {})
+                await post(async_views.attempt_catch, '/catch/attempt/',
+                           {'encounter': encounter['pokemon']['token']})
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(options['workers'])))
+        return time.perf_counter() - start
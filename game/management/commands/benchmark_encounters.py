@@ -0,0 +1,57 @@
+import random
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from game.encounters import EncounterSampler, RARITY_WEIGHTS
+from game.models import PokemonSpecies
+
+class Command(BaseCommand):
+    help = 'Compare the alias-table encounter sampler with the old expanded weighted list'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--draws', type=int, default=10000,
+                            help='Encounters to generate per approach')
+        parser.add_argument('--species', type=int, default=0,
+                            help='Use N synthetic species instead of the database catalog')
+
+    def handle(self, *args, **options):
+        draws = options['draws']
+
+        if options['species']:
+            rarities = list(RARITY_WEIGHTS)
+            species = [
+                SimpleNamespace(id=i, rarity=rarities[i % len(rarities)])
+                for i in range(options['species'])
+            ]
+        else:
+            species = list(PokemonSpecies.objects.all())
+        if not species:
+            self.stdout.write(self.style.ERROR('No species to sample from'))
+            return
+
+        self.stdout.write(f'{len(species)} species, {draws} draws each')
+
+        # Old path: rebuild the expanded list on every encounter
+        start = time.perf_counter()
+        for _ in range(draws):
+            weighted_species = []
+            for s in species:
+                weighted_species.extend([s] * RARITY_WEIGHTS.get(s.rarity, 1))
+            random.choice(weighted_species)
+        expanded = time.perf_counter() - start
+
+        # New path: build the table once, then draw
+        start = time.perf_counter()
+        sampler = EncounterSampler(species)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(draws):
+            sampler.draw()
+        alias = time.perf_counter() - start
+
+        self.stdout.write(f'Expanded list:  {expanded / draws * 1e6:10.2f} us/draw')
+        self.stdout.write(f'Alias table:    {alias / draws * 1e6:10.2f} us/draw '
+                          f'(one-off build {build * 1e3:.2f} ms)')
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {expanded / alias:.1f}x'))
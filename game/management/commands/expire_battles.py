@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from game.battle_state import expire_stale_battles
+
+class Command(BaseCommand):
+    help = 'Close abandoned wild battles and write their cached state back to the database'
+
+    def handle(self, *args, **options):
+        closed = expire_stale_battles()
+        self.stdout.write(self.style.SUCCESS(f'Closed {closed} abandoned battles'))
@@ -0,0 +1,54 @@
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from game.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_rows
+from game.models import UserPokemon
+
+class Command(BaseCommand):
+    help = (
+        "Stream one trainer's collection, or every collection, as NDJSON or CSV and "
+        'report throughput in rows/sec on stderr'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to export (default: every trainer)')
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--output', default='-',
+                            help="File to write, '-' for stdout, or 'null' to only measure throughput")
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+                            help='Rows fetched per database round trip')
+
+    def handle(self, *args, **options):
+        pokemon = UserPokemon.objects.all()
+        if options['user']:
+            try:
+                pokemon = pokemon.filter(owner=User.objects.get(username=options['user']))
+            except User.DoesNotExist:
+                raise CommandError(f'No user named {options["user"]!r}')
+
+        rows = 0
+
+        def counted(iterable):
+            nonlocal rows
+            for rows, row in enumerate(iterable, 1):
+                yield row
+
+        encode = EXPORT_FORMATS[options['format']][0]
+        chunks = encode(counted(export_rows(pokemon, options['chunk_size'])))
+
+        start = time.perf_counter()
+        if options['output'] == 'null':
+            for _ in chunks:
+                pass
+        elif options['output'] == '-':
+            sys.stdout.writelines(chunks)
+        else:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                f.writelines(chunks)
+        elapsed = time.perf_counter() - start
+
+        self.stderr.write(self.style.SUCCESS(
+            f'Exported {rows} Pokemon in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:,.0f} rows/sec)'
+        ))
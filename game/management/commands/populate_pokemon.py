@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from game.models import PokemonSpecies, Item
+from game.catalog import invalidate_catalog
 
 class Command(BaseCommand):
     help = 'Populate database with initial Pokemon and items'
@@ -276,37 +277,23 @@ class Command(BaseCommand):
                 created_count += 1
                 self.stdout.write(f'Created {pokemon.name}')
 
-        # Set up evolution chains
-        try:
-            bulbasaur = PokemonSpecies.objects.get(pokedex_id=1)
-            ivysaur = PokemonSpecies.objects.get(pokedex_id=2)
-            venusaur = PokemonSpecies.objects.get(pokedex_id=3)
-
-            ivysaur.evolves_from = bulbasaur
-            ivysaur.save()
-            venusaur.evolves_from = ivysaur
-            venusaur.save()
-
-            charmander = PokemonSpecies.objects.get(pokedex_id=4)
-            charmeleon = PokemonSpecies.objects.get(pokedex_id=5)
-            charizard = PokemonSpecies.objects.get(pokedex_id=6)
-
-            charmeleon.evolves_from = charmander
-            charmeleon.save()
-            charizard.evolves_from = charmeleon
-            charizard.save()
-
-            squirtle = PokemonSpecies.objects.get(pokedex_id=7)
-            wartortle = PokemonSpecies.objects.get(pokedex_id=8)
-            blastoise = PokemonSpecies.objects.get(pokedex_id=9)
-
-            wartortle.evolves_from = squirtle
-            wartortle.save()
-            blastoise.evolves_from = wartortle
-            blastoise.save()
-
-        except PokemonSpecies.DoesNotExist:
-            pass
+        # Set up evolution chains: pokedex_id -> the pokedex_id it evolves from
+        evolves_from = {2: 1, 3: 2, 5: 4, 6: 5, 8: 7, 9: 8}
+        by_pokedex_id = PokemonSpecies.objects.in_bulk(
+            set(evolves_from) | set(evolves_from.values()), field_name='pokedex_id'
+        )
+        changed = []
+        for pokedex_id, parent_pokedex_id in evolves_from.items():
+            species = by_pokedex_id.get(pokedex_id)
+            parent = by_pokedex_id.get(parent_pokedex_id)
+            if species and parent and species.evolves_from_id != parent.id:
+                species.evolves_from = parent
+                changed.append(species)
+        if changed:
+            PokemonSpecies.objects.bulk_update(changed, ['evolves_from'])
+            # bulk_update() sends no post_save, so refresh the cached catalog
+            # (and its evolution graph) here
+            invalidate_catalog()
 
         self.stdout.write(f'Created {created_count} new Pokemon species')
 
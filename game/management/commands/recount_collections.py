@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+from game.models import RARITY_CHOICES, UserPokemon, UserProfile
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized collection counters on every UserProfile and fix any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Profiles to recount per batch')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drift without writing anything')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = ['pokemon_count', 'shiny_count'] + [
+            UserProfile.rarity_count_field(rarity) for rarity, _ in RARITY_CHOICES
+        ]
+        annotations = {
+            'pokemon_count': Count('id'),
+            'shiny_count': Count('id', filter=Q(is_shiny=True)),
+        }
+        for rarity, _ in RARITY_CHOICES:
+            annotations[UserProfile.rarity_count_field(rarity)] = Count(
+                'id', filter=Q(species__rarity=rarity)
+            )
+
+        checked = repaired = 0
+        profiles = UserProfile.objects.only('id', 'user_id', *fields).order_by('id')
+        last_id = 0
+        while True:
+            batch = list(profiles.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            actual = {
+                row.pop('owner_id'): row
+                for row in UserPokemon.objects.filter(
+                    owner_id__in=[p.user_id for p in batch]
+                ).values('owner_id').annotate(**annotations)
+            }
+
+            drifted = []
+            for profile in batch:
+                counts = actual.get(profile.user_id, {})
+                changed = False
+                for field in fields:
+                    value = counts.get(field, 0)
+                    if getattr(profile, field) != value:
+                        setattr(profile, field, value)
+                        changed = True
+                if changed:
+                    drifted.append(profile)
+
+            if drifted and not options['dry_run']:
+                UserProfile.objects.bulk_update(drifted, fields)
+
+            checked += len(batch)
+            repaired += len(drifted)
+
+        verb = 'would be repaired' if options['dry_run'] else 'repaired'
+        self.stdout.write(
+            self.style.SUCCESS(f'Checked {checked} profiles, {repaired} {verb}')
+        )
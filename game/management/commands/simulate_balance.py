@@ -0,0 +1,132 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from game.catalog import get_species_catalog
+from game.encounters import (
+    CATCH_LEVEL_PENALTY, MAX_WILD_LEVEL, MIN_LEVEL_MODIFIER, RARITY_WEIGHTS
+)
+
+class Command(BaseCommand):
+    help = 'Monte Carlo simulation of encounters and catches for balancing rarity weights and catch rates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trainers', type=int, default=250_000,
+                            help='Trainer-days to simulate')
+        parser.add_argument('--encounters', type=int, default=60,
+                            help='Encounters each trainer finds per day')
+        parser.add_argument('--balls', type=int, default=30,
+                            help='Pokeballs each trainer can spend per day')
+        parser.add_argument('--throws', type=int, default=1,
+                            help='Most balls thrown at a single encounter')
+        parser.add_argument('--level-min', type=int, default=1)
+        parser.add_argument('--level-max', type=int, default=50)
+        parser.add_argument('--ball-price', type=int, default=200,
+                            help='Shop price used to value spent Pokeballs')
+        parser.add_argument('--chunk', type=int, default=20_000,
+                            help='Trainers simulated per vectorized chunk')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--top', type=int, default=25,
+                            help='Species rows to print (0 for all)')
+
+    def handle(self, *args, **options):
+        catalog = get_species_catalog()
+        if not catalog:
+            raise CommandError('No Pokemon species available!')
+        if options['level_min'] > options['level_max']:
+            raise CommandError('--level-min must not exceed --level-max')
+
+        species = catalog.species
+        weights = np.array([RARITY_WEIGHTS.get(s.rarity, 1) for s in species], dtype=np.float64)
+        weights /= weights.sum()
+        catch_rates = np.array([s.catch_rate for s in species], dtype=np.float64)
+
+        rng = np.random.default_rng(options['seed'])
+        trainers = options['trainers']
+        daily_limit = settings.DAILY_CATCH_LIMIT
+
+        catches = np.zeros(len(species), dtype=np.int64)
+        encounters_seen = np.zeros(len(species), dtype=np.int64)
+        balls_spent = coins_earned = 0
+
+        start = time.perf_counter()
+        for offset in range(0, trainers, options['chunk']):
+            size = min(options['chunk'], trainers - offset)
+            seen, caught, balls, coins = self.simulate_chunk(
+                rng, size, options, weights, catch_rates, daily_limit
+            )
+            encounters_seen += seen
+            catches += caught
+            balls_spent += balls
+            coins_earned += coins
+        elapsed = time.perf_counter() - start
+
+        self.report(species, trainers, encounters_seen, catches,
+                    balls_spent, coins_earned, elapsed, options)
+
+    def simulate_chunk(self, rng, size, options, weights, catch_rates, daily_limit):
+        cumulative = np.cumsum(weights)
+        cumulative[-1] = 1.0
+        n_encounters = options['encounters']
+        shape = (size, n_encounters)
+
+        # One row per trainer-day, one column per encounter in order
+        trainer_level = rng.integers(options['level_min'], options['level_max'] + 1, size)[:, None]
+        species_idx = np.searchsorted(cumulative, rng.random(shape), side='right')
+        max_level = np.minimum(trainer_level + 5, MAX_WILD_LEVEL)
+        wild_level = 1 + np.floor(rng.random(shape) * max_level).astype(np.int64)
+
+        # Vectorized game.encounters.catch_chance
+        level_modifier = np.maximum(
+            MIN_LEVEL_MODIFIER, 1 - (wild_level - trainer_level) * CATCH_LEVEL_PENALTY
+        )
+        chance = np.clip(catch_rates[species_idx] / 255 * level_modifier, 1e-9, 1.0)
+
+        # Throws until the first success, capped at --throws balls
+        needed = rng.geometric(chance)
+        caught = needed <= options['throws']
+        balls = np.minimum(needed, options['throws'])
+
+        # Trainers stop once they run out of balls or hit the daily limit
+        balls_before = np.cumsum(balls, axis=1) - balls
+        catches_before = np.cumsum(caught, axis=1) - caught
+        active = (balls_before + balls <= options['balls']) & (catches_before < daily_limit)
+        caught &= active
+
+        seen = np.bincount(species_idx[active], minlength=len(weights))
+        caught_per_species = np.bincount(species_idx[caught], minlength=len(weights))
+        coins = int((wild_level[caught] * 5).sum())
+        return seen, caught_per_species, int(balls[active].sum()), coins
+
+    def report(self, species, trainers, seen, catches, balls, coins, elapsed, options):
+        per_day = catches / trainers
+        ball_cost = balls * options['ball_price']
+
+        self.stdout.write(
+            f'Simulated {trainers:,} trainer-days x {options["encounters"]} encounters '
+            f'in {elapsed:.2f}s'
+        )
+        self.stdout.write('')
+        self.stdout.write(f'{"Species":<16}{"Rarity":<12}{"Seen/day":>10}{"Caught/day":>12}{"Rate":>8}')
+
+        order = np.argsort(-per_day)
+        if options['top']:
+            order = order[:options['top']]
+        for i in order:
+            s = species[i]
+            rate = catches[i] / seen[i] if seen[i] else 0.0
+            self.stdout.write(
+                f'{s.name:<16}{s.rarity:<12}{seen[i] / trainers:>10.3f}'
+                f'{per_day[i]:>12.4f}{rate:>8.1%}'
+            )
+
+        self.stdout.write('')
+        self.stdout.write(f'Catches per trainer-day:   {catches.sum() / trainers:.3f}')
+        self.stdout.write(f'Pokeballs per trainer-day: {balls / trainers:.3f}')
+        self.stdout.write(f'Balls per catch:           {balls / max(1, catches.sum()):.3f}')
+        self.stdout.write(f'Coins earned per day:      {coins / trainers:.1f}')
+        self.stdout.write(f'Ball cost per day:         {ball_cost / trainers:.1f}')
+        self.stdout.write(
+            self.style.SUCCESS(f'Net coin flow per day:     {(coins - ball_cost) / trainers:+.1f}')
+        )
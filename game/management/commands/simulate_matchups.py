@@ -0,0 +1,116 @@
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from game import matchups
+from game.catalog import get_species_catalog
+from game.models import SpeciesMatchup
+
+class Command(BaseCommand):
+    help = 'Simulate every species-vs-species matchup over a level grid and store the win rates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--levels', default='5,25,50',
+                            help='Comma-separated levels to simulate')
+        parser.add_argument('--battles', type=int, default=20,
+                            help='Battles per matchup and level')
+        parser.add_argument('--max-turns', type=int, default=100,
+                            help='Turns before a battle counts as a draw')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes (1 runs in this process)')
+        parser.add_argument('--chunk', type=int, default=8,
+                            help='Species per work unit')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows per INSERT')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--species', type=int, default=0,
+                            help='Use N synthetic species instead of the catalog (implies --dry-run)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Simulate without writing the matchup table')
+
+    def handle(self, *args, **options):
+        try:
+            levels = sorted({int(level) for level in options['levels'].split(',')})
+        except ValueError:
+            raise CommandError('--levels must be comma-separated integers')
+        if not levels or not all(1 <= level <= 100 for level in levels):
+            raise CommandError('Levels must be between 1 and 100')
+
+        if options['species']:
+            ids, roster = self.synthetic_roster(options['species'], options['seed'])
+            options['dry_run'] = True
+        else:
+            catalog = get_species_catalog()
+            ids = [s.id for s in catalog]
+            roster = [
+                (s.name, (s.type1, s.type2) if s.type2 else (s.type1,),
+                 (s.base_hp, s.base_attack, s.base_defense,
+                  s.base_sp_attack, s.base_sp_defense, s.base_speed))
+                for s in catalog
+            ]
+        if len(roster) < 2:
+            raise CommandError('Need at least two species to simulate matchups')
+
+        chunk = max(1, options['chunk'])
+        tasks = [
+            (n, start, min(start + chunk, len(roster)))
+            for n, start in enumerate(range(0, len(roster), chunk))
+        ]
+        init_args = (roster, levels, options['battles'], options['max_turns'], options['seed'])
+
+        self.stdout.write(
+            f'{len(roster)} species x {len(levels)} levels x {options["battles"]} battles, '
+            f'{len(tasks)} chunks on {options["workers"]} workers'
+        )
+
+        start = time.perf_counter()
+        if options['workers'] > 1:
+            with ProcessPoolExecutor(options['workers'], initializer=matchups.init_worker,
+                                     initargs=init_args) as pool:
+                rows = self.collect(pool.map(matchups.simulate_chunk, tasks))
+        else:
+            matchups.init_worker(*init_args)
+            rows = self.collect(map(matchups.simulate_chunk, tasks))
+        elapsed = time.perf_counter() - start
+
+        # Only the swap itself holds the write lock (all of SQLite's), not
+        # the simulation
+        if not options['dry_run']:
+            with transaction.atomic():
+                SpeciesMatchup.objects.filter(level__in=levels).delete()
+                self.write(rows, ids, options)
+
+        duels = len(rows) * options['battles']
+        verb = 'simulated' if options['dry_run'] else 'written'
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(rows)} matchups {verb} ({duels} battles) in {elapsed:.1f}s, '
+            f'{duels / elapsed:,.0f} battles/s'
+        ))
+
+    def collect(self, results):
+        """Every chunk's (i, j, level, wins, draws) rows, as plain tuples"""
+        rows = []
+        for chunk_rows in results:
+            rows.extend(chunk_rows)
+        return rows
+
+    def write(self, rows, ids, options):
+        """Insert the matchup rows in batches"""
+        batch_size = options['batch_size']
+        for start in range(0, len(rows), batch_size):
+            SpeciesMatchup.objects.bulk_create([
+                SpeciesMatchup(species_id=ids[i], opponent_id=ids[j], level=level,
+                               battles=options['battles'], wins=wins, draws=draws)
+                for i, j, level, wins, draws in rows[start:start + batch_size]
+            ])
+
+    def synthetic_roster(self, count, seed):
+        rng = random.Random(seed)
+        roster = [
+            (f'Species {n}', ('normal',), tuple(rng.randint(20, 150) for _ in range(6)))
+            for n in range(count)
+        ]
+        return list(range(count)), roster
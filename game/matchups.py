@@ -0,0 +1,110 @@
+"""
+Worker side of the offline species matchup simulator.
+
+This module only imports game.engine and game.typechart, so process-pool
+workers can load it without setting up Django. The roster is sent to each
+worker once, by the pool initializer; after that a task is just a range of
+species indexes, and the result is a compact list of
+(species, opponent, level, wins, draws) tuples keyed by roster index.
+
+Battles are played in lockstep with NumPy: one species against the whole
+roster, every repetition at once, using the same damage formula and
+turn order as game.engine.duel().
+"""
+import numpy as np
+
+from .engine import Combatant
+from .typechart import MIN_ROLL, damage, matchup_matrix, type_ids
+
+_roster = None
+_options = None
+_multipliers = None
+_stats = {}
+
+def init_worker(roster, levels, battles, max_turns, seed):
+    """
+    Pool initializer.
+
+    `roster` is a list of (name, types, base_stats) tuples, one per species.
+    """
+    global _roster, _options, _multipliers
+    _roster = roster
+    _options = (tuple(levels), battles, max_turns, seed)
+    ids = [type_ids(*types) for _, types, _ in roster]
+    _multipliers = matchup_matrix([t[0] for t in ids], [t[1] for t in ids])
+    _stats.clear()
+
+def _at_level(level):
+    """Roster stats at `level`, one array per stat"""
+    stats = _stats.get(level)
+    if stats is None:
+        combatants = [Combatant.from_stats(name, level, types, base) for name, types, base in _roster]
+        stats = _stats[level] = {
+            field: np.array([getattr(c, field) for c in combatants], dtype=np.int64)
+            for field in ('hp', 'attack', 'defense', 'sp_attack', 'sp_defense', 'speed')
+        }
+        # Same choice as Combatant.offense()
+        stats['physical'] = stats['attack'] >= stats['sp_attack']
+        stats['offense'] = np.maximum(stats['attack'], stats['sp_attack'])
+    return stats
+
+def duel_row(i, level, rng, battles, max_turns):
+    """
+    Species i against every species, `battles` times each.
+
+    Returns (wins, draws) arrays indexed by opponent.
+    """
+    s = _at_level(level)
+    shape = (battles, len(s['hp']))
+
+    # i attacking everyone, and everyone attacking i
+    defense_vs_i = np.where(s['physical'][i], s['defense'], s['sp_defense'])
+    defense_of_i = np.where(s['physical'], s['defense'][i], s['sp_defense'][i])
+    i_first = s['speed'][i] >= s['speed']
+
+    hp_i = np.full(shape, s['hp'][i], dtype=np.float64)
+    hp_other = np.broadcast_to(s['hp'], shape).astype(np.float64)
+    outcome = np.zeros(shape, dtype=np.int8)
+    active = np.ones(shape, dtype=bool)
+
+    def settle():
+        won = active & (hp_other <= 0)
+        lost = active & (hp_i <= 0)
+        outcome[won] = 1
+        outcome[lost] = -1
+        active[won | lost] = False
+
+    for _ in range(max_turns):
+        if not active.any():
+            break
+        dealt = damage(level, s['offense'][i], defense_vs_i, _multipliers[i],
+                       rng.uniform(MIN_ROLL, 1.0, shape))
+        taken = damage(level, s['offense'], defense_of_i, _multipliers[:, i],
+                       rng.uniform(MIN_ROLL, 1.0, shape))
+
+        # Faster side strikes first, then the other side if still standing
+        hp_other -= np.where(active & i_first, dealt, 0)
+        hp_i -= np.where(active & ~i_first, taken, 0)
+        settle()
+        hp_other -= np.where(active & ~i_first, dealt, 0)
+        hp_i -= np.where(active & i_first, taken, 0)
+        settle()
+
+    return (outcome == 1).sum(axis=0), (outcome == 0).sum(axis=0)
+
+def simulate_chunk(task):
+    """Play every matchup for species indexes start..stop against the whole roster"""
+    chunk, start, stop = task
+    levels, battles, max_turns, seed = _options
+    # Seed per chunk so results do not depend on how chunks land on workers
+    rng = np.random.default_rng(None if seed is None else [seed, chunk])
+
+    rows = []
+    for level in levels:
+        for i in range(start, stop):
+            wins, draws = duel_row(i, level, rng, battles, max_turns)
+            rows.extend(
+                (i, j, level, int(wins[j]), int(draws[j]))
+                for j in range(len(wins)) if j != i
+            )
+    return rows
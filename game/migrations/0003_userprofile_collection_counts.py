@@ -0,0 +1,74 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:32
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+RARITIES = ['common', 'rare', 'epic', 'legendary', 'mythical', 'ultrabeast']
+
+
+def backfill_collection_counts(apps, schema_editor):
+    UserPokemon = apps.get_model('game', 'UserPokemon')
+    UserProfile = apps.get_model('game', 'UserProfile')
+
+    counts = UserPokemon.objects.values('owner_id').annotate(
+        pokemon_count=Count('id'),
+        shiny_count=Count('id', filter=Q(is_shiny=True)),
+        **{
+            f'{rarity}_count': Count('id', filter=Q(species__rarity=rarity))
+            for rarity in RARITIES
+        }
+    )
+    for row in counts:
+        owner_id = row.pop('owner_id')
+        UserProfile.objects.filter(user_id=owner_id).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0002_alter_pokemonspecies_rarity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='common_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='epic_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='legendary_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='mythical_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='pokemon_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='rare_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='shiny_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='ultrabeast_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_collection_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0003_userprofile_collection_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='battle',
+            name='event_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='BattleEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.IntegerField()),
+                ('turn', models.IntegerField(default=0)),
+                ('message', models.TextField()),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('battle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='game.battle')),
+            ],
+            options={
+                'ordering': ['battle', 'seq'],
+                'constraints': [models.UniqueConstraint(fields=('battle', 'seq'), name='unique_battle_event_seq')],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:35
+
+import json
+
+from django.db import migrations
+
+
+def move_battle_logs(apps, schema_editor):
+    """Copy every JSON battle_log entry into BattleEvent rows"""
+    Battle = apps.get_model('game', 'Battle')
+    BattleEvent = apps.get_model('game', 'BattleEvent')
+
+    battles = Battle.objects.exclude(battle_log__in=['', '[]']).only('id', 'battle_log')
+    for battle in battles.iterator(chunk_size=500):
+        try:
+            log = json.loads(battle.battle_log)
+        except ValueError:
+            continue
+
+        events = [
+            BattleEvent(
+                battle_id=battle.id,
+                seq=seq,
+                turn=entry.get('turn', 0),
+                message=entry.get('message', ''),
+                payload={'timestamp': entry['timestamp']} if entry.get('timestamp') else {},
+            )
+            for seq, entry in enumerate(log)
+        ]
+        BattleEvent.objects.bulk_create(events)
+        Battle.objects.filter(id=battle.id).update(event_count=len(events))
+
+
+def restore_battle_logs(apps, schema_editor):
+    """Rebuild the JSON battle_log column from BattleEvent rows"""
+    Battle = apps.get_model('game', 'Battle')
+    BattleEvent = apps.get_model('game', 'BattleEvent')
+
+    for battle in Battle.objects.filter(event_count__gt=0).only('id').iterator(chunk_size=500):
+        log = [
+            {
+                'turn': event.turn,
+                'message': event.message,
+                'timestamp': event.payload.get('timestamp', str(event.created_at)),
+            }
+            for event in BattleEvent.objects.filter(battle_id=battle.id).order_by('seq')
+        ]
+        Battle.objects.filter(id=battle.id).update(battle_log=json.dumps(log))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0004_battleevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_battle_logs, restore_battle_logs),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:35
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0005_move_battle_logs'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='battle',
+            name='battle_log',
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0006_remove_battle_battle_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpeciesMatchup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.PositiveSmallIntegerField()),
+                ('battles', models.PositiveIntegerField()),
+                ('wins', models.PositiveIntegerField()),
+                ('draws', models.PositiveIntegerField(default=0)),
+                ('opponent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='game.pokemonspecies')),
+                ('species', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matchups', to='game.pokemonspecies')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('species', 'opponent', 'level'), name='unique_species_matchup')],
+            },
+        ),
+    ]
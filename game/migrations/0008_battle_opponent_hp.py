@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0007_speciesmatchup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='battle',
+            name='opponent_hp',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0008_battle_opponent_hp'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BattleArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('battle_type', models.CharField(choices=[('wild', 'Wild Pokemon'), ('trainer', 'Trainer Battle'), ('gym', 'Gym Battle')], max_length=20)),
+                ('status', models.CharField(choices=[('ongoing', 'Ongoing'), ('won', 'Won'), ('lost', 'Lost'), ('fled', 'Fled')], max_length=20)),
+                ('opponent_level', models.IntegerField()),
+                ('turns', models.IntegerField()),
+                ('experience_gained', models.IntegerField()),
+                ('coins_gained', models.IntegerField()),
+                ('log', models.BinaryField()),
+                ('created_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='battle',
+            index=models.Index(condition=models.Q(('status', 'ongoing')), fields=['trainer', 'status'], name='battle_ongoing_trainer_idx'),
+        ),
+        migrations.AddField(
+            model_name='battlearchive',
+            name='opponent_pokemon',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='game.pokemonspecies'),
+        ),
+        migrations.AddField(
+            model_name='battlearchive',
+            name='player_pokemon',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='game.userpokemon'),
+        ),
+        migrations.AddField(
+            model_name='battlearchive',
+            name='trainer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_battles', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Stat formulas as of this migration, copied rather than imported from
+# game.engine so later changes there can't alter what this migration writes
+def calc_stat(base, iv, level):
+    return int(((2 * base + iv) * level / 100) + 5)
+
+
+def calc_hp(base, iv, level):
+    return int(((2 * base + iv) * level / 100) + level + 10)
+
+
+STAT_FIELDS = [
+    'max_hp', 'attack_stat', 'defense_stat', 'sp_attack_stat', 'sp_defense_stat',
+    'speed_stat', 'total_stats', 'iv_total',
+]
+
+
+def fill_stored_stats(apps, schema_editor):
+    """Compute the new stat columns for existing Pokemon"""
+    UserPokemon = apps.get_model('game', 'UserPokemon')
+
+    batch = []
+    for pokemon in UserPokemon.objects.select_related('species').iterator(chunk_size=500):
+        species, level = pokemon.species, pokemon.level
+        pokemon.max_hp = calc_hp(species.base_hp, pokemon.iv_hp, level)
+        pokemon.attack_stat = calc_stat(species.base_attack, pokemon.iv_attack, level)
+        pokemon.defense_stat = calc_stat(species.base_defense, pokemon.iv_defense, level)
+        pokemon.sp_attack_stat = calc_stat(species.base_sp_attack, pokemon.iv_sp_attack, level)
+        pokemon.sp_defense_stat = calc_stat(species.base_sp_defense, pokemon.iv_sp_defense, level)
+        pokemon.speed_stat = calc_stat(species.base_speed, pokemon.iv_speed, level)
+        pokemon.total_stats = (pokemon.max_hp + pokemon.attack_stat + pokemon.defense_stat +
+                               pokemon.sp_attack_stat + pokemon.sp_defense_stat + pokemon.speed_stat)
+        pokemon.iv_total = (pokemon.iv_hp + pokemon.iv_attack + pokemon.iv_defense +
+                            pokemon.iv_sp_attack + pokemon.iv_sp_defense + pokemon.iv_speed)
+        batch.append(pokemon)
+        if len(batch) == 500:
+            UserPokemon.objects.bulk_update(batch, STAT_FIELDS)
+            batch = []
+    UserPokemon.objects.bulk_update(batch, STAT_FIELDS)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0009_battlearchive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userpokemon',
+            name='attack_stat',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userpokemon',
+            name='defense_stat',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userpokemon',
+            name='iv_total',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userpokemon',
+            name='max_hp',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userpokemon',
+            name='sp_attack_stat',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userpokemon',
+            name='sp_defense_stat',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userpokemon',
+            name='speed_stat',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userpokemon',
+            name='total_stats',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='userpokemon',
+            index=models.Index(fields=['owner', '-level'], name='pokemon_owner_level_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpokemon',
+            index=models.Index(fields=['owner', '-iv_total'], name='pokemon_owner_iv_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpokemon',
+            index=models.Index(fields=['owner', '-total_stats'], name='pokemon_owner_total_idx'),
+        ),
+        migrations.RunPython(fill_stored_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0010_userpokemon_stored_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userpokemon',
+            index=models.Index(fields=['owner', '-caught_at'], name='pokemon_owner_caught_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpokemon',
+            index=models.Index(fields=['owner', 'species'], name='pokemon_owner_species_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpokemon',
+            index=models.Index(fields=['owner', 'is_shiny'], name='pokemon_owner_shiny_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpokemon',
+            index=models.Index(fields=['owner', 'is_favorite'], name='pokemon_owner_favorite_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:04
+
+from django.db import migrations
+
+
+# The experience curve as of this migration, copied rather than imported
+# from game.leveling so later changes there can't alter what it writes:
+# level L needs 1000 * L * (L - 1) / 2 experience in total
+TRAINER_MAX_LEVEL = 100
+LEVEL_THRESHOLDS = tuple(1000 * level * (level - 1) // 2 for level in range(1, TRAINER_MAX_LEVEL + 1))
+
+
+def to_cumulative_experience(apps, schema_editor):
+    """
+    Turn each trainer's experience into a lifetime total on the shared
+    curve. Catches kept the experience into the current level and battles
+    a running total on a different curve, so the stored value can't be
+    told apart: every trainer keeps their level, and what they hold counts
+    as progress into it, short of the next level.
+    """
+    UserProfile = apps.get_model('game', 'UserProfile')
+
+    batch = []
+    for profile in UserProfile.objects.only('level', 'experience').iterator(chunk_size=500):
+        level = min(max(profile.level, 1), TRAINER_MAX_LEVEL)
+        span = LEVEL_THRESHOLDS[level] - LEVEL_THRESHOLDS[level - 1] if level < TRAINER_MAX_LEVEL else 0
+        progress = min(max(profile.experience, 0), max(span - 1, 0))
+        profile.level = level
+        profile.experience = LEVEL_THRESHOLDS[level - 1] + progress
+        batch.append(profile)
+        if len(batch) == 500:
+            UserProfile.objects.bulk_update(batch, ['level', 'experience'])
+            batch = []
+    UserProfile.objects.bulk_update(batch, ['level', 'experience'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0011_userpokemon_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(to_cumulative_experience, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0012_userprofile_cumulative_experience'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='battle',
+            name='battle_ongoing_trainer_idx',
+        ),
+        migrations.AddIndex(
+            model_name='battle',
+            index=models.Index(condition=models.Q(('status', 'ongoing')), fields=['player_pokemon'], name='battle_ongoing_pokemon_idx'),
+        ),
+    ]
@@ -1,8 +1,24 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
-import random
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 import json
+import random
+import zlib
+
+from .engine import calc_hp, calc_stat
+from .leveling import level_progress, level_up
+
+RARITY_CHOICES = [
+    ('common', 'Common'),
+    ('rare', 'Rare'),
+    ('epic', 'Epic'),
+    ('legendary', 'Legendary'),
+    ('mythical', 'Mythical'),
+    ('ultrabeast', 'UltraBeast'),
+]
 
 class PokemonSpecies(models.Model):
     """Base Pokemon species data"""
@@ -17,14 +33,7 @@ class PokemonSpecies(models.Model):
     base_sp_defense = models.IntegerField()
     base_speed = models.IntegerField()
     sprite_url = models.URLField(blank=True, null=True)
-    rarity = models.CharField(max_length=20, choices=[
-        ('common', 'Common'),
-        ('rare', 'Rare'),
-        ('epic', 'Epic'),
-        ('legendary', 'Legendary'),
-        ('mythical', 'Mythical'),
-        ('ultrabeast', 'UltraBeast'),
-    ], default='common')
+    rarity = models.CharField(max_length=20, choices=RARITY_CHOICES, default='common')
     catch_rate = models.IntegerField(default=45, validators=[MinValueValidator(1), MaxValueValidator(255)])
     evolution_level = models.IntegerField(null=True, blank=True)
     evolves_from = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='evolutions')
@@ -65,12 +74,52 @@ class UserProfile(models.Model):
     battles_won = models.IntegerField(default=0)
     battles_lost = models.IntegerField(default=0)
 
+    # Collection counters, maintained incrementally by UserPokemon signals
+    # so views never have to count the collection table. Only the rarities
+    # in RARITY_CHOICES have a counter: species still carrying a legacy
+    # rarity (such as 'uncommon') count towards pokemon_count alone, so the
+    # rarity counts need not add up to it.
+    pokemon_count = models.IntegerField(default=0)
+    shiny_count = models.IntegerField(default=0)
+    common_count = models.IntegerField(default=0)
+    rare_count = models.IntegerField(default=0)
+    epic_count = models.IntegerField(default=0)
+    legendary_count = models.IntegerField(default=0)
+    mythical_count = models.IntegerField(default=0)
+    ultrabeast_count = models.IntegerField(default=0)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.trainer_name} (Level {self.level})"
 
+    @staticmethod
+    def rarity_count_field(rarity):
+        return f'{rarity}_count'
+
+    @classmethod
+    def update_collection_counts(cls, user_id, pokemon=0, shiny=0, rarities=None):
+        """
+        Atomically adjust a trainer's collection counters.
+
+        rarities maps a rarity to the change in its count; every other
+        argument is a signed delta too. Rarities without a counter field
+        (legacy values like 'uncommon') are skipped rather than failing.
+        """
+        updates = {}
+        if pokemon:
+            updates['pokemon_count'] = models.F('pokemon_count') + pokemon
+        if shiny:
+            updates['shiny_count'] = models.F('shiny_count') + shiny
+        for rarity, delta in (rarities or {}).items():
+            # Legacy rarities outside RARITY_CHOICES have no counter
+            if delta and rarity in dict(RARITY_CHOICES):
+                field = cls.rarity_count_field(rarity)
+                updates[field] = models.F(field) + delta
+        if updates:
+            cls.objects.filter(user_id=user_id).update(**updates)
+
     @property
     def win_rate(self):
         total_battles = self.battles_won + self.battles_lost
@@ -78,17 +127,50 @@ class UserProfile(models.Model):
             return 0
         return round((self.battles_won / total_battles) * 100, 2)
 
-    def add_experience(self, exp):
+    def refresh_daily_catches(self):
+        """Reset the daily catch counter on the first visit of a new day"""
+        today = timezone.now().date()
+        if self.last_catch_reset != today:
+            self.daily_catches = 0
+            self.last_catch_reset = today
+            self.save(update_fields=['daily_catches', 'last_catch_reset'])
+
+    async def arefresh_daily_catches(self):
+        today = timezone.now().date()
+        if self.last_catch_reset != today:
+            self.daily_catches = 0
+            self.last_catch_reset = today
+            await self.asave(update_fields=['daily_catches', 'last_catch_reset'])
+
+    def add_experience(self, exp, save=True):
         """Add experience and handle level ups"""
         self.experience += exp
-        # Simple leveling: every 1000 exp = 1 level
-        new_level = (self.experience // 1000) + 1
-        if new_level > self.level:
-            self.level = new_level
-            # Give rewards for leveling up
-            self.coins += new_level * 100
-            self.pokeballs += 5
-        self.save()
+        self.level, coins, pokeballs = level_up(self.level, self.experience)
+        # Give rewards for every level reached
+        self.coins += coins
+        self.pokeballs += pokeballs
+        if save:
+            self.save()
+
+    @property
+    def level_progress(self):
+        """Experience into the current level"""
+        return level_progress(self.level, self.experience)[0]
+
+    @property
+    def level_experience(self):
+        """Experience the current level takes to finish; 0 at the top level"""
+        return level_progress(self.level, self.experience)[1]
+
+    @property
+    def experience_to_next_level(self):
+        progress, span = level_progress(self.level, self.experience)
+        return span - progress
+
+    @property
+    def level_progress_percentage(self):
+        progress, span = level_progress(self.level, self.experience)
+        return progress * 100 // span if span else 100
 
 class UserPokemon(models.Model):
     """Individual Pokemon owned by users"""
@@ -113,6 +195,17 @@ class UserPokemon(models.Model):
     iv_sp_defense = models.IntegerField(default=0, validators=[MinValueValidator(0), MaxValueValidator(31)])
     iv_speed = models.IntegerField(default=0, validators=[MinValueValidator(0), MaxValueValidator(31)])
 
+    # Stats at the current level, stored so they can be sorted and filtered
+    # on in SQL; kept in step with species, level and IVs by refresh_stats()
+    max_hp = models.IntegerField(default=0, editable=False)
+    attack_stat = models.IntegerField(default=0, editable=False)
+    defense_stat = models.IntegerField(default=0, editable=False)
+    sp_attack_stat = models.IntegerField(default=0, editable=False)
+    sp_defense_stat = models.IntegerField(default=0, editable=False)
+    speed_stat = models.IntegerField(default=0, editable=False)
+    total_stats = models.IntegerField(default=0, editable=False)
+    iv_total = models.IntegerField(default=0, editable=False)
+
     # Status
     current_hp = models.IntegerField()
     is_shiny = models.BooleanField(default=False)
@@ -125,12 +218,34 @@ class UserPokemon(models.Model):
     caught_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Fields the stored stats are computed from, and the stored stats
+    STAT_INPUTS = frozenset([
+        'species', 'species_id', 'level',
+        'iv_hp', 'iv_attack', 'iv_defense', 'iv_sp_attack', 'iv_sp_defense', 'iv_speed',
+    ])
+    STAT_FIELDS = (
+        'max_hp', 'attack_stat', 'defense_stat', 'sp_attack_stat', 'sp_defense_stat',
+        'speed_stat', 'total_stats', 'iv_total',
+    )
+
     class Meta:
         ordering = ['-caught_at']
+        indexes = [
+            # The collection page's sort keys and filters (see game.search)
+            models.Index(fields=['owner', '-caught_at'], name='pokemon_owner_caught_idx'),
+            models.Index(fields=['owner', '-level'], name='pokemon_owner_level_idx'),
+            models.Index(fields=['owner', '-iv_total'], name='pokemon_owner_iv_idx'),
+            models.Index(fields=['owner', '-total_stats'], name='pokemon_owner_total_idx'),
+            models.Index(fields=['owner', 'species'], name='pokemon_owner_species_idx'),
+            models.Index(fields=['owner', 'is_shiny'], name='pokemon_owner_shiny_idx'),
+            models.Index(fields=['owner', 'is_favorite'], name='pokemon_owner_favorite_idx'),
+        ]
 
     def save(self, *args, **kwargs):
+        new = not self.pk
+
         # Generate random IVs if this is a new Pokemon
-        if not self.pk:
+        if new:
             self.iv_hp = random.randint(0, 31)
             self.iv_attack = random.randint(0, 31)
             self.iv_defense = random.randint(0, 31)
@@ -141,6 +256,13 @@ class UserPokemon(models.Model):
             # 1/4096 chance for shiny
             self.is_shiny = random.randint(1, 4096) == 1
 
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or self.STAT_INPUTS.intersection(update_fields):
+            self.refresh_stats()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields).union(self.STAT_FIELDS)
+
+        if new:
             # Set current HP to max HP
             self.current_hp = self.max_hp
 
@@ -154,66 +276,78 @@ class UserPokemon(models.Model):
     def display_name(self):
         return self.nickname if self.nickname else self.species.name
 
-    @property
-    def max_hp(self):
-        """Calculate max HP based on base stats, IVs, and level"""
-        base = self.species.base_hp
-        iv = self.iv_hp
-        level = self.level
-        return int(((2 * base + iv) * level / 100) + level + 10)
-
-    @property
-    def attack_stat(self):
-        base = self.species.base_attack
-        iv = self.iv_attack
-        level = self.level
-        return int(((2 * base + iv) * level / 100) + 5)
-
-    @property
-    def defense_stat(self):
-        base = self.species.base_defense
-        iv = self.iv_defense
-        level = self.level
-        return int(((2 * base + iv) * level / 100) + 5)
-
-    @property
-    def sp_attack_stat(self):
-        base = self.species.base_sp_attack
-        iv = self.iv_sp_attack
-        level = self.level
-        return int(((2 * base + iv) * level / 100) + 5)
-
-    @property
-    def sp_defense_stat(self):
-        base = self.species.base_sp_defense
-        iv = self.iv_sp_defense
-        level = self.level
-        return int(((2 * base + iv) * level / 100) + 5)
-
-    @property
-    def speed_stat(self):
-        base = self.species.base_speed
-        iv = self.iv_speed
-        level = self.level
-        return int(((2 * base + iv) * level / 100) + 5)
-
-    @property
-    def total_stats(self):
-        return (self.max_hp + self.attack_stat + self.defense_stat +
-                self.sp_attack_stat + self.sp_defense_stat + self.speed_stat)
+    def refresh_stats(self):
+        """Recompute the stored stat columns from species, IVs and level"""
+        species = self.species
+        self.max_hp = calc_hp(species.base_hp, self.iv_hp, self.level)
+        self.attack_stat = calc_stat(species.base_attack, self.iv_attack, self.level)
+        self.defense_stat = calc_stat(species.base_defense, self.iv_defense, self.level)
+        self.sp_attack_stat = calc_stat(species.base_sp_attack, self.iv_sp_attack, self.level)
+        self.sp_defense_stat = calc_stat(species.base_sp_defense, self.iv_sp_defense, self.level)
+        self.speed_stat = calc_stat(species.base_speed, self.iv_speed, self.level)
+        self.total_stats = (self.max_hp + self.attack_stat + self.defense_stat +
+                            self.sp_attack_stat + self.sp_defense_stat + self.speed_stat)
+        self.iv_total = (self.iv_hp + self.iv_attack + self.iv_defense +
+                         self.iv_sp_attack + self.iv_sp_defense + self.iv_speed)
+
+    @classmethod
+    def stat_updates(cls, species=None):
+        """
+        update() kwargs that recompute the stored stat columns in SQL, for
+        bulk changes to level, IVs or species. Same formulas as calc_stat()
+        and calc_hp(); every operand is an integer, so the division truncates
+        just like int() does.
+
+        Base stats are read from each row's species, or taken from `species`
+        when every row is (or is about to become) that species. An UPDATE
+        that also changes species_id needs the latter, since its subqueries
+        would see the old species.
+        """
+        def base(field):
+            if species is not None:
+                return models.Value(getattr(species, field))
+            return models.Subquery(PokemonSpecies.objects.filter(pk=models.OuterRef('species_id')).values(field))
+
+        def scaled(base_field, iv_field):
+            return (2 * base(base_field) + models.F(iv_field)) * models.F('level') / 100
+
+        stats = {
+            'max_hp': scaled('base_hp', 'iv_hp') + models.F('level') + 10,
+            'attack_stat': scaled('base_attack', 'iv_attack') + 5,
+            'defense_stat': scaled('base_defense', 'iv_defense') + 5,
+            'sp_attack_stat': scaled('base_sp_attack', 'iv_sp_attack') + 5,
+            'sp_defense_stat': scaled('base_sp_defense', 'iv_sp_defense') + 5,
+            'speed_stat': scaled('base_speed', 'iv_speed') + 5,
+        }
+        # An UPDATE reads the old column values, so the total can't just
+        # add up the columns set above
+        stats['total_stats'] = sum(stats.values(), models.Value(0))
+        stats['iv_total'] = (models.F('iv_hp') + models.F('iv_attack') + models.F('iv_defense') +
+                             models.F('iv_sp_attack') + models.F('iv_sp_defense') + models.F('iv_speed'))
+        return stats
 
     @property
     def iv_percentage(self):
         """Calculate IV percentage (perfect IVs = 100%)"""
-        total_ivs = (self.iv_hp + self.iv_attack + self.iv_defense +
-                    self.iv_sp_attack + self.iv_sp_defense + self.iv_speed)
-        return round((total_ivs / 186) * 100, 1)  # 186 = 31 * 6
+        return round((self.iv_total / 186) * 100, 1)  # 186 = 31 * 6
 
     def heal(self):
         """Fully heal the Pokemon"""
         self.current_hp = self.max_hp
         self.save()
 
+    @classmethod
+    def heal_many(cls, pokemon):
+        """
+        Fully heal every Pokemon in the `pokemon` queryset with one UPDATE.
+
+        Uses the stored max_hp column, so nothing is loaded into Python.
+        Returns how many Pokemon were actually hurt and got healed.
+        """
+        return pokemon.filter(current_hp__lt=models.F('max_hp')).update(
+            current_hp=models.F('max_hp'), updated_at=timezone.now()
+        )
+
     def can_evolve(self):
         """Check if Pokemon can evolve"""
         if not self.species.evolution_level:
@@ -225,11 +359,17 @@ class UserPokemon(models.Model):
         if not self.can_evolve():
             return False
 
-        # Find evolution
-        evolution = self.species.evolutions.first()
+        # Find evolution in the cached chain index
+        from game.catalog import get_species_catalog
+        evolution = get_species_catalog().evolution.next_stage(self.species_id)
         if evolution:
+            old_rarity = self.species.rarity
             self.species = evolution
             self.save()
+            if evolution.rarity != old_rarity:
+                UserProfile.update_collection_counts(
+                    self.owner_id, rarities={old_rarity: -1, evolution.rarity: 1}
+                )
             return True
         return False
 
@@ -256,10 +396,11 @@ class Battle(models.Model):
     player_pokemon = models.ForeignKey(UserPokemon, on_delete=models.CASCADE, related_name='battles_as_player')
     opponent_pokemon = models.ForeignKey(PokemonSpecies, on_delete=models.CASCADE)
     opponent_level = models.IntegerField(default=5)
+    opponent_hp = models.IntegerField(null=True, blank=True)  # null until the opponent is first hit
 
     # Battle data
     turns = models.IntegerField(default=0)
-    battle_log = models.TextField(default='[]')  # JSON string of battle events
+    event_count = models.IntegerField(default=0)  # number of BattleEvent rows
 
     # Rewards
     experience_gained = models.IntegerField(default=0)
@@ -268,19 +409,159 @@ class Battle(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # How many log entries the battle screens show
+    LOG_TAIL = 50
+
+    class Meta:
+        indexes = [
+            # Ongoing battles are a tiny, hot slice of the table, looked up
+            # by Pokemon whenever one is about to battle, heal or be released
+            models.Index(
+                fields=['player_pokemon'],
+                condition=models.Q(status='ongoing'),
+                name='battle_ongoing_pokemon_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.trainer.username} vs {self.opponent_pokemon.name} ({self.status})"
 
-    def add_to_log(self, message):
-        """Add a message to the battle log"""
-        log = json.loads(self.battle_log) if self.battle_log else []
-        log.append({
-            'turn': self.turns,
-            'message': message,
-            'timestamp': str(self.updated_at)
-        })
-        self.battle_log = json.dumps(log)
-        self.save()
+    @property
+    def opponent_max_hp(self):
+        # Wild Pokemon have no IVs
+        return calc_hp(self.opponent_pokemon.base_hp, 0, self.opponent_level)
+
+    @property
+    def opponent_current_hp(self):
+        return self.opponent_max_hp if self.opponent_hp is None else self.opponent_hp
+
+    @property
+    def _pending_events(self):
+        return self.__dict__.setdefault('_pending_event_list', [])
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self._pending_events:
+            kwargs['update_fields'] = set(update_fields) | {'event_count'}
+        super().save(*args, **kwargs)
+        self.flush_log()
+
+    def add_to_log(self, message, **payload):
+        """Queue a message for the battle log; it is written on the next save()"""
+        self._pending_events.append(BattleEvent(
+            battle=self,
+            seq=self.event_count,
+            turn=self.turns,
+            message=message,
+            payload=payload,
+        ))
+        self.event_count += 1
+
+    def flush_log(self):
+        """Insert every queued log message in one statement"""
+        pending = self._pending_events
+        if pending:
+            BattleEvent.objects.bulk_create(pending)
+            pending.clear()
+
+    def recent_events(self, limit=None):
+        """The last `limit` log entries, oldest first"""
+        events = list(self.events.order_by('-seq')[:limit or self.LOG_TAIL])
+        events.reverse()
+        return events
+
+class BattleEvent(models.Model):
+    """A single entry in a battle log"""
+    battle = models.ForeignKey(Battle, on_delete=models.CASCADE, related_name='events')
+    seq = models.IntegerField()
+    turn = models.IntegerField(default=0)
+    message = models.TextField()
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['battle', 'seq']
+        constraints = [
+            models.UniqueConstraint(fields=['battle', 'seq'], name='unique_battle_event_seq'),
+        ]
+
+    def __str__(self):
+        return f"Battle {self.battle_id} #{self.seq}: {self.message}"
+
+class BattleArchive(models.Model):
+    """
+    A finished battle moved out of the Battle table by archive_battles.
+
+    Keeps the battle's id and summary columns; the whole log is stored as
+    one zlib-compressed JSON blob instead of BattleEvent rows.
+    """
+    id = models.BigIntegerField(primary_key=True)  # the original Battle id
+    trainer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_battles')
+    battle_type = models.CharField(max_length=20, choices=Battle.BATTLE_TYPES)
+    status = models.CharField(max_length=20, choices=Battle.BATTLE_STATUS)
+    player_pokemon = models.ForeignKey(UserPokemon, on_delete=models.SET_NULL, null=True, related_name='+')
+    opponent_pokemon = models.ForeignKey(PokemonSpecies, on_delete=models.CASCADE, related_name='+')
+    opponent_level = models.IntegerField()
+    turns = models.IntegerField()
+    experience_gained = models.IntegerField()
+    coins_gained = models.IntegerField()
+    log = models.BinaryField()
+
+    created_at = models.DateTimeField()
+    finished_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived battle {self.id} ({self.status})"
+
+    @classmethod
+    def from_battle(cls, battle, events):
+        """An unsaved archive row for `battle` and its (seq-ordered) BattleEvents"""
+        entries = [[event.turn, event.message, event.payload] for event in events]
+        return cls(
+            id=battle.id,
+            trainer_id=battle.trainer_id,
+            battle_type=battle.battle_type,
+            status=battle.status,
+            player_pokemon_id=battle.player_pokemon_id,
+            opponent_pokemon_id=battle.opponent_pokemon_id,
+            opponent_level=battle.opponent_level,
+            turns=battle.turns,
+            experience_gained=battle.experience_gained,
+            coins_gained=battle.coins_gained,
+            log=zlib.compress(json.dumps(entries, separators=(',', ':')).encode()),
+            created_at=battle.created_at,
+            finished_at=battle.updated_at,
+        )
+
+    @property
+    def events(self):
+        """The battle log as a list of {'turn', 'message', 'payload'} dicts"""
+        return [
+            {'turn': turn, 'message': message, 'payload': payload}
+            for turn, message, payload in json.loads(zlib.decompress(self.log))
+        ]
+
+class SpeciesMatchup(models.Model):
+    """Simulated head-to-head record of one species against another at a level"""
+    species = models.ForeignKey(PokemonSpecies, on_delete=models.CASCADE, related_name='matchups')
+    opponent = models.ForeignKey(PokemonSpecies, on_delete=models.CASCADE, related_name='+')
+    level = models.PositiveSmallIntegerField()
+    battles = models.PositiveIntegerField()
+    wins = models.PositiveIntegerField()
+    draws = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['species', 'opponent', 'level'], name='unique_species_matchup'),
+        ]
+
+    def __str__(self):
+        return f"{self.species_id} vs {self.opponent_id} at Lv.{self.level}: {self.win_rate:.1%}"
+
+    @property
+    def win_rate(self):
+        return self.wins / self.battles if self.battles else 0.0
 
 class Item(models.Model):
     """Game items"""
@@ -313,3 +594,38 @@ class UserItem(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.item.name} x{self.quantity}"
 
+
+# Invalidate every worker's species catalog whenever a species changes
+@receiver(post_save, sender=PokemonSpecies)
+@receiver(post_delete, sender=PokemonSpecies)
+def invalidate_species_catalog(sender, **kwargs):
+    from game.catalog import invalidate_catalog
+    invalidate_catalog()
+
+# Base stat edits change every stored stat of that species' Pokemon
+@receiver(post_save, sender=PokemonSpecies)
+def refresh_species_pokemon_stats(sender, instance, created, **kwargs):
+    if not created:
+        UserPokemon.objects.filter(species=instance).update(**UserPokemon.stat_updates())
+
+# Keep the trainer's collection counters in step with their Pokemon
+@receiver(post_save, sender=UserPokemon)
+def count_caught_pokemon(sender, instance, created, **kwargs):
+    if created:
+        UserProfile.update_collection_counts(
+            instance.owner_id,
+            pokemon=1,
+            shiny=1 if instance.is_shiny else 0,
+            rarities={instance.species.rarity: 1},
+        )
+
+@receiver(post_delete, sender=UserPokemon)
+def count_released_pokemon(sender, instance, **kwargs):
+    from game.catalog import get_species_catalog
+    species = get_species_catalog().get(instance.species_id)
+    UserProfile.update_collection_counts(
+        instance.owner_id,
+        pokemon=-1,
+        shiny=-1 if instance.is_shiny else 0,
+        rarities={species.rarity: -1} if species else None,
+    )
@@ -0,0 +1,52 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are read with a WHERE on the last row's (sort key, id) instead of an
+OFFSET, so every page costs the same single query however deep it is, and
+rows caught in the meantime don't shift later pages. The cursor handed to
+the client is a signed [sort value, id] pair.
+"""
+from datetime import datetime
+from functools import reduce
+
+from django.core import signing
+from django.db.models import Q
+
+CURSOR_SALT = 'game.pagination.cursor'
+
+def _value(obj, field):
+    """Follow a `species__name` style path on a fetched object"""
+    value = reduce(getattr, field.split('__'), obj)
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _after(ordering, cursor):
+    """Filter for the rows after `cursor` in `ordering` (e.g. '-level')"""
+    value, pk = cursor
+    field = ordering.lstrip('-')
+    op = 'lt' if ordering.startswith('-') else 'gt'
+    return Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'pk__{op}': pk})
+
+def keyset_page(queryset, ordering, cursor=None, page_size=24):
+    """
+    One page of `queryset` ordered by `ordering` then pk (in the same
+    direction), starting after `cursor`.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page. A
+    cursor that doesn't verify is treated as the first page.
+    """
+    pk_ordering = '-pk' if ordering.startswith('-') else 'pk'
+    queryset = queryset.order_by(ordering, pk_ordering)
+
+    if cursor:
+        try:
+            queryset = queryset.filter(_after(ordering, signing.loads(cursor, salt=CURSOR_SALT)))
+        except (signing.BadSignature, TypeError, ValueError):
+            pass
+
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, signing.dumps([_value(last, ordering.lstrip('-')), last.pk], salt=CURSOR_SALT)
@@ -0,0 +1,490 @@
+"""
+Real-time trainer-vs-trainer battles over WebSockets.
+
+A plain ASGI WebSocket handler (routed from pokemon_vortex_project/asgi.py)
+serves /ws/pvp/<room>/?pokemon=<id>. Each room is owned by one process,
+which keeps it in an in-memory registry and runs its turn loop. Sockets
+and rooms only talk through a channel layer:
+
+- pvp.room.<id>       join/action/leave messages for the room
+- pvp.room.<id>.out   room updates, forwarded to both players' sockets
+
+The default layer is in-process asyncio queues, so a turn is resolved and
+pushed to both players without leaving the event loop. With
+PVP_CHANNEL_LAYER = 'redis' the same JSON messages go over Redis pub/sub
+and the two players may be connected to different worker processes; a
+cache key decides which process owns a room.
+"""
+import asyncio
+import json
+import logging
+import random
+import re
+import secrets
+from collections import defaultdict
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import aget_user
+from django.core.cache import cache
+from django.http.cookie import parse_cookie
+
+from .battle_state import record_pvp_battle
+from .engine import PVP_ACTIONS, PVP_MAX_TURNS, Combatant, resolve_pvp_turn
+from .models import Battle, UserPokemon
+
+ROOM_PATH = re.compile(r'^/ws/pvp/(?P<room>[\w-]{1,64})/$')
+ROOM_GROUP = 'pvp.room.{}'
+ROOM_OUT_GROUP = 'pvp.room.{}.out'
+ROOM_OWNER_KEY = 'game:pvp-room-owner:{}'
+PVP_TRAINER_KEY = 'game:pvp-trainer:{}'
+
+# How long a room ownership claim, or a Pokemon's reservation for a room,
+# survives a crashed owner process
+ROOM_OWNER_TTL = 60 * 60
+
+# A player who lets the turn timer run out this many turns in a row forfeits
+MAX_IDLE_TURNS = 2
+
+# WebSocket close codes
+CLOSE_NORMAL = 1000
+CLOSE_FORBIDDEN = 4403
+CLOSE_NOT_FOUND = 4404
+CLOSE_BAD_REQUEST = 4400
+CLOSE_CONFLICT = 4409
+CLOSE_UNAVAILABLE = 4503
+
+# Identifies this process in room ownership claims
+PROCESS_TOKEN = secrets.token_hex(8)
+
+logger = logging.getLogger(__name__)
+
+def pokemon_in_pvp(user_id):
+    """
+    The id of the Pokemon `user_id` has in a PvP room, or None.
+
+    A trainer battles with one Pokemon at a time. While its room is open,
+    the wild battle, heal and release paths leave that Pokemon alone, since
+    the room writes its HP back when the battle ends.
+    """
+    return cache.get(PVP_TRAINER_KEY.format(user_id))
+
+async def _reserve_pokemon(player):
+    return await cache.aadd(PVP_TRAINER_KEY.format(player['user_id']), player['pokemon_id'], ROOM_OWNER_TTL)
+
+async def _release_pokemon(player):
+    key = PVP_TRAINER_KEY.format(player['user_id'])
+    if await cache.aget(key) == player['pokemon_id']:
+        await cache.adelete(key)
+
+class InProcessChannelLayer:
+    """Groups of asyncio queues; only reaches sockets in this process"""
+
+    def __init__(self):
+        self.groups = defaultdict(set)
+
+    async def publish(self, group, message):
+        for queue in tuple(self.groups.get(group, ())):
+            queue.put_nowait(message)
+
+    async def subscribe(self, group):
+        queue = asyncio.Queue()
+        self.groups[group].add(queue)
+        return _QueueSubscription(self, group, queue)
+
+class _QueueSubscription:
+    def __init__(self, layer, group, queue):
+        self.layer = layer
+        self.group = group
+        self.queue = queue
+
+    async def get(self):
+        return await self.queue.get()
+
+    async def close(self):
+        members = self.layer.groups.get(self.group)
+        if members is not None:
+            members.discard(self.queue)
+            if not members:
+                del self.layer.groups[self.group]
+
+class RedisChannelLayer:
+    """Redis pub/sub; reaches sockets in every process sharing the server"""
+
+    def __init__(self, url):
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url)
+
+    async def publish(self, group, message):
+        await self.redis.publish(group, json.dumps(message))
+
+    async def subscribe(self, group):
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(group)
+        return _RedisSubscription(pubsub)
+
+class _RedisSubscription:
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    async def get(self):
+        while True:
+            message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+            if message is not None:
+                return json.loads(message['data'])
+
+    async def close(self):
+        await self.pubsub.unsubscribe()
+        await self.pubsub.aclose()
+
+_layer = None
+
+def get_channel_layer():
+    """The process-wide channel layer picked by PVP_CHANNEL_LAYER"""
+    global _layer
+    if _layer is None:
+        if settings.PVP_CHANNEL_LAYER == 'redis':
+            _layer = RedisChannelLayer(settings.REDIS_URL)
+        else:
+            _layer = InProcessChannelLayer()
+    return _layer
+
+class Room:
+    """One PvP battle, run by the process that owns it"""
+
+    def __init__(self, room_id, layer, rng=random):
+        self.id = room_id
+        self.layer = layer
+        self.rng = rng
+        self.players = []  # join messages' player dicts, in join order
+        self.combatants = []
+        self.actions = {}  # side -> action chosen this turn
+        self.idle = [0, 0]
+        self.turn = 0
+        self.log = []  # (turn, message, payload)
+        self.finished = False
+
+    @property
+    def started(self):
+        return len(self.players) == 2
+
+    async def broadcast(self, kind, **data):
+        await self.layer.publish(ROOM_OUT_GROUP.format(self.id), {'type': kind, **data})
+
+    async def run(self, subscription):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.PVP_JOIN_SECONDS
+        while not self.finished:
+            try:
+                message = await asyncio.wait_for(subscription.get(), max(0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                if not self.started:
+                    await self.broadcast('closed', reason='No opponent joined in time.')
+                    return
+                # Turn timer ran out: whoever hasn't moved passes
+                await self.resolve()
+                deadline = loop.time() + settings.PVP_TURN_SECONDS
+                continue
+
+            kind = message.get('type')
+            if kind == 'join':
+                if await self.join(message['player']):
+                    deadline = loop.time() + settings.PVP_TURN_SECONDS
+            elif kind == 'action':
+                if await self.act(message['user_id'], message['action']):
+                    deadline = loop.time() + settings.PVP_TURN_SECONDS
+            elif kind == 'leave':
+                await self.leave(message['user_id'])
+
+    def side_of(self, user_id):
+        for side, player in enumerate(self.players):
+            if player['user_id'] == user_id:
+                return side
+        return None
+
+    async def join(self, player):
+        """Add a player; returns True when this starts the battle"""
+        if self.started or self.side_of(player['user_id']) is not None:
+            await self.broadcast('full', user_id=player['user_id'])
+            return False
+
+        self.players.append(player)
+        if not self.started:
+            await self.broadcast('waiting', room=self.id, user_id=player['user_id'])
+            return False
+
+        self.combatants = [
+            Combatant.from_stats(
+                f"{p['trainer']}'s {p['name']}", p['level'], p['types'], p['base'], p['ivs'], hp=p['hp']
+            )
+            for p in self.players
+        ]
+        await self.broadcast('start', players=[
+            {
+                'user_id': p['user_id'],
+                'trainer': p['trainer'],
+                'pokemon': p['name'],
+                'level': p['level'],
+                'hp': c.hp,
+                'max_hp': c.max_hp,
+            }
+            for p, c in zip(self.players, self.combatants)
+        ])
+        await self.broadcast('turn', turn=self.turn + 1, seconds=settings.PVP_TURN_SECONDS)
+        return True
+
+    async def act(self, user_id, action):
+        """Record a player's action; returns True if it completed the turn"""
+        side = self.side_of(user_id)
+        if not self.started or side is None or side in self.actions or action not in PVP_ACTIONS:
+            return False
+        self.actions[side] = action
+        self.idle[side] = 0
+        if len(self.actions) < 2 and action != 'forfeit':
+            await self.broadcast('ready', user_id=user_id)
+            return False
+        await self.resolve()
+        return True
+
+    async def resolve(self):
+        """Run one engine step with both actions and push the result"""
+        actions = []
+        for side in (0, 1):
+            action = self.actions.get(side)
+            if action is None:
+                self.idle[side] += 1
+                action = 'forfeit' if self.idle[side] >= MAX_IDLE_TURNS else 'pass'
+            actions.append(action)
+        self.actions.clear()
+
+        self.turn += 1
+        a, b = self.combatants
+        events, winner = resolve_pvp_turn(a, b, actions[0], actions[1], self.rng)
+        self.log.extend((self.turn, event.message, event.payload) for event in events)
+        messages = [event.message for event in events]
+        draw = winner is None and self.turn >= PVP_MAX_TURNS
+        if draw:
+            messages.append("The battle dragged on and ended in a draw!")
+            self.log.append((self.turn, messages[-1], {}))
+
+        await self.broadcast(
+            'turn_result',
+            turn=self.turn,
+            events=messages,
+            hp=[c.hp for c in self.combatants],
+        )
+        if winner is not None:
+            await self.finish(0 if winner == 'a' else 1)
+        elif draw:
+            await self.finish(None)
+        else:
+            await self.broadcast('turn', turn=self.turn + 1, seconds=settings.PVP_TURN_SECONDS)
+
+    async def leave(self, user_id):
+        side = self.side_of(user_id)
+        if side is None:
+            return
+        if not self.started:
+            await _release_pokemon(self.players.pop(side))
+            if not self.players:
+                self.finished = True
+            return
+        self.log.append((self.turn, f"{self.combatants[side].name} left the battle!", {}))
+        await self.finish(1 - side)
+
+    async def finish(self, winner):
+        """
+        Save the battle (`winner` is a side, or None for a draw) and tell
+        both players. The room closes even if the save fails.
+        """
+        self.finished = True
+        players = [dict(p, hp=c.hp) for p, c in zip(self.players, self.combatants)]
+        saved = True
+        try:
+            await sync_to_async(record_pvp_battle)(players, winner, self.log)
+        except Exception:
+            logger.exception('Could not save PvP battle in room %s', self.id)
+            saved = False
+        await self.broadcast(
+            'finished',
+            winner=None if winner is None else self.players[winner]['user_id'],
+            saved=saved,
+        )
+
+class RoomRegistry:
+    """The rooms this process owns"""
+
+    def __init__(self):
+        self.rooms = {}
+
+    async def ensure(self, room_id, layer):
+        """
+        Start `room_id` here unless this or another process already runs it.
+        The owner may also be a process that died without deleting its key;
+        sockets find out when nobody answers their join.
+        """
+        if room_id in self.rooms:
+            return
+        if not await cache.aadd(ROOM_OWNER_KEY.format(room_id), PROCESS_TOKEN, ROOM_OWNER_TTL):
+            return
+        room = Room(room_id, layer)
+        # Subscribe before anyone can publish a join
+        subscription = await layer.subscribe(ROOM_GROUP.format(room_id))
+        self.rooms[room_id] = room
+        asyncio.create_task(self._run(room, subscription))
+
+    async def _run(self, room, subscription):
+        try:
+            await room.run(subscription)
+        finally:
+            await subscription.close()
+            self.rooms.pop(room.id, None)
+            for player in room.players:
+                await _release_pokemon(player)
+            await cache.adelete(ROOM_OWNER_KEY.format(room.id))
+
+rooms = RoomRegistry()
+
+def _header(scope, name):
+    for key, value in scope.get('headers', ()):
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+def _origin_allowed(scope):
+    """Browsers always send Origin on WebSockets; it must be this site"""
+    origin = _header(scope, b'origin')
+    if origin is None:
+        return True
+    return urlsplit(origin).netloc == _header(scope, b'host') or origin in settings.CSRF_TRUSTED_ORIGINS
+
+async def _authenticate(scope):
+    session_key = parse_cookie(_header(scope, b'cookie') or '').get(settings.SESSION_COOKIE_NAME)
+    if not session_key:
+        return None
+    engine = import_module(settings.SESSION_ENGINE)
+    user = await aget_user(SimpleNamespace(session=engine.SessionStore(session_key)))
+    return user if user.is_authenticated else None
+
+async def _load_player(user, scope):
+    """The join message's player dict, or None if the Pokemon can't battle"""
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    try:
+        pokemon_id = int(query['pokemon'][0])
+    except (KeyError, ValueError):
+        return None
+
+    pokemon = await UserPokemon.objects.select_related('species').filter(
+        id=pokemon_id, owner=user, current_hp__gt=0
+    ).afirst()
+    # A Pokemon in an ongoing wild battle would have its HP written twice
+    if pokemon is None or await Battle.objects.filter(player_pokemon=pokemon, status='ongoing').aexists():
+        return None
+
+    species = pokemon.species
+    return {
+        'user_id': user.id,
+        'trainer': user.get_username(),
+        'pokemon_id': pokemon.id,
+        'species_id': species.id,
+        'name': pokemon.display_name,
+        'level': pokemon.level,
+        'types': [t for t in (species.type1, species.type2) if t],
+        'base': [species.base_hp, species.base_attack, species.base_defense,
+                 species.base_sp_attack, species.base_sp_defense, species.base_speed],
+        'ivs': [pokemon.iv_hp, pokemon.iv_attack, pokemon.iv_defense,
+                pokemon.iv_sp_attack, pokemon.iv_sp_defense, pokemon.iv_speed],
+        'hp': pokemon.current_hp,
+    }
+
+async def websocket_application(scope, receive, send):
+    """ASGI app for PvP sockets"""
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+
+    match = ROOM_PATH.match(scope['path'])
+    if match is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+    user = await _authenticate(scope) if _origin_allowed(scope) else None
+    if user is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        return
+    player = await _load_player(user, scope)
+    if player is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_BAD_REQUEST})
+        return
+    # Held until the room is done with this player (see RoomRegistry._run),
+    # or released below if no room takes this player in
+    if not await _reserve_pokemon(player):
+        await send({'type': 'websocket.close', 'code': CLOSE_CONFLICT})
+        return
+
+    await send({'type': 'websocket.accept'})
+
+    room_id = match['room']
+    layer = get_channel_layer()
+    updates = await layer.subscribe(ROOM_OUT_GROUP.format(room_id))
+
+    # Set once the room has added this player, and so will release the
+    # reservation itself
+    joined = False
+
+    async def forward():
+        """Room updates -> this socket, until the room is done with us"""
+        nonlocal joined
+        answered = False
+        while True:
+            try:
+                message = await asyncio.wait_for(
+                    updates.get(), None if answered else settings.PVP_JOIN_ACK_SECONDS
+                )
+            except asyncio.TimeoutError:
+                await send({'type': 'websocket.close', 'code': CLOSE_UNAVAILABLE})
+                return
+            if message['type'] in ('waiting', 'full', 'ready') and message['user_id'] != user.id:
+                continue
+            if message['type'] == 'start' and not any(p['user_id'] == user.id for p in message['players']):
+                continue
+            answered = True
+            if message['type'] in ('waiting', 'start'):
+                joined = True
+            await send({'type': 'websocket.send', 'text': json.dumps(message)})
+            if message['type'] in ('finished', 'closed', 'full'):
+                await send({'type': 'websocket.close', 'code': CLOSE_NORMAL})
+                return
+
+    async def listen():
+        """This socket's actions -> the room, until the client disconnects"""
+        while True:
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                return
+            try:
+                data = json.loads(event.get('text') or '')
+            except ValueError:
+                continue
+            action = data.get('action') if isinstance(data, dict) else None
+            if action in PVP_ACTIONS:
+                await layer.publish(ROOM_GROUP.format(room_id),
+                                    {'type': 'action', 'user_id': user.id, 'action': action})
+
+    try:
+        await rooms.ensure(room_id, layer)
+        await layer.publish(ROOM_GROUP.format(room_id), {'type': 'join', 'player': player})
+
+        forwarder = asyncio.create_task(forward())
+        listener = asyncio.create_task(listen())
+        done, pending = await asyncio.wait({forwarder, listener}, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        if listener in done:
+            await layer.publish(ROOM_GROUP.format(room_id), {'type': 'leave', 'user_id': user.id})
+    finally:
+        await updates.close()
+        if not joined:
+            await _release_pokemon(player)
@@ -0,0 +1,98 @@
+"""
+Bulk release of UserPokemon.
+
+Releasing through the ORM (or the admin) loads every Pokemon, runs the
+delete collector over its battles and fires the post_delete counter
+signal once per row. bulk_release() instead works on ids only: each
+batch deletes the Pokemon's battles, their log events and the Pokemon
+themselves with plain DELETEs, then adjusts the trainer's counters and
+coins with one F() update, all in one transaction.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from .catalog import get_species_catalog
+from .models import Battle, BattleArchive, BattleEvent, UserPokemon, UserProfile
+from .pvp import pokemon_in_pvp
+
+RELEASE_BATCH_SIZE = 500
+
+# Every (model, field) that points at a row bulk_release() deletes with
+# _raw_delete(); a new relation has to be handled there before the delete
+RAW_DELETE_RELATIONS = {
+    UserPokemon: {(Battle, 'player_pokemon'), (BattleArchive, 'player_pokemon')},
+    Battle: {(BattleEvent, 'battle')},
+}
+
+# Coins refunded per level of each released Pokemon
+RELEASE_COINS_PER_LEVEL = 2
+
+def releasable_pokemon(owner, species_id=None, max_iv=None):
+    """
+    `owner`'s Pokemon that a bulk release may take: never favourites,
+    shinies or a Pokemon in an ongoing battle (wild or PvP). `max_iv` is an
+    IV percentage; only Pokemon strictly below it match.
+    """
+    pokemon = UserPokemon.objects.filter(owner=owner, is_favorite=False, is_shiny=False)
+    if species_id is not None:
+        pokemon = pokemon.filter(species_id=species_id)
+    if max_iv is not None:
+        pokemon = pokemon.filter(iv_total__lt=max_iv * 186 / 100)  # 186 = 31 * 6
+    return pokemon.exclude(battles_as_player__status='ongoing').exclude(id=pokemon_in_pvp(owner.pk))
+
+def bulk_release(pokemon, batch_size=RELEASE_BATCH_SIZE):
+    """
+    Delete every Pokemon in the `pokemon` queryset, `batch_size` at a
+    time, refunding coins to their owners.
+
+    Returns (released, coins refunded).
+    """
+    catalog = get_species_catalog()
+    released = refunded = 0
+
+    while True:
+        with transaction.atomic():
+            rows = list(
+                pokemon.order_by('id').values_list('id', 'owner_id', 'species_id', 'level', 'is_shiny')[:batch_size]
+            )
+            if not rows:
+                break
+            ids = [row[0] for row in rows]
+
+            # _raw_delete() skips the collector's cascades and signals, which
+            # is safe only because every relation into these rows is handled
+            # here first (RAW_DELETE_RELATIONS, checked by the tests):
+            # events before their battles, battles and archives before the
+            # Pokemon. Events and battles have no delete signals.
+            battles = Battle.objects.filter(player_pokemon_id__in=ids)
+            BattleEvent.objects.filter(battle__in=battles.values('id'))._raw_delete(BattleEvent.objects.db)
+            battles._raw_delete(Battle.objects.db)
+            BattleArchive.objects.filter(player_pokemon_id__in=ids).update(player_pokemon=None)
+            # Counters are adjusted below, once per trainer, instead of by
+            # the per-row post_delete signal
+            UserPokemon.objects.filter(id__in=ids)._raw_delete(UserPokemon.objects.db)
+
+            by_owner = defaultdict(list)
+            for row in rows:
+                by_owner[row[1]].append(row)
+            for owner_id, owned in by_owner.items():
+                rarities = Counter()
+                for _, _, species_id, _, _ in owned:
+                    species = catalog.get(species_id)
+                    if species:
+                        rarities[species.rarity] -= 1
+                UserProfile.update_collection_counts(
+                    owner_id,
+                    pokemon=-len(owned),
+                    shiny=-sum(is_shiny for *_, is_shiny in owned),
+                    rarities=rarities,
+                )
+                coins = sum(level for _, _, _, level, _ in owned) * RELEASE_COINS_PER_LEVEL
+                UserProfile.objects.filter(user_id=owner_id).update(coins=F('coins') + coins)
+                refunded += coins
+
+            released += len(rows)
+
+    return released, refunded
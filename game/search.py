@@ -0,0 +1,93 @@
+"""
+Collection search for UserPokemon.
+
+Every filter is written so the database can answer it from an (owner, ...)
+composite index rather than by joining species or scanning the table:
+type, rarity and species-name filters are resolved to species ids against
+the in-memory species catalog, and stat/IV ranges use the stored stat
+columns. SearchPlanTests in game.tests checks which index each one uses.
+"""
+import math
+
+from django.db.models import Q
+
+# Stored UserPokemon columns that can be range-filtered with
+# ?min_<key>= and ?max_<key>=
+STAT_FIELDS = {
+    'level': 'level',
+    'iv': 'iv_total',
+    'total': 'total_stats',
+    'hp': 'max_hp',
+    'attack': 'attack_stat',
+    'defense': 'defense_stat',
+    'sp_attack': 'sp_attack_stat',
+    'sp_defense': 'sp_defense_stat',
+    'speed': 'speed_stat',
+}
+
+# ?sort= values, highest first except for names
+SORTS = {
+    'caught_at': '-caught_at',
+    'name': 'species__name',
+    **{key: f'-{field}' for key, field in STAT_FIELDS.items()},
+}
+
+# Query parameters that narrow the collection (as opposed to sorting or paging it)
+FILTER_PARAMS = frozenset(
+    ['type', 'rarity', 'shiny', 'favorite', 'q'] +
+    [f'{bound}_{key}' for key in STAT_FIELDS for bound in ('min', 'max')]
+)
+
+def _flag(value):
+    """'1'/'true'/'on' -> True, '0'/'false'/'off' -> False, anything else -> None"""
+    value = (value or '').lower()
+    if value in ('1', 'true', 'on', 'yes'):
+        return True
+    if value in ('0', 'false', 'off', 'no'):
+        return False
+    return None
+
+def _stat_bound(key, bound, value):
+    """A ?min_/?max_ value as a column value; IVs are given as a percentage"""
+    if key != 'iv':
+        return value
+    total = value * 186 / 100  # 186 = 31 * 6
+    return math.ceil(total) if bound == 'min' else math.floor(total)
+
+def search_pokemon(queryset, params, catalog):
+    """Narrow a UserPokemon queryset by the collection filters in `params`"""
+    species_ids = None
+    if params.get('type'):
+        species_ids = {s.id for s in catalog.of_type(params['type'])}
+    if params.get('rarity'):
+        of_rarity = {s.id for s in catalog.of_rarity(params['rarity'])}
+        species_ids = of_rarity if species_ids is None else species_ids & of_rarity
+    if species_ids is not None:
+        queryset = queryset.filter(species_id__in=species_ids)
+
+    # is_shiny=True is written as a bare "is_shiny" on SQLite, which can't
+    # use the (owner, is_shiny) index; IN (...) compares, so it can
+    shiny = _flag(params.get('shiny'))
+    if shiny is not None:
+        queryset = queryset.filter(is_shiny__in=[shiny])
+    favorite = _flag(params.get('favorite'))
+    if favorite is not None:
+        queryset = queryset.filter(is_favorite__in=[favorite])
+
+    for key, field in STAT_FIELDS.items():
+        for bound, lookup in (('min', 'gte'), ('max', 'lte')):
+            try:
+                value = int(params.get(f'{bound}_{key}', ''))
+            except ValueError:
+                continue
+            queryset = queryset.filter(**{f'{field}__{lookup}': _stat_bound(key, bound, value)})
+
+    # Name prefix: the nickname if there is one, else the species name
+    prefix = params.get('q', '').strip()
+    if prefix:
+        named = [s.id for s in catalog if s.name.lower().startswith(prefix.lower())]
+        queryset = queryset.filter(
+            Q(nickname__istartswith=prefix) | Q(nickname='', species_id__in=named)
+        )
+
+    return queryset
@@ -1,3 +1,1074 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import random
+import time
+import unittest
+from datetime import timedelta
+from functools import reduce
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models.signals import post_delete, pre_delete
+from django.test import (
+    AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+)
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import async_views, pvp, views
+from .archive import archive_battles
+from .battle_state import (
+    BATTLE_SESSION_KEY, battle_session_lock, new_wild_battle, pokemon_battle_lock, start_battle_session
+)
+from .catalog import CATALOG_VERSION_KEY, get_species_catalog
+from .encounters import ENCOUNTER_MAX_AGE, sign_encounter
+from .engine import (
+    COINS_PER_LEVEL, EXP_PER_LEVEL, PVP_MAX_TURNS, BattleState, Combatant, resolve_turn
+)
+from .export import EXPORT_COLUMNS
+from .evolution import evolve_all
+from .leveling import TRAINER_MAX_LEVEL, level_up
+from . import matchups, typechart
+from .models import (
+    Battle, BattleArchive, BattleEvent, PokemonSpecies, SpeciesMatchup, UserPokemon, UserProfile
+)
+from .pagination import keyset_page
+from .release import RAW_DELETE_RELATIONS, RELEASE_COINS_PER_LEVEL, bulk_release, releasable_pokemon
+from .search import SORTS as POKEMON_SORTS, search_pokemon
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+def make_species(pokedex_id, **fields):
+    stats = dict(base_hp=45, base_attack=49, base_defense=49, base_sp_attack=65,
+                 base_sp_defense=65, base_speed=45, type1='grass')
+    stats.update(fields)
+    return PokemonSpecies.objects.create(pokedex_id=pokedex_id, name=f'Species {pokedex_id}', **stats)
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class SpeciesCatalogTests(TestCase):
+    """Species changes reach the catalog, and other workers only once committed"""
+
+    def test_saved_species_reaches_catalog(self):
+        species = make_species(1)
+        self.assertEqual(get_species_catalog().get(species.id).name, 'Species 1')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            species.name = 'Bulbasaur'
+            species.save()
+        self.assertEqual(get_species_catalog().get(species.id).name, 'Bulbasaur')
+
+    def test_version_published_on_commit(self):
+        species = make_species(1)
+        version = cache.get(CATALOG_VERSION_KEY)
+        with self.captureOnCommitCallbacks() as callbacks:
+            species.name = 'Ivysaur'
+            species.save()
+            # Another worker would still rebuild from the committed rows
+            self.assertEqual(cache.get(CATALOG_VERSION_KEY), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.get(CATALOG_VERSION_KEY), version)
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class AttemptCatchTests(TestCase):
+    """Catches are resolved with conditional F() updates in one transaction"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user('ash', 'ash@example.com', 'pikachu')
+        # catch_rate 255 at level 1 is a sure catch; 0 never catches
+        self.sure = make_species(1, catch_rate=255)
+        self.never = make_species(2, catch_rate=0)
+        get_species_catalog()
+        UserProfile.objects.filter(user=self.user).update(pokeballs=10)
+
+    def profile(self):
+        return UserProfile.objects.get(user=self.user)
+
+    def request(self, species, throws=1, token=None):
+        """A catch request whose user (and cached profile) is loaded now"""
+        body = {'encounter': token or sign_encounter(self.user.id, species.id, 1), 'throws': throws}
+        request = self.factory.post('/catch/attempt/', json.dumps(body), content_type='application/json')
+        request.user = User.objects.select_related('userprofile').get(pk=self.user.pk)
+        return request
+
+    def catch(self, request):
+        return json.loads(views.attempt_catch(request).content)
+
+    def test_catch_query_count(self):
+        request = self.request(self.sure)
+        # Spend + count the catch, insert, counters, read back, and the
+        # savepoint around them
+        with self.assertNumQueries(6):
+            result = self.catch(request)
+        self.assertTrue(result['success'])
+
+    def test_catch_updates_profile(self):
+        result = self.catch(self.request(self.sure))
+        self.assertTrue(result['success'])
+        profile = self.profile()
+        self.assertEqual(profile.pokeballs, 9)
+        self.assertEqual(profile.daily_catches, 1)
+        self.assertEqual(profile.pokemon_count, 1)
+        self.assertEqual(profile.experience, 10)
+        self.assertEqual(UserPokemon.objects.filter(owner=self.user).count(), 1)
+
+    def test_concurrent_catches_keep_both_updates(self):
+        # Both requests hold the profile as it was before either ran
+        first, second = self.request(self.sure), self.request(self.sure)
+        self.assertTrue(self.catch(first)['success'])
+        self.assertTrue(self.catch(second)['success'])
+
+        profile = self.profile()
+        self.assertEqual(profile.pokeballs, 8)
+        self.assertEqual(profile.daily_catches, 2)
+        self.assertEqual(profile.pokemon_count, 2)
+        self.assertEqual(profile.experience, 20)
+
+    def test_balls_never_go_negative(self):
+        UserProfile.objects.filter(user=self.user).update(pokeballs=1)
+        first, second = self.request(self.never), self.request(self.never)
+        self.assertNotIn('Pokeballs', self.catch(first)['message'])
+        self.assertIn('Pokeballs', self.catch(second)['message'])
+        self.assertEqual(self.profile().pokeballs, 0)
+
+    def test_throws_limited_to_balls_in_database(self):
+        UserProfile.objects.filter(user=self.user).update(pokeballs=3)
+        request = self.request(self.never, throws=3)
+        UserProfile.objects.filter(user=self.user).update(pokeballs=1)
+        self.assertFalse(self.catch(request)['success'])
+        self.assertEqual(self.profile().pokeballs, 1)
+
+    def test_failed_insert_spends_nothing(self):
+        request = self.request(self.sure)
+        with mock.patch.object(UserPokemon.objects, 'create', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.catch(request)
+        profile = self.profile()
+        self.assertEqual((profile.pokeballs, profile.daily_catches, profile.experience), (10, 0, 0))
+
+    async def test_async_view_shares_the_transaction(self):
+        body = {'encounter': sign_encounter(self.user.id, self.sure.id, 1)}
+        request = AsyncRequestFactory().post('/catch/attempt/', json.dumps(body), content_type='application/json')
+        request.user = self.user
+
+        async def auser():
+            return self.user
+        request.auser = auser
+
+        with mock.patch.object(UserPokemon.objects, 'create', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                await async_views.attempt_catch(request)
+        profile = await UserProfile.objects.aget(user=self.user)
+        self.assertEqual((profile.pokeballs, profile.daily_catches), (10, 0))
+
+        # The same encounter can be thrown at again, and caught
+        result = json.loads((await async_views.attempt_catch(request)).content)
+        self.assertTrue(result['success'])
+        profile = await UserProfile.objects.aget(user=self.user)
+        self.assertEqual((profile.pokeballs, profile.pokemon_count), (9, 1))
+
+    def test_tampered_token_refused(self):
+        token = sign_encounter(self.user.id, self.never.id, 1)
+        payload, signature = token.rsplit(':', 1)
+        forged = sign_encounter(self.user.id, self.sure.id, 1).rsplit(':', 1)[0] + ':' + signature
+        for bad in (forged, payload + ':' + signature[::-1], 'not-a-token'):
+            with self.subTest(token=bad):
+                result = self.catch(self.request(self.sure, token=bad))
+                self.assertEqual(result['message'], 'No active encounter!')
+        self.assertEqual(self.profile().pokeballs, 10)
+
+    def test_other_trainers_token_refused(self):
+        other = User.objects.create_user('gary', 'gary@example.com', 'eevee')
+        token = sign_encounter(other.id, self.sure.id, 1)
+        result = self.catch(self.request(self.sure, token=token))
+        self.assertEqual(result['message'], 'No active encounter!')
+        self.assertEqual(self.profile().pokemon_count, 0)
+
+    def test_expired_token_refused(self):
+        token = sign_encounter(self.user.id, self.sure.id, 1)
+        later = time.time() + ENCOUNTER_MAX_AGE + 1
+        with mock.patch('django.core.signing.time.time', return_value=later):
+            result = self.catch(self.request(self.sure, token=token))
+        self.assertEqual(result['message'], 'Encounter expired!')
+        self.assertEqual(self.profile().pokeballs, 10)
+
+    def test_token_retried_after_miss_but_not_replayed_after_catch(self):
+        missed = sign_encounter(self.user.id, self.never.id, 1)
+        for _ in range(2):
+            result = self.catch(self.request(self.never, token=missed))
+            self.assertIn('broke free', result['message'])
+
+        caught = sign_encounter(self.user.id, self.sure.id, 1)
+        self.assertTrue(self.catch(self.request(self.sure, token=caught))['success'])
+        result = self.catch(self.request(self.sure, token=caught))
+        self.assertEqual(result['message'], 'This Pokemon is no longer here!')
+
+        profile = self.profile()
+        self.assertEqual((profile.pokeballs, profile.pokemon_count), (7, 1))
+
+    def test_daily_limit_enforced_at_catch_time(self):
+        limit = settings.DAILY_CATCH_LIMIT
+        UserProfile.objects.filter(user=self.user).update(daily_catches=limit - 1)
+        # Two encounters held at once, only one catch left today
+        first, second = self.request(self.sure), self.request(self.sure)
+        self.assertTrue(self.catch(first)['success'])
+        result = self.catch(second)
+        self.assertFalse(result['success'])
+        self.assertIn('daily catch limit', result['message'])
+
+        profile = self.profile()
+        self.assertEqual(profile.daily_catches, limit)
+        self.assertEqual(profile.pokemon_count, 1)
+        self.assertEqual(profile.pokeballs, 9)
+
+class ResolveTurnTests(SimpleTestCase):
+    """game.engine resolves turns without a database, repeatably for a seeded rng"""
+
+    def state(self, player_level=20, opponent_level=20):
+        base = (45, 49, 49, 65, 65, 45)
+        return BattleState(
+            Combatant.from_stats('Bulbasaur', player_level, ('grass', 'poison'), base, (31,) * 6),
+            Combatant.from_stats('Rattata', opponent_level, ('normal',), (30, 56, 35, 25, 35, 72)),
+        )
+
+    def play(self, state, seed, actions):
+        rng = random.Random(seed)
+        return [(event.message, event.payload) for action in actions for event in resolve_turn(state, action, rng)]
+
+    def test_seeded_turns_repeat(self):
+        first, second = self.state(), self.state()
+        events = self.play(first, 7, ['attack'] * 3)
+        self.assertEqual(events, self.play(second, 7, ['attack'] * 3))
+        self.assertEqual((first.player.hp, first.opponent.hp, first.turn),
+                         (second.player.hp, second.opponent.hp, second.turn))
+        self.assertNotEqual(events, self.play(self.state(), 8, ['attack'] * 3))
+
+    def test_flee(self):
+        state = self.state()
+        hp = (state.player.hp, state.opponent.hp)
+        self.assertEqual(self.play(state, 1, ['flee']), [("You fled from the battle!", {})])
+        self.assertEqual(state.status, 'fled')
+        self.assertEqual((state.player.hp, state.opponent.hp), hp)
+        # Nothing happens once the battle is over
+        self.assertEqual(self.play(state, 1, ['attack', 'auto']), [])
+
+    def test_unknown_action_changes_nothing(self):
+        state = self.state()
+        self.assertEqual(self.play(state, 1, ['dance', '']), [])
+        self.assertEqual((state.status, state.turn), ('ongoing', 0))
+
+    def test_win_pays_out(self):
+        state = self.state(player_level=60, opponent_level=3)
+        events = self.play(state, 3, ['auto'])
+        self.assertEqual(state.status, 'won')
+        self.assertEqual(state.opponent.hp, 0)
+        self.assertEqual(events[-3][0], "Wild Rattata fainted!")
+        self.assertEqual(events[-1][1], {'experience': 3 * EXP_PER_LEVEL, 'coins': 3 * COINS_PER_LEVEL})
+        self.assertEqual((state.experience_gained, state.coins_gained), (3 * EXP_PER_LEVEL, 3 * COINS_PER_LEVEL))
+
+    def test_player_faints(self):
+        state = self.state(player_level=2, opponent_level=60)
+        events = self.play(state, 3, ['attack'] * 5)
+        self.assertEqual(state.status, 'lost')
+        self.assertEqual(state.player.hp, 0)
+        self.assertEqual([message for message, _ in events[-2:]], ["Bulbasaur fainted!", "You lost the battle!"])
+        self.assertEqual((state.experience_gained, state.coins_gained), (0, 0))
+
+class TypeChartTests(SimpleTestCase):
+    """The vectorized type chart and damage agree with the scalar versions"""
+
+    def test_matchup_matrix_matches_best_attack(self):
+        # Every single and dual typing
+        typings = [
+            (t1, t2) for t1 in range(typechart.NO_TYPE) for t2 in range(typechart.NO_TYPE + 1) if t2 != t1
+        ]
+        type1, type2 = zip(*typings)
+        matrix = typechart.matchup_matrix(type1, type2).tolist()
+        for a, attacker in enumerate(typings):
+            self.assertEqual(matrix[a], [typechart.best_attack(attacker, defender)[1] for defender in typings])
+
+    def test_vectorized_damage_matches_scalar(self):
+        rng = np.random.default_rng(13)
+        n = 5000
+        level = rng.integers(1, 101, n)
+        attack = rng.integers(5, 400, n)
+        defense = rng.integers(5, 400, n)
+        multiplier = rng.choice([0, 0.25, 0.5, 1, 2, 4], n)
+        roll = rng.uniform(typechart.MIN_ROLL, 1.0, n)
+
+        vectorized = typechart.damage(level, attack, defense, multiplier, roll).tolist()
+        scalar = [
+            typechart.damage(*args)
+            for args in zip(level.tolist(), attack.tolist(), defense.tolist(), multiplier.tolist(), roll.tolist())
+        ]
+        self.assertEqual(vectorized, scalar)
+        self.assertIn(0, scalar)
+        self.assertIn(1, scalar)
+
+class LevelUpTests(SimpleTestCase):
+    """The level_up() tables agree with levelling up one level at a time"""
+
+    def brute_force(self, level, experience):
+        needed = sum(1000 * step for step in range(1, level))
+        new_level = level
+        coins = balls = 0
+        while new_level < TRAINER_MAX_LEVEL and experience >= needed + 1000 * new_level:
+            needed += 1000 * new_level
+            new_level += 1
+            coins += new_level * 100
+            balls += 5
+        return new_level, coins, balls
+
+    def samples(self, count=2000):
+        rng = random.Random(25)
+        for _ in range(count):
+            level = rng.randint(1, TRAINER_MAX_LEVEL)
+            floor = 500 * level * (level - 1)
+            yield level, floor + rng.choice([0, 1, 999, rng.randint(0, 6_000_000)])
+
+    def test_matches_brute_force(self):
+        for level, experience in self.samples():
+            with self.subTest(level=level, experience=experience):
+                self.assertEqual(level_up(level, experience), self.brute_force(level, experience))
+
+    def test_two_grants_pay_like_one(self):
+        rng = random.Random(26)
+        for level, experience in self.samples():
+            grant = rng.randint(0, 200_000)
+            with self.subTest(level=level, experience=experience, grant=grant):
+                middle, coins, balls = level_up(level, experience)
+                final, more_coins, more_balls = level_up(middle, experience + grant)
+                self.assertEqual((final, coins + more_coins, balls + more_balls),
+                                 level_up(level, experience + grant))
+
+class SimulateMatchupsTests(TestCase):
+    """simulate_matchups replaces a level's rows, writing only after simulating"""
+
+    def test_replaces_rows_after_simulating(self):
+        species = [make_species(1), make_species(2, type1='fire'), make_species(3, type1='water')]
+        SpeciesMatchup.objects.create(species=species[0], opponent=species[1], level=5, battles=1, wins=1)
+        kept = SpeciesMatchup.objects.create(species=species[0], opponent=species[1], level=7, battles=1, wins=0)
+        get_species_catalog()
+
+        # Savepoint depth while simulating and while writing; the test
+        # itself runs in one
+        depths = {}
+        simulate_chunk = matchups.simulate_chunk
+        def simulate(task):
+            depths['simulate'] = len(connection.savepoint_ids)
+            return simulate_chunk(task)
+        bulk_create = SpeciesMatchup.objects.bulk_create
+        def write(objs, *args, **kwargs):
+            depths['write'] = len(connection.savepoint_ids)
+            return bulk_create(objs, *args, **kwargs)
+
+        with mock.patch.object(matchups, 'simulate_chunk', simulate), \
+                mock.patch.object(SpeciesMatchup.objects, 'bulk_create', write):
+            call_command('simulate_matchups', levels='5', battles=4, workers=1, seed=1, stdout=io.StringIO())
+
+        self.assertEqual(depths['write'], depths['simulate'] + 1)
+        rows = SpeciesMatchup.objects.filter(level=5)
+        self.assertEqual(rows.count(), 3 * 2)
+        self.assertTrue(all(row.battles == 4 and row.species_id != row.opponent_id for row in rows))
+        self.assertTrue(SpeciesMatchup.objects.filter(id=kept.id).exists())
+
+class CollectionCounterTests(TestCase):
+    """UserProfile collection counters follow catches and releases"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('misty', 'misty@example.com', 'staryu')
+
+    def counters(self):
+        return UserProfile.objects.values('pokemon_count', 'common_count', 'rare_count').get(user=self.user)
+
+    def test_counts_follow_catch_and_release(self):
+        pokemon = UserPokemon.objects.create(owner=self.user, species=make_species(1, rarity='rare'))
+        self.assertEqual(self.counters(), {'pokemon_count': 1, 'common_count': 0, 'rare_count': 1})
+        pokemon.delete()
+        self.assertEqual(self.counters(), {'pokemon_count': 0, 'common_count': 0, 'rare_count': 0})
+
+    def test_legacy_rarity_counts_towards_total_only(self):
+        # 'uncommon' predates RARITY_CHOICES and has no counter field
+        species = make_species(1, rarity='uncommon')
+        UserPokemon.objects.create(owner=self.user, species=species)
+        self.assertEqual(self.counters(), {'pokemon_count': 1, 'common_count': 0, 'rare_count': 0})
+
+        call_command('recount_collections', stdout=io.StringIO())
+        self.assertEqual(self.counters(), {'pokemon_count': 1, 'common_count': 0, 'rare_count': 0})
+
+class RawDeleteTests(TestCase):
+    """Bulk release and archiving may skip the delete collector"""
+
+    def test_every_relation_is_handled(self):
+        # A new FK (or delete signal) on these models needs handling in
+        # bulk_release()/archive_battles() before their _raw_delete() calls
+        for model, handled in RAW_DELETE_RELATIONS.items():
+            with self.subTest(model=model.__name__):
+                relations = {
+                    (field.related_model, field.field.name)
+                    for field in model._meta.get_fields(include_hidden=True)
+                    if field.auto_created and not field.concrete
+                }
+                self.assertEqual(relations, handled)
+        for model in (Battle, BattleEvent):
+            self.assertFalse(pre_delete.has_listeners(model) or post_delete.has_listeners(model))
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class BulkReleaseTests(TestCase):
+    """bulk_release() refunds, recounts and leaves nothing pointing at released rows"""
+
+    COUNTERS = ('pokemon_count', 'shiny_count', 'common_count', 'rare_count')
+
+    def setUp(self):
+        cache.clear()
+        self.common, self.rare = make_species(1), make_species(2, rarity='rare')
+        self.users = [User.objects.create_user('bill'), User.objects.create_user('celio')]
+
+    def catch(self, owner, species, level, battles=0):
+        pokemon = UserPokemon.objects.create(owner=owner, species=species, level=level)
+        for status in ('won', 'lost')[:battles]:
+            battle = Battle(trainer=owner, player_pokemon=pokemon, opponent_pokemon=species, status=status)
+            battle.add_to_log('A wild Pokemon appeared!')
+            battle.add_to_log('It fainted!', damage=12)
+            battle.save()
+        return pokemon
+
+    def counters(self, user):
+        return UserProfile.objects.values(*self.COUNTERS).get(user=user)
+
+    def test_release_cleans_up_and_refunds(self):
+        bill, celio = self.users
+        released = [
+            self.catch(bill, self.common, 10, battles=2),
+            self.catch(bill, self.rare, 20, battles=1),
+            self.catch(bill, self.common, 7),
+            self.catch(celio, self.rare, 15, battles=2),
+        ]
+        kept = self.catch(bill, self.rare, 30, battles=2)
+        UserPokemon.objects.update(is_shiny=False)
+        UserPokemon.objects.filter(id=released[2].id).update(is_shiny=True)
+        call_command('recount_collections', stdout=io.StringIO())
+
+        # An archived battle outlives its Pokemon
+        archived = Battle.objects.filter(player_pokemon=released[0]).first()
+        BattleArchive.from_battle(archived, archived.events.all()).save()
+        Battle.objects.filter(id=archived.id).delete()
+        released_battles = list(Battle.objects.filter(player_pokemon__in=released).values_list('id', flat=True))
+        coins = {user: UserProfile.objects.get(user=user).coins for user in self.users}
+
+        result = bulk_release(UserPokemon.objects.filter(id__in=[p.id for p in released]), batch_size=3)
+
+        self.assertEqual(result, (4, (10 + 20 + 7 + 15) * RELEASE_COINS_PER_LEVEL))
+        self.assertEqual(UserProfile.objects.get(user=bill).coins - coins[bill], 37 * RELEASE_COINS_PER_LEVEL)
+        self.assertEqual(UserProfile.objects.get(user=celio).coins - coins[celio], 15 * RELEASE_COINS_PER_LEVEL)
+        self.assertEqual(self.counters(bill), {'pokemon_count': 1, 'shiny_count': 0, 'common_count': 0, 'rare_count': 1})
+        self.assertEqual(self.counters(celio), {'pokemon_count': 0, 'shiny_count': 0, 'common_count': 0, 'rare_count': 0})
+
+        self.assertEqual(list(UserPokemon.objects.values_list('id', flat=True)), [kept.id])
+        self.assertFalse(Battle.objects.filter(id__in=released_battles).exists())
+        self.assertFalse(BattleEvent.objects.filter(battle_id__in=released_battles).exists())
+        self.assertEqual(Battle.objects.filter(player_pokemon=kept).count(), 2)
+        self.assertEqual(BattleEvent.objects.count(), 4)
+        self.assertIsNone(BattleArchive.objects.get(id=archived.id).player_pokemon_id)
+
+        # The counters agree with a full recount
+        before = [self.counters(user) for user in self.users]
+        call_command('recount_collections', stdout=io.StringIO())
+        self.assertEqual([self.counters(user) for user in self.users], before)
+
+class HealTests(TestCase):
+    """UserPokemon.heal_many() heals like heal() on each Pokemon"""
+
+    def test_heal_many_matches_heal(self):
+        species = make_species(1)
+        owners = [User.objects.create_user(name) for name in ('joy', 'chansey')]
+        # Same IVs for both trainers' copies
+        with mock.patch('game.models.random.randint', return_value=17):
+            for owner in owners:
+                for level, hp in ((5, 0), (20, 7), (50, None), (100, 1)):
+                    pokemon = UserPokemon.objects.create(owner=owner, species=species, level=level)
+                    if hp is not None:
+                        UserPokemon.objects.filter(id=pokemon.id).update(current_hp=hp)
+
+        healed = UserPokemon.heal_many(UserPokemon.objects.filter(owner=owners[0]))
+        for pokemon in UserPokemon.objects.filter(owner=owners[1]):
+            pokemon.heal()
+
+        self.assertEqual(healed, 3)
+        hp = [
+            list(UserPokemon.objects.filter(owner=owner).order_by('level').values_list('level', 'current_hp', 'max_hp'))
+            for owner in owners
+        ]
+        self.assertEqual(hp[0], hp[1])
+        self.assertTrue(all(current == max_hp for _, current, max_hp in hp[0]))
+
+class EvolveAllTests(TestCase):
+    """evolve_all() evolves like UserPokemon.evolve() on each Pokemon"""
+
+    def setUp(self):
+        # Two chains: 1 -> 2 -> 3, and 4 -> 5
+        first = make_species(1, evolution_level=16)
+        second = make_species(2, evolves_from=first, evolution_level=36, base_attack=80)
+        make_species(3, evolves_from=second, rarity='rare', base_attack=110, base_hp=80)
+        other = make_species(4, evolution_level=20, rarity='rare')
+        make_species(5, evolves_from=other, rarity='legendary', base_speed=100)
+        get_species_catalog()
+
+        self.owners = [User.objects.create_user(name) for name in ('oak', 'elm')]
+        species = {s.pokedex_id: s for s in PokemonSpecies.objects.all()}
+        with mock.patch('game.models.random.randint', return_value=21):
+            for owner in self.owners:
+                for pokedex_id, level in ((1, 40), (1, 10), (2, 36), (2, 20), (3, 50), (4, 20)):
+                    UserPokemon.objects.create(owner=owner, species=species[pokedex_id], level=level)
+
+    def collection(self, owner):
+        fields = ['species__pokedex_id', 'level', *UserPokemon.STAT_FIELDS]
+        return sorted(UserPokemon.objects.filter(owner=owner).values_list(*fields))
+
+    def counters(self, owner):
+        return UserProfile.objects.values(
+            'pokemon_count', 'common_count', 'rare_count', 'legendary_count'
+        ).get(user=owner)
+
+    def test_matches_evolve(self):
+        # A count and an UPDATE for each of the two depths, one counter
+        # update for the trainer, and the savepoint around them
+        with self.assertNumQueries(2 * 2 + 1 + 2):
+            evolved = evolve_all(UserPokemon.objects.filter(owner=self.owners[0]))
+        for pokemon in UserPokemon.objects.filter(owner=self.owners[1]).select_related('species'):
+            pokemon.evolve()
+
+        self.assertEqual(evolved, 3)
+        self.assertEqual(self.collection(self.owners[0]), self.collection(self.owners[1]))
+        self.assertEqual(self.counters(self.owners[0]), self.counters(self.owners[1]))
+        # The level 40 first stage evolved once, not twice
+        self.assertEqual(
+            UserPokemon.objects.filter(owner=self.owners[0], level=40).get().species.pokedex_id, 2
+        )
+
+class MoveBattleLogsMigrationTests(TransactionTestCase):
+    """0005 moves JSON battle logs into BattleEvent rows, in order"""
+
+    before = [('game', '0004_battleevent')]
+    after = [('game', '0005_move_battle_logs')]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.before)
+
+    def tearDown(self):
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.executor.loader.graph.leaf_nodes())
+
+    def test_logs_become_events(self):
+        apps = self.executor.loader.project_state(self.before).apps
+        user = apps.get_model('auth', 'User').objects.create(username='surge')
+        species = apps.get_model('game', 'PokemonSpecies').objects.create(
+            pokedex_id=1, name='Voltorb', type1='electric', base_hp=40, base_attack=30,
+            base_defense=50, base_sp_attack=55, base_sp_defense=55, base_speed=100,
+        )
+        pokemon = apps.get_model('game', 'UserPokemon').objects.create(owner=user, species=species, current_hp=20)
+        log = [
+            {'turn': i // 2, 'message': f'Event {i}', 'timestamp': f'2025-01-01T00:00:{i % 60:02d}'}
+            for i in range(70)
+        ]
+        Battle = apps.get_model('game', 'Battle')
+        battle = Battle.objects.create(
+            trainer=user, player_pokemon=pokemon, opponent_pokemon=species,
+            battle_type='wild', status='won', battle_log=json.dumps(log),
+        )
+        empty = Battle.objects.create(
+            trainer=user, player_pokemon=pokemon, opponent_pokemon=species, battle_type='wild', battle_log='[]',
+        )
+
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.after)
+        apps = self.executor.loader.project_state(self.after).apps
+        BattleEvent = apps.get_model('game', 'BattleEvent')
+
+        events = BattleEvent.objects.filter(battle_id=battle.id).order_by('seq')
+        self.assertEqual(
+            [(e.seq, e.turn, e.message, e.payload['timestamp']) for e in events],
+            [(seq, entry['turn'], entry['message'], entry['timestamp']) for seq, entry in enumerate(log)],
+        )
+        self.assertEqual(apps.get_model('game', 'Battle').objects.get(id=battle.id).event_count, 70)
+        self.assertFalse(BattleEvent.objects.filter(battle_id=empty.id).exists())
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class BattleLogTailTests(TestCase):
+    """A battle page only reads the tail of a long log"""
+
+    def test_finished_battle_shows_tail(self):
+        user = User.objects.create_user('sabrina', 'sabrina@example.com', 'abra')
+        species = make_species(1)
+        pokemon = UserPokemon.objects.create(owner=user, species=species, level=30)
+        battle = Battle(trainer=user, player_pokemon=pokemon, opponent_pokemon=species,
+                        opponent_level=5, status='won')
+        battle.save()
+        for i in range(Battle.LOG_TAIL + 20):
+            battle.turns = i
+            battle.add_to_log(f'Event {i}')
+        battle.save()
+
+        self.client.force_login(user)
+        response = self.client.get(f'/battle/{battle.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [event.message for event in response.context['battle_log']],
+            [f'Event {i}' for i in range(20, Battle.LOG_TAIL + 20)],
+        )
+        self.assertContains(response, f'Event {Battle.LOG_TAIL + 19}')
+        self.assertNotContains(response, 'Event 19\n')
+
+class ArchiveBattlesTests(TestCase):
+    """Old finished battles move to the archive with their logs intact"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('blaine', 'blaine@example.com', 'ponyta')
+        self.species = make_species(1)
+        self.pokemon = UserPokemon.objects.create(owner=self.user, species=self.species, level=40)
+
+    def battle(self, status, events=3, days_old=60):
+        battle = Battle(trainer=self.user, player_pokemon=self.pokemon, opponent_pokemon=self.species,
+                        opponent_level=12, status=status)
+        battle.save()
+        for i in range(events):
+            battle.turns = i + 1
+            battle.add_to_log(f'Turn {i + 1}: Pokémon «{status}» used Ember!', damage=i * 7, moves=['ember', None])
+        battle.save()
+        Battle.objects.filter(id=battle.id).update(updated_at=battle.updated_at - timedelta(days=days_old))
+        return Battle.objects.get(id=battle.id)
+
+    def test_archives_old_finished_battles_only(self):
+        won, lost, fled = self.battle('won'), self.battle('lost', events=0), self.battle('fled', events=5)
+        ongoing = self.battle('ongoing')
+        recent = self.battle('won', days_old=1)
+        logs = {
+            battle.id: [{'turn': e.turn, 'message': e.message, 'payload': e.payload} for e in battle.events.all()]
+            for battle in (won, lost, fled)
+        }
+
+        batches = list(archive_battles(timedelta(days=30), batch_size=2))
+
+        self.assertEqual([(battles, events) for battles, events, _ in batches], [(2, 3), (1, 5)])
+        self.assertEqual(set(Battle.objects.values_list('id', flat=True)), {ongoing.id, recent.id})
+        self.assertEqual(BattleEvent.objects.filter(battle=ongoing).count(), 3)
+        self.assertFalse(BattleEvent.objects.exclude(battle__in=[ongoing, recent]).exists())
+        for battle in (won, lost, fled):
+            with self.subTest(status=battle.status):
+                archive = BattleArchive.objects.get(id=battle.id)
+                self.assertEqual(archive.events, logs[battle.id])
+                self.assertEqual(
+                    (archive.status, archive.player_pokemon_id, archive.turns, archive.finished_at),
+                    (battle.status, self.pokemon.id, battle.turns, battle.updated_at),
+                )
+
+        # Nothing left to do on a second run
+        self.assertEqual(list(archive_battles(timedelta(days=30))), [])
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'SQLite plans')
+    def test_ongoing_lookup_uses_partial_index(self):
+        plan = Battle.objects.filter(player_pokemon=self.pokemon, status='ongoing').explain()
+        self.assertIn('battle_ongoing_pokemon_idx', plan)
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class AutoBattleTests(TestCase):
+    """Auto-battle runs pay out once per battle and keep every HP drain"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('erika', 'erika@example.com', 'tangela')
+        for pokedex_id in range(1, 4):
+            make_species(pokedex_id)
+        get_species_catalog()
+        self.pokemon = UserPokemon.objects.create(owner=self.user, species=make_species(4, base_hp=200), level=5)
+        self.client.force_login(self.user)
+
+    def run_battles(self, count=3, pokemon=None):
+        body = {'pokemon_id': (pokemon or self.pokemon).id, 'count': count}
+        return self.client.post('/battle/auto/', json.dumps(body), content_type='application/json')
+
+    def test_rewards_and_hp(self):
+        before = UserProfile.objects.get(user=self.user)
+        summary = self.run_battles().json()['summary']
+
+        after = UserProfile.objects.get(user=self.user)
+        pokemon = UserPokemon.objects.get(id=self.pokemon.id)
+        self.assertEqual(Battle.objects.filter(player_pokemon=pokemon).count(), summary['battles'])
+        self.assertEqual(pokemon.current_hp, summary['pokemon_hp'])
+        self.assertEqual(pokemon.battles_won, summary['won'])
+        self.assertEqual(after.experience - before.experience, summary['experience'])
+        self.assertEqual(after.coins - before.coins, summary['coins'])
+        self.assertEqual(after.battles_won - before.battles_won, summary['won'])
+
+    def test_busy_pokemon_is_refused(self):
+        with mock.patch.object(views, 'BATTLE_LOCK_WAIT', 0), pokemon_battle_lock(self.pokemon.id):
+            response = self.run_battles()
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Battle.objects.exists())
+
+    def test_refusals(self):
+        other = User.objects.create_user('koga', 'koga@example.com', 'venonat')
+        theirs = UserPokemon.objects.create(owner=other, species=self.pokemon.species)
+        fainted = UserPokemon.objects.create(owner=self.user, species=self.pokemon.species)
+        UserPokemon.objects.filter(id=fainted.id).update(current_hp=0)
+        battling = UserPokemon.objects.create(owner=self.user, species=self.pokemon.species)
+        new_wild_battle(self.user, battling, get_species_catalog()).save()
+        in_pvp = UserPokemon.objects.create(owner=self.user, species=self.pokemon.species)
+        cache.set(pvp.PVP_TRAINER_KEY.format(self.user.id), in_pvp.id)
+
+        for pokemon, message in ((theirs, 'Choose a Pokemon'), (fainted, 'fainted'),
+                                 (battling, 'already in a battle'), (in_pvp, 'PvP battle')):
+            with self.subTest(message=message):
+                result = self.run_battles(pokemon=pokemon).json()
+                self.assertFalse(result['success'])
+                self.assertIn(message, result['message'])
+        self.assertEqual(Battle.objects.count(), 1)
+        self.assertEqual(UserProfile.objects.get(user=self.user).coins,
+                         UserProfile._meta.get_field('coins').default)
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class BattleSessionLockTests(TestCase):
+    """Turns on a cached battle are played one request at a time"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('brock', 'brock@example.com', 'onix')
+        species = make_species(1)
+        pokemon = UserPokemon.objects.create(owner=self.user, species=species, level=50)
+        self.battle = new_wild_battle(self.user, pokemon, get_species_catalog())
+        self.battle.save()
+        start_battle_session(self.battle)
+        self.client.force_login(self.user)
+        self.url = f'/battle/{self.battle.id}/action/'
+
+    def session(self):
+        return cache.get(BATTLE_SESSION_KEY.format(self.battle.id))
+
+    def test_busy_battle_is_refused(self):
+        with mock.patch.object(views, 'BATTLE_LOCK_WAIT', 0), battle_session_lock(self.battle.id):
+            response = self.client.post(self.url, {'action': 'attack'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.session().battle.turns, 0)
+
+    def test_pokemon_fights_one_battle_at_a_time(self):
+        pokemon = self.battle.player_pokemon
+        response = self.client.post('/battle/', {'pokemon_id': pokemon.id})
+        self.assertRedirects(response, f'/battle/{self.battle.id}/', fetch_redirect_response=False)
+        self.assertEqual(Battle.objects.filter(player_pokemon=pokemon).count(), 1)
+
+        # Once the first battle is over the Pokemon can start another, but
+        # not while another request is starting one
+        Battle.objects.filter(id=self.battle.id).update(status='fled')
+        with mock.patch.object(views, 'BATTLE_LOCK_WAIT', 0), pokemon_battle_lock(pokemon.id):
+            self.client.post('/battle/', {'pokemon_id': pokemon.id})
+        self.assertFalse(Battle.objects.filter(player_pokemon=pokemon, status='ongoing').exists())
+        self.client.post('/battle/', {'pokemon_id': pokemon.id})
+        self.assertEqual(Battle.objects.filter(player_pokemon=pokemon, status='ongoing').count(), 1)
+
+    def test_repeated_actions_build_on_each_other(self):
+        for turns in range(1, 200):
+            self.client.post(self.url, {'action': 'attack'})
+            session = self.session()
+            if session is None:
+                break
+            self.assertEqual(session.battle.turns, turns)
+
+        # The finished battle was written once, with every event numbered once
+        battle = Battle.objects.get(id=self.battle.id)
+        self.assertNotEqual(battle.status, 'ongoing')
+        seqs = list(BattleEvent.objects.filter(battle=battle).values_list('seq', flat=True))
+        self.assertEqual(len(seqs), len(set(seqs)))
+        response = self.client.post(self.url, {'action': 'attack'})
+        self.assertEqual(response.json(), {'error': 'Battle is not ongoing'})
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class PvpRoomTests(TestCase):
+    """PvP rooms always end, and hold their Pokemon until they do"""
+
+    def setUp(self):
+        cache.clear()
+        self.layer = pvp.InProcessChannelLayer()
+        # Normal and Ghost can't hurt each other
+        normal = make_species(1, type1='normal')
+        ghost = make_species(2, type1='ghost')
+        self.users = [
+            User.objects.create_user('red', 'red@example.com', 'pikachu'),
+            User.objects.create_user('blue', 'blue@example.com', 'eevee'),
+        ]
+        self.pokemon = [
+            UserPokemon.objects.create(owner=self.users[0], species=normal, level=20),
+            UserPokemon.objects.create(owner=self.users[1], species=ghost, level=20),
+        ]
+
+    async def players(self):
+        return [
+            await pvp._load_player(user, {'query_string': f'pokemon={pokemon.id}'.encode()})
+            for user, pokemon in zip(self.users, self.pokemon)
+        ]
+
+    async def start(self, room):
+        updates = await self.layer.subscribe(pvp.ROOM_OUT_GROUP.format(room.id))
+        for player in await self.players():
+            await room.join(player)
+        return updates
+
+    def messages(self, updates, kind):
+        found = []
+        while not updates.queue.empty():
+            message = updates.queue.get_nowait()
+            if message['type'] == kind:
+                found.append(message)
+        return found
+
+    async def test_immune_pokemon_draw_at_turn_cap(self):
+        room = pvp.Room('draw', self.layer)
+        updates = await self.start(room)
+        while not room.finished:
+            for user in self.users:
+                await room.act(user.id, 'attack')
+
+        self.assertEqual(room.turn, PVP_MAX_TURNS)
+        finished, = self.messages(updates, 'finished')
+        self.assertEqual(finished, {'type': 'finished', 'winner': None, 'saved': True})
+        statuses = [battle.status async for battle in Battle.objects.filter(battle_type='trainer')]
+        self.assertEqual(statuses, ['fled', 'fled'])
+
+    async def test_failed_save_still_finishes_room(self):
+        room = pvp.Room('broken', self.layer)
+        updates = await self.start(room)
+        with mock.patch.object(pvp, 'record_pvp_battle', side_effect=DatabaseError), \
+                self.assertLogs(pvp.logger, 'ERROR'):
+            await room.act(self.users[0].id, 'forfeit')
+
+        self.assertTrue(room.finished)
+        finished, = self.messages(updates, 'finished')
+        self.assertEqual(finished, {'type': 'finished', 'winner': self.users[1].id, 'saved': False})
+
+    async def test_room_releases_reservation_when_done(self):
+        player = (await self.players())[0]
+        self.assertTrue(await pvp._reserve_pokemon(player))
+        self.assertFalse(await pvp._reserve_pokemon(player))
+
+        registry = pvp.RoomRegistry()
+        await registry.ensure('lonely', self.layer)
+        group = pvp.ROOM_GROUP.format('lonely')
+        await self.layer.publish(group, {'type': 'join', 'player': player})
+        await self.layer.publish(group, {'type': 'leave', 'user_id': player['user_id']})
+        for _ in range(100):
+            if 'lonely' not in registry.rooms:
+                break
+            await asyncio.sleep(0.01)
+        self.assertIsNone(await cache.aget(pvp.PVP_TRAINER_KEY.format(player['user_id'])))
+
+    async def connect(self, user, pokemon, room_id, registry):
+        """Run one socket until it closes or `disconnect` is set"""
+        disconnect = asyncio.Event()
+        sent = []
+
+        async def receive():
+            if not sent:
+                return {'type': 'websocket.connect'}
+            await disconnect.wait()
+            return {'type': 'websocket.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'path': f'/ws/pvp/{room_id}/', 'query_string': f'pokemon={pokemon.id}'.encode()}
+        with mock.patch.object(pvp, '_authenticate', mock.AsyncMock(return_value=user)), \
+                mock.patch.object(pvp, 'get_channel_layer', return_value=self.layer), \
+                mock.patch.object(pvp, 'rooms', registry):
+            task = asyncio.create_task(pvp.websocket_application(scope, receive, send))
+            await asyncio.sleep(0.05)
+        return task, disconnect, sent
+
+    @override_settings(PVP_JOIN_ACK_SECONDS=0.01)
+    async def test_unanswered_join_closes_and_releases(self):
+        # A room claimed by a process that is gone
+        await cache.aset(pvp.ROOM_OWNER_KEY.format('stale'), 'gone', pvp.ROOM_OWNER_TTL)
+        user, pokemon = self.users[0], self.pokemon[0]
+        task, _, sent = await self.connect(user, pokemon, 'stale', pvp.RoomRegistry())
+        await asyncio.wait_for(task, 1)
+
+        self.assertEqual(sent[-1], {'type': 'websocket.close', 'code': pvp.CLOSE_UNAVAILABLE})
+        self.assertIsNone(await cache.aget(pvp.PVP_TRAINER_KEY.format(user.id)))
+
+    async def test_joined_room_holds_reservation(self):
+        registry = pvp.RoomRegistry()
+        user, pokemon = self.users[0], self.pokemon[0]
+        task, disconnect, sent = await self.connect(user, pokemon, 'arena', registry)
+
+        waiting = json.loads(sent[-1]['text'])
+        self.assertEqual(waiting, {'type': 'waiting', 'room': 'arena', 'user_id': user.id})
+        self.assertEqual(await cache.aget(pvp.PVP_TRAINER_KEY.format(user.id)), pokemon.id)
+
+        disconnect.set()
+        await asyncio.wait_for(task, 1)
+        for _ in range(100):
+            if 'arena' not in registry.rooms:
+                break
+            await asyncio.sleep(0.01)
+        self.assertIsNone(await cache.aget(pvp.PVP_TRAINER_KEY.format(user.id)))
+
+    def test_reserved_pokemon_left_alone(self):
+        user, pokemon = self.users[0], self.pokemon[0]
+        UserPokemon.objects.filter(id=pokemon.id).update(current_hp=1)
+        cache.set(pvp.PVP_TRAINER_KEY.format(user.id), pokemon.id)
+
+        self.assertFalse(releasable_pokemon(user).filter(id=pokemon.id).exists())
+        self.client.force_login(user)
+        self.client.post('/pokemon/heal/')
+        self.assertEqual(UserPokemon.objects.get(id=pokemon.id).current_hp, 1)
+        self.client.post('/battle/', {'pokemon_id': pokemon.id})
+        self.assertFalse(Battle.objects.filter(player_pokemon=pokemon).exists())
+
+class KeysetPageTests(TestCase):
+    """Walking every sort's pages visits each Pokemon once, one query a page"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('whitney', 'whitney@example.com', 'miltank')
+        species = [make_species(1), make_species(2, base_attack=80), make_species(3, base_speed=90)]
+        now = timezone.now()
+        # Few distinct values per column, so every sort has long runs of ties
+        with mock.patch('game.models.random.randint', return_value=15):
+            for i in range(23):
+                pokemon = UserPokemon.objects.create(owner=self.user, species=species[i % 3], level=(5, 10)[i % 2])
+                UserPokemon.objects.filter(id=pokemon.id).update(caught_at=now - timedelta(days=i % 4))
+
+    def test_pages_cover_every_row_once(self):
+        pokemon = UserPokemon.objects.filter(owner=self.user).select_related('species')
+        for sort, ordering in POKEMON_SORTS.items():
+            with self.subTest(sort=sort):
+                pk_ordering = '-pk' if ordering.startswith('-') else 'pk'
+                expected = list(pokemon.order_by(ordering, pk_ordering).values_list('pk', flat=True))
+                seen, cursor = [], None
+                while True:
+                    with self.assertNumQueries(1):
+                        rows, cursor = keyset_page(pokemon, ordering, cursor, page_size=4)
+                    seen.extend(row.pk for row in rows)
+                    if cursor is None:
+                        break
+                self.assertEqual(seen, expected)
+
+    def test_bad_cursor_starts_over(self):
+        pokemon = UserPokemon.objects.filter(owner=self.user)
+        first, cursor = keyset_page(pokemon, '-level', page_size=4)
+        self.assertEqual(keyset_page(pokemon, '-level', cursor + 'x', page_size=4)[0], first)
+
+class ExportTests(TestCase):
+    """Both export formats stream exactly the trainer's (filtered) rows"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('janine', 'janine@example.com', 'venomoth')
+        other = User.objects.create_user('koga', 'koga@example.com', 'weezing')
+        bug = make_species(1, type1='bug', type2='poison')
+        grass = make_species(2)
+        self.pokemon = [
+            UserPokemon.objects.create(owner=self.user, species=bug, level=12, nickname='Fuzzy, "the" Moth'),
+            UserPokemon.objects.create(owner=self.user, species=grass, level=30, nickname='Pétale\nTwo'),
+            UserPokemon.objects.create(owner=self.user, species=grass, level=3),
+        ]
+        UserPokemon.objects.create(owner=other, species=bug, level=50)
+        # save() rolls shininess itself; NDJSON timestamps carry milliseconds
+        UserPokemon.objects.filter(id=self.pokemon[1].id).update(is_shiny=True)
+        UserPokemon.objects.update(caught_at=timezone.now().replace(microsecond=123000))
+        self.client.force_login(self.user)
+
+    def expected(self, pokemon):
+        return [
+            {name: reduce(getattr, lookup.split('__'), p) for name, lookup in EXPORT_COLUMNS}
+            for p in UserPokemon.objects.filter(id__in=[p.id for p in pokemon]).order_by('id')
+        ]
+
+    def export(self, export_format, **params):
+        response = self.client.get('/pokemon/export/', {'format': export_format, **params})
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson_matches_rows(self):
+        response, body = self.export('ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="pokemon-{self.user.pk}.ndjson"')
+
+        rows = [json.loads(line) for line in body.splitlines()]
+        for row in rows:
+            row['caught_at'] = parse_datetime(row['caught_at'])
+        self.assertEqual(rows, self.expected(self.pokemon))
+
+    def test_csv_matches_rows(self):
+        response, body = self.export('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="pokemon-{self.user.pk}.csv"')
+
+        header, *rows = csv.reader(io.StringIO(body, newline=''))
+        self.assertEqual(header, [name for name, _ in EXPORT_COLUMNS])
+        expected = [['' if value is None else str(value) for value in row.values()]
+                    for row in self.expected(self.pokemon)]
+        self.assertEqual(rows, expected)
+
+    def test_filters_and_bad_format(self):
+        _, body = self.export('ndjson', shiny='1')
+        self.assertEqual([json.loads(line)['id'] for line in body.splitlines()], [self.pokemon[1].id])
+        response = self.client.get('/pokemon/export/', {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+class SearchPlanTests(TestCase):
+    """
+    Common collection searches are served by the matching (owner, ...)
+    index. Any owner index avoids a full scan, so each case names the one
+    it should use.
+    """
+
+    # (filters, sort column, index); 'attack_stat' has no index of its own,
+    # so the filter has to pick one
+    PLANS = [
+        ({}, '-caught_at', 'pokemon_owner_caught_idx'),
+        ({}, '-level', 'pokemon_owner_level_idx'),
+        ({}, '-iv_total', 'pokemon_owner_iv_idx'),
+        ({}, '-total_stats', 'pokemon_owner_total_idx'),
+        ({'type': 'fire'}, '-attack_stat', 'pokemon_owner_species_idx'),
+        ({'rarity': 'rare'}, '-attack_stat', 'pokemon_owner_species_idx'),
+        ({'shiny': '1'}, '-attack_stat', 'pokemon_owner_shiny_idx'),
+        ({'favorite': '0'}, '-attack_stat', 'pokemon_owner_favorite_idx'),
+        ({'min_level': '10', 'max_level': '40'}, '-attack_stat', 'pokemon_owner_level_idx'),
+        ({'min_iv': '80'}, '-attack_stat', 'pokemon_owner_iv_idx'),
+        ({'min_total': '300'}, '-attack_stat', 'pokemon_owner_total_idx'),
+    ]
+
+    def setUp(self):
+        make_species(1, type1='fire', rarity='rare')
+        make_species(2)
+        self.catalog = get_species_catalog()
+
+    def plan(self, params, ordering):
+        pokemon = search_pokemon(UserPokemon.objects.filter(owner_id=1), params, self.catalog)
+        # Same shape as a keyset_page() query
+        return pokemon.order_by(ordering, '-pk')[:25].explain()
+
+    def check_plans(self, uses_index):
+        for params, ordering, index in self.PLANS:
+            with self.subTest(params=params, ordering=ordering):
+                plan = self.plan(params, ordering)
+                self.assertRegex(plan, uses_index.format(index=index))
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'SQLite plans')
+    def test_sqlite_plans(self):
+        self.check_plans(r'\bSEARCH game_userpokemon USING (COVERING )?INDEX {index}\b')
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'PostgreSQL plans')
+    def test_postgresql_plans(self):
+        # On a tiny table the planner rightly prefers a sequential scan, so
+        # ask which index it would use
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            self.check_plans(r'\bIndex (Only )?Scan (Backward )?using {index}\b')
@@ -0,0 +1,139 @@
+"""
+Type effectiveness and the damage formula.
+
+Type names are interned to small integer ids, and the chart is a dense
+NumPy matrix indexed [attacking type, defending type]. The extra NO_TYPE
+column (all 1.0) stands in for a missing second type, so a dual-type
+multiplier is always chart[t, type1] * chart[t, type2].
+
+damage() takes plain numbers for one live hit, or arrays when simulating
+many battles at once.
+"""
+import numpy as np
+
+TYPES = (
+    'normal', 'fire', 'water', 'electric', 'grass', 'ice',
+    'fighting', 'poison', 'ground', 'flying', 'psychic', 'bug',
+    'rock', 'ghost', 'dragon', 'dark', 'steel', 'fairy',
+)
+
+TYPE_IDS = {name: i for i, name in enumerate(TYPES)}
+
+# Id used for "no second type"; also what unknown type names map to
+NO_TYPE = len(TYPES)
+
+# Multipliers that differ from 1.0, as attacking type -> {defending type: x}
+_EFFECTIVENESS = {
+    'normal': {'rock': 0.5, 'ghost': 0, 'steel': 0.5},
+    'fire': {'fire': 0.5, 'water': 0.5, 'grass': 2, 'ice': 2, 'bug': 2,
+             'rock': 0.5, 'dragon': 0.5, 'steel': 2},
+    'water': {'fire': 2, 'water': 0.5, 'grass': 0.5, 'ground': 2, 'rock': 2,
+              'dragon': 0.5},
+    'electric': {'water': 2, 'electric': 0.5, 'grass': 0.5, 'ground': 0,
+                 'flying': 2, 'dragon': 0.5},
+    'grass': {'fire': 0.5, 'water': 2, 'grass': 0.5, 'poison': 0.5, 'ground': 2,
+              'flying': 0.5, 'bug': 0.5, 'rock': 2, 'dragon': 0.5, 'steel': 0.5},
+    'ice': {'fire': 0.5, 'water': 0.5, 'grass': 2, 'ice': 0.5, 'ground': 2,
+            'flying': 2, 'dragon': 2, 'steel': 0.5},
+    'fighting': {'normal': 2, 'ice': 2, 'poison': 0.5, 'flying': 0.5, 'psychic': 0.5,
+                 'bug': 0.5, 'rock': 2, 'ghost': 0, 'dark': 2, 'steel': 2, 'fairy': 0.5},
+    'poison': {'grass': 2, 'poison': 0.5, 'ground': 0.5, 'rock': 0.5, 'ghost': 0.5,
+               'steel': 0, 'fairy': 2},
+    'ground': {'fire': 2, 'electric': 2, 'grass': 0.5, 'poison': 2, 'flying': 0,
+               'bug': 0.5, 'rock': 2, 'steel': 2},
+    'flying': {'electric': 0.5, 'grass': 2, 'fighting': 2, 'bug': 2, 'rock': 0.5,
+               'steel': 0.5},
+    'psychic': {'fighting': 2, 'poison': 2, 'psychic': 0.5, 'dark': 0, 'steel': 0.5},
+    'bug': {'fire': 0.5, 'grass': 2, 'fighting': 0.5, 'poison': 0.5, 'flying': 0.5,
+            'psychic': 2, 'ghost': 0.5, 'dark': 2, 'steel': 0.5, 'fairy': 0.5},
+    'rock': {'fire': 2, 'ice': 2, 'fighting': 0.5, 'ground': 0.5, 'flying': 2,
+             'bug': 2, 'steel': 0.5},
+    'ghost': {'normal': 0, 'psychic': 2, 'ghost': 2, 'dark': 0.5},
+    'dragon': {'dragon': 2, 'steel': 0.5, 'fairy': 0},
+    'dark': {'fighting': 0.5, 'psychic': 2, 'ghost': 2, 'dark': 0.5, 'fairy': 0.5},
+    'steel': {'fire': 0.5, 'water': 0.5, 'electric': 0.5, 'ice': 2, 'rock': 2,
+              'steel': 0.5, 'fairy': 2},
+    'fairy': {'fire': 0.5, 'fighting': 2, 'poison': 0.5, 'dragon': 2, 'dark': 2,
+              'steel': 0.5},
+}
+
+def _build_chart():
+    chart = np.ones((NO_TYPE + 1, NO_TYPE + 1), dtype=np.float64)
+    for attacking, row in _EFFECTIVENESS.items():
+        for defending, multiplier in row.items():
+            chart[TYPE_IDS[attacking], TYPE_IDS[defending]] = multiplier
+    chart.setflags(write=False)
+    return chart
+
+TYPE_CHART = _build_chart()
+
+# Plain nested lists for scalar lookups, which are much faster than
+# indexing the array one element at a time
+_CHART_ROWS = TYPE_CHART.tolist()
+
+# Move power used for every attack; species have no movesets yet
+BASE_POWER = 60
+
+# Same-type attack bonus
+STAB = 1.5
+
+# Damage is scaled by a uniform roll in [MIN_ROLL, 1.0]
+MIN_ROLL = 0.85
+
+def type_id(name):
+    """Interned id for a type name (case-insensitive); NO_TYPE if unknown or empty"""
+    return TYPE_IDS.get((name or '').lower(), NO_TYPE)
+
+def type_ids(type1, type2=None):
+    """(type1, type2) ids for a species, with NO_TYPE for a missing second type"""
+    return type_id(type1), type_id(type2)
+
+def effectiveness(attack_type, defender_types):
+    """Multiplier for a move of `attack_type` against a (type1, type2) id pair"""
+    row = _CHART_ROWS[attack_type]
+    return row[defender_types[0]] * row[defender_types[1]]
+
+def best_attack(attacker_types, defender_types):
+    """
+    The attacker's best STAB type against the defender.
+
+    Returns (type id, multiplier). A NO_TYPE second type is skipped, so
+    single-type attackers always use their one type.
+    """
+    best_type, best = attacker_types[0], effectiveness(attacker_types[0], defender_types)
+    if attacker_types[1] != NO_TYPE:
+        second = effectiveness(attacker_types[1], defender_types)
+        if second > best:
+            best_type, best = attacker_types[1], second
+    return best_type, best
+
+def matchup_matrix(type1, type2):
+    """
+    Dual-type multipliers for every species pair.
+
+    `type1` and `type2` are integer arrays of type ids, one entry per
+    species. Returns an (n, n) matrix whose [a, d] entry is the best
+    multiplier species a's own types get against species d.
+    """
+    type1 = np.asarray(type1)
+    type2 = np.asarray(type2)
+    # against[t, d]: move of type t against defender d's dual typing
+    against = TYPE_CHART[:, type1] * TYPE_CHART[:, type2]
+    best = against[type1]
+    # A missing second type must not win; NO_TYPE's neutral row would
+    second = np.where((type2 != NO_TYPE)[:, None], against[type2], 0.0)
+    return np.maximum(best, second)
+
+def damage(level, attack, defense, multiplier, roll, power=BASE_POWER, stab=STAB):
+    """
+    Damage dealt by one hit: the main-series formula with STAB and type.
+
+    Arguments may be plain numbers or NumPy arrays (broadcast together);
+    only arithmetic operators are used, so a single live hit does not pay
+    for NumPy calls. `roll` is uniform in [MIN_ROLL, 1.0]. The result is
+    a whole number (a float, or a float array): at least 1 unless the
+    defender is immune, in which case 0.
+    """
+    base = (2 * level / 5 + 2) * power * attack / defense / 50 + 2
+    dealt = (base * stab * multiplier * roll) // 1
+    return (dealt + (dealt < 1) * (1 - dealt)) * (multiplier > 0)
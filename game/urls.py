@@ -1,19 +1,29 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+catch_views = async_views if settings.ASYNC_CATCH_VIEWS else views
 
 app_name = 'game'
 
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('pokemon/', views.pokemon_list, name='pokemon_list'),
+    path('pokemon/heal/', views.heal_pokemon, name='heal_pokemon'),
+    path('pokemon/release/', views.release_pokemon, name='release_pokemon'),
+    path('pokemon/evolve/', views.evolve_pokemon, name='evolve_pokemon'),
+    path('pokemon/export/', views.export_pokemon, name='export_pokemon'),
     path('pokemon/<int:pokemon_id>/', views.pokemon_detail, name='pokemon_detail'),
     # path('catch/', views.catch_pokemon, name='catch_pokemon'),
     path('wild-map/', views.wild_map, name='wild_map'),
-    path('catch/encounter/', views.encounter_pokemon, name='encounter_pokemon'),
-    path('catch/attempt/', views.attempt_catch, name='attempt_catch'),
+    path('catch/encounter/', catch_views.encounter_pokemon, name='encounter_pokemon'),
+    path('catch/encounter/batch/', views.encounter_batch, name='encounter_batch'),
+    path('catch/attempt/', catch_views.attempt_catch, name='attempt_catch'),
     path('battle/', views.battle_wild, name='battle_wild'),
+    path('battle/auto/', views.auto_battle, name='auto_battle'),
     path('battle/<int:battle_id>/', views.battle_detail, name='battle_detail'),
     path('battle/<int:battle_id>/action/', views.battle_action, name='battle_action'),
+    path('pvp/', views.pvp_lobby, name='pvp_lobby'),
     path('profile/', views.profile, name='profile'),
     path('shop/', views.shop, name='shop'),
 ]
@@ -1,17 +1,41 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.contrib import messages
-from django.utils import timezone
-from django.db.models import Q
+from django.core import signing
 import random
-import json
-import time
 
 from .models import (
-    PokemonSpecies, UserProfile, UserPokemon,
+    RARITY_CHOICES, UserPokemon,
     Battle, Item, UserItem
 )
+from .battle_state import (
+    battle_session_lock, finish_battle_session, load_battle_session, new_wild_battle,
+    pokemon_battle_lock, run_auto_battles, save_battle_session, start_battle_session
+)
+from .catalog import get_species_catalog
+from .catch import MAX_THROWS_PER_REQUEST, json_body, parse_throws, resolve_catch, roll_encounter
+from .encounters import ENCOUNTER_MAX_AGE, claim_encounter, load_encounter
+from .evolution import evolve_all
+from .export import EXPORT_FORMATS, export_rows
+from .pagination import keyset_page
+from .pvp import pokemon_in_pvp
+from .release import bulk_release, releasable_pokemon
+from .search import FILTER_PARAMS, SORTS as POKEMON_SORTS, search_pokemon
+
+# Encounters handed out per encounter_batch call by default, and at most
+ENCOUNTER_BATCH_SIZE = 10
+ENCOUNTER_BATCH_MAX = 25
+
+# Cards per page (and per infinite-scroll fetch) on the collection page
+POKEMON_PAGE_SIZE = 24
+
+# Most wild battles a single auto-battle request may fight
+AUTO_BATTLE_BATCH_MAX = 20
+
+# Seconds a battle request waits for another one on the same battle
+BATTLE_LOCK_WAIT = 2
 
 def dashboard(request):
     """Main dashboard view"""
@@ -19,7 +43,7 @@ def dashboard(request):
         return render(request, 'game/landing.html')
 
     profile = request.user.userprofile
-    recent_pokemon = UserPokemon.objects.filter(owner=request.user)[:6]
+    recent_pokemon = UserPokemon.objects.filter(owner=request.user).select_related('species')[:6]
 
     context = {
         'profile': profile,
@@ -29,35 +53,128 @@ def dashboard(request):
 
 @login_required
 def pokemon_list(request):
-    """List user's Pokemon"""
-    pokemon = UserPokemon.objects.filter(owner=request.user)
+    """
+    List user's Pokemon, a page at a time.
 
-    # Filter by type if specified
-    type_filter = request.GET.get('type')
-    if type_filter:
-        pokemon = pokemon.filter(
-            Q(species__type1=type_filter) | Q(species__type2=type_filter)
-        )
+    HTMX requests (the infinite scroll) get just the next page of cards.
+    """
+    pokemon = UserPokemon.objects.filter(owner=request.user).select_related('species')
+
+    pokemon = search_pokemon(pokemon, request.GET, get_species_catalog())
 
     # Sort options
     sort_by = request.GET.get('sort', 'caught_at')
-    if sort_by == 'level':
-        pokemon = pokemon.order_by('-level')
-    elif sort_by == 'name':
-        pokemon = pokemon.order_by('species__name')
-    elif sort_by == 'iv':
-        # This would need a custom ordering in a real app
-        pokemon = pokemon.order_by('-caught_at')
-    else:
-        pokemon = pokemon.order_by('-caught_at')
+    if sort_by not in POKEMON_SORTS:
+        sort_by = 'caught_at'
+    page, cursor = keyset_page(
+        pokemon, POKEMON_SORTS[sort_by], request.GET.get('cursor'), POKEMON_PAGE_SIZE
+    )
+
+    next_url = None
+    if cursor:
+        params = request.GET.copy()
+        params['cursor'] = cursor
+        next_url = f'{request.path}?{params.urlencode()}'
 
     context = {
-        'pokemon': pokemon,
-        'current_type': type_filter,
+        'pokemon': page,
+        'next_url': next_url,
+        'filters': request.GET,
+        'filtered': not FILTER_PARAMS.isdisjoint(k for k, v in request.GET.items() if v),
+        'current_type': request.GET.get('type', ''),
         'current_sort': sort_by,
     }
+    if request.headers.get('HX-Request'):
+        return render(request, 'game/pokemon_cards.html', context)
+
+    context['pokemon_count'] = request.user.userprofile.pokemon_count
+    context['rarity_choices'] = RARITY_CHOICES
+    context['species_choices'] = sorted(get_species_catalog(), key=lambda species: species.name)
     return render(request, 'game/pokemon_list.html', context)
 
+@login_required
+def export_pokemon(request):
+    """Stream the trainer's collection (with the collection page's filters) as NDJSON or CSV"""
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'success': False, 'message': 'Unknown export format'}, status=400)
+    encode, content_type, extension = EXPORT_FORMATS[export_format]
+
+    pokemon = search_pokemon(
+        UserPokemon.objects.filter(owner=request.user), request.GET, get_species_catalog()
+    )
+    response = StreamingHttpResponse(encode(export_rows(pokemon)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="pokemon-{request.user.pk}.{extension}"'
+    return response
+
+@login_required
+def heal_pokemon(request):
+    """
+    Pokemon Center: heal the selected Pokemon (`pokemon` ids in the POST),
+    or the whole collection if none are given, in one UPDATE.
+    """
+    if request.method != 'POST':
+        return redirect('game:pokemon_list')
+
+    pokemon = UserPokemon.objects.filter(owner=request.user)
+    selected = request.POST.getlist('pokemon')
+    if selected:
+        pokemon = pokemon.filter(id__in=[pk for pk in selected if pk.isdigit()])
+    # A battle in progress writes its own HP back when it ends
+    pokemon = pokemon.exclude(battles_as_player__status='ongoing').exclude(id=pokemon_in_pvp(request.user.id))
+
+    healed = UserPokemon.heal_many(pokemon)
+    if request.headers.get('HX-Request'):
+        return JsonResponse({'success': True, 'healed': healed})
+
+    if healed:
+        messages.success(request, f"Healed {healed} Pokemon back to full HP!")
+    else:
+        messages.info(request, "Your Pokemon are already at full HP.")
+    if len(selected) == 1 and selected[0].isdigit():
+        return redirect('game:pokemon_detail', pokemon_id=selected[0])
+    return redirect('game:pokemon_list')
+
+@login_required
+def release_pokemon(request):
+    """Release every non-favourite, non-shiny Pokemon of a species and/or below an IV %"""
+    if request.method != 'POST':
+        return redirect('game:pokemon_list')
+
+    try:
+        species_id = int(request.POST['species']) if request.POST.get('species') else None
+        max_iv = int(request.POST['max_iv']) if request.POST.get('max_iv') else None
+    except ValueError:
+        messages.error(request, "Invalid release filter!")
+        return redirect('game:pokemon_list')
+
+    # Releasing the whole box needs at least one filter
+    if species_id is None and max_iv is None:
+        messages.error(request, "Pick a species or an IV limit to release by.")
+        return redirect('game:pokemon_list')
+
+    released, coins = bulk_release(releasable_pokemon(request.user, species_id, max_iv))
+    if released:
+        messages.success(request, f"Released {released} Pokemon and received {coins} coins.")
+    else:
+        messages.info(request, "No Pokemon matched; favourites and shinies are never released.")
+    return redirect('game:pokemon_list')
+
+@login_required
+def evolve_pokemon(request):
+    """Evolve every Pokemon that has reached its evolution level, one stage each"""
+    if request.method != 'POST':
+        return redirect('game:pokemon_list')
+
+    # A battle in progress keeps the species it started with
+    pokemon = UserPokemon.objects.filter(owner=request.user).exclude(battles_as_player__status='ongoing')
+    evolved = evolve_all(pokemon)
+    if evolved:
+        messages.success(request, f"{evolved} Pokemon evolved!")
+    else:
+        messages.info(request, "None of your Pokemon are ready to evolve.")
+    return redirect('game:pokemon_list')
+
 @login_required
 def pokemon_detail(request, pokemon_id):
     """Pokemon detail view"""
@@ -206,27 +323,33 @@ def battle_wild(request):
         if selected_pokemon.current_hp <= 0:
             messages.error(request, "That Pokemon is fainted!")
             return redirect('game:battle_wild')
+        if selected_pokemon.id == pokemon_in_pvp(request.user.id):
+            messages.error(request, "That Pokemon is in a PvP battle!")
+            return redirect('game:battle_wild')
 
         # Create a wild opponent
-        all_species = list(PokemonSpecies.objects.all())
-        if not all_species:
+        catalog = get_species_catalog()
+        if not catalog:
             messages.error(request, "No Pokemon species available!")
             return redirect('game:dashboard')
 
-        wild_species = random.choice(all_species)
-        wild_level = random.randint(max(1, selected_pokemon.level - 5), selected_pokemon.level + 5)
-
-        # Create battle
-        battle = Battle.objects.create(
-            trainer=request.user,
-            battle_type='wild',
-            player_pokemon=selected_pokemon,
-            opponent_pokemon=wild_species,
-            opponent_level=wild_level
-        )
-
-        battle.add_to_log(f"A wild {wild_species.name} appeared!")
-        battle.add_to_log(f"Go, {selected_pokemon.display_name}!")
+        # A battle writes the Pokemon's HP back when it ends, so a Pokemon
+        # fights one battle at a time; the lock covers the check and insert
+        with pokemon_battle_lock(selected_pokemon.id, wait=BATTLE_LOCK_WAIT) as locked:
+            if not locked:
+                messages.error(request, "That Pokemon is busy, try again.")
+                return redirect('game:battle_wild')
+            ongoing = Battle.objects.filter(
+                player_pokemon=selected_pokemon, status='ongoing'
+            ).values_list('id', flat=True).first()
+            if ongoing is not None:
+                messages.info(request, "That Pokemon is already in a battle!")
+                return redirect('game:battle_detail', battle_id=ongoing)
+
+            # Create battle
+            battle = new_wild_battle(request.user, selected_pokemon, catalog)
+            battle.save()
+            start_battle_session(battle)
 
         return redirect('game:battle_detail', battle_id=battle.id)
 
@@ -238,114 +361,153 @@ def battle_wild(request):
 @login_required
 def battle_detail(request, battle_id):
     """Battle detail view"""
-    battle = get_object_or_404(Battle, id=battle_id, trainer=request.user)
-
-    if battle.status != 'ongoing':
-        # Battle is finished, show results
-        context = {
-            'battle': battle,
-            'battle_log': json.loads(battle.battle_log) if battle.battle_log else [],
-        }
-        return render(request, 'game/battle_result.html', context)
-
+    with battle_session_lock(battle_id, wait=BATTLE_LOCK_WAIT) as locked:
+        if not locked:
+            return HttpResponse("This battle is busy, try again.", status=409)
+        session = load_battle_session(battle_id, request.user)
+    battle = session.battle
+
+    # A finished battle shows its results on the same page; either way only
+    # the tail of the log (battle.recent_events(), loaded with the session)
     context = {
         'battle': battle,
-        'battle_log': json.loads(battle.battle_log) if battle.battle_log else [],
+        'battle_log': session.events,
     }
     return render(request, 'game/battle.html', context)
 
 @login_required
 def battle_action(request, battle_id):
-    """Handle battle actions via HTMX"""
-    battle = get_object_or_404(Battle, id=battle_id, trainer=request.user)
-
-    if battle.status != 'ongoing':
-        return JsonResponse({'error': 'Battle is not ongoing'})
-
-    if request.method == 'POST':
-        action = request.POST.get('action')
-
-        if action == 'attack':
-            # Simple battle system
-            player_pokemon = battle.player_pokemon
-            opponent_level = battle.opponent_level
-
-            # Calculate damage (simplified)
-            player_attack = player_pokemon.attack_stat
-            base_damage = random.randint(10, 30) + (player_attack // 10)
-
-            battle.turns += 1
-            battle.add_to_log(f"{player_pokemon.display_name} attacks for {base_damage} damage!")
-
-            # Opponent attacks back (simplified)
-            opponent_attack = random.randint(20, 40) + opponent_level
-            damage_to_player = max(1, opponent_attack - (player_pokemon.defense_stat // 10))
-
-            player_pokemon.current_hp = max(0, player_pokemon.current_hp - damage_to_player)
-            player_pokemon.save()
-
-            battle.add_to_log(f"Wild {battle.opponent_pokemon.name} attacks for {damage_to_player} damage!")
-
-            # Check battle end conditions
-            if player_pokemon.current_hp <= 0:
-                battle.status = 'lost'
-                battle.add_to_log(f"{player_pokemon.display_name} fainted!")
-                battle.add_to_log("You lost the battle!")
-
-                # Update profile stats
-                profile = request.user.userprofile
-                profile.battles_lost += 1
-                profile.save()
-
-            elif random.random() < 0.3:  # 30% chance opponent faints
-                battle.status = 'won'
-                battle.add_to_log(f"Wild {battle.opponent_pokemon.name} fainted!")
-                battle.add_to_log("You won the battle!")
-
-                # Rewards
-                exp_gained = opponent_level * 15
-                coins_gained = opponent_level * 5
-
-                battle.experience_gained = exp_gained
-                battle.coins_gained = coins_gained
-
-                # Update Pokemon and profile
-                player_pokemon.battles_won += 1
-                player_pokemon.save()
-
-                profile = request.user.userprofile
-                profile.battles_won += 1
-                profile.coins += coins_gained
-                profile.add_experience(exp_gained)
-
-                battle.add_to_log(f"Gained {exp_gained} experience and {coins_gained} coins!")
-
-            battle.save()
-
-        elif action == 'flee':
-            battle.status = 'fled'
-            battle.add_to_log("You fled from the battle!")
-            battle.save()
+    """
+    Handle battle actions via HTMX.
+
+    Turns are played against the cached battle session; the database is
+    only written once the battle ends.
+    """
+    # One turn at a time: a second click waits for the first to be saved,
+    # then plays against the updated session
+    with battle_session_lock(battle_id, wait=BATTLE_LOCK_WAIT) as locked:
+        if not locked:
+            return JsonResponse({'error': 'Battle is busy'}, status=409)
+
+        session = load_battle_session(battle_id, request.user)
+        battle = session.battle
+
+        if battle.status != 'ongoing':
+            return JsonResponse({'error': 'Battle is not ongoing'})
+
+        if request.method == 'POST':
+            session.play_turn(request.POST.get('action'), random)
+
+            # Pokemon, profile and log are written once, when the battle ends
+            if battle.status == 'ongoing':
+                save_battle_session(session)
+            else:
+                finish_battle_session(session)
 
     # Return updated battle state for HTMX
     context = {
         'battle': battle,
-        'battle_log': json.loads(battle.battle_log) if battle.battle_log else [],
+        'battle_log': session.events,
     }
     return render(request, 'game/battle_partial.html', context)
 
+@login_required
+def auto_battle(request):
+    """
+    Fight several wild battles back to back with one Pokemon.
+
+    Takes {"pokemon_id": ..., "count": N}. Every battle is played to the end
+    server-side and saved in one go; the reply is a summary plus the events
+    of each battle.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method'})
+
+    data = json_body(request)
+    try:
+        pokemon_id = int(data.get('pokemon_id'))
+        count = int(data.get('count', 1))
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'message': 'Choose a Pokemon to battle with!'})
+    count = max(1, min(count, AUTO_BATTLE_BATCH_MAX))
+
+    catalog = get_species_catalog()
+    if not catalog:
+        return JsonResponse({'success': False, 'message': 'No Pokemon species available!'})
+
+    # The results write the Pokemon's HP as an absolute value, so runs for
+    # one Pokemon go one at a time, each starting from the HP the last left
+    with pokemon_battle_lock(pokemon_id, wait=BATTLE_LOCK_WAIT) as locked:
+        if not locked:
+            return JsonResponse({'success': False, 'message': 'That Pokemon is busy, try again.'}, status=409)
+
+        pokemon = UserPokemon.objects.select_related('species').filter(
+            id=pokemon_id, owner=request.user
+        ).first()
+        if pokemon is None:
+            return JsonResponse({'success': False, 'message': 'Choose a Pokemon to battle with!'})
+        if pokemon.current_hp <= 0:
+            return JsonResponse({'success': False, 'message': "That Pokemon is fainted!"})
+        if pokemon.id == pokemon_in_pvp(request.user.id):
+            return JsonResponse({'success': False, 'message': "That Pokemon is in a PvP battle!"})
+        # An ongoing battle would write its own HP back over ours when it ends
+        if Battle.objects.filter(player_pokemon=pokemon, status='ongoing').exists():
+            return JsonResponse({'success': False, 'message': f"{pokemon.display_name} is already in a battle!"})
+
+        results = run_auto_battles(request.user, pokemon, catalog, count)
+
+    battles = [battle for battle, _ in results]
+    return JsonResponse({
+        'success': True,
+        'summary': {
+            'battles': len(battles),
+            'won': sum(battle.status == 'won' for battle in battles),
+            'lost': sum(battle.status == 'lost' for battle in battles),
+            'fled': sum(battle.status == 'fled' for battle in battles),
+            'experience': sum(battle.experience_gained for battle in battles),
+            'coins': sum(battle.coins_gained for battle in battles),
+            'pokemon_hp': pokemon.current_hp,
+            'pokemon_max_hp': pokemon.max_hp,
+        },
+        'battles': [
+            {
+                'id': battle.id,
+                'opponent': battle.opponent_pokemon.name,
+                'level': battle.opponent_level,
+                'status': battle.status,
+                'turns': battle.turns,
+                'experience': battle.experience_gained,
+                'coins': battle.coins_gained,
+                'events': [event.message for event in events],
+            }
+            for battle, events in results
+        ],
+    })
+
 @login_required
 def profile(request):
     """User profile view"""
     profile = request.user.userprofile
-    pokemon_count = UserPokemon.objects.filter(owner=request.user).count()
 
     context = {
         'profile': profile,
-        'pokemon_count': pokemon_count,
+        'pokemon_count': profile.pokemon_count,
     }
     return render(request, 'game/profile.html', context)
 
+@login_required
+def pvp_lobby(request):
+    """Trainer-vs-trainer battles; the battle itself runs over a WebSocket (game.pvp)"""
+    user_pokemon = UserPokemon.objects.filter(
+        owner=request.user, current_hp__gt=0
+    ).select_related('species').order_by('-level')
+
+    if not user_pokemon.exists():
+        messages.error(request, "You need healthy Pokemon to battle!")
+        return redirect('game:pokemon_list')
+
+    return render(request, 'game/pvp.html', {'user_pokemon': user_pokemon})
+
 @login_required
 def shop(request):
     """Shop view"""
@@ -389,18 +551,15 @@ def shop(request):
 def wild_map(request):
     """Wild Pokemon map interface"""
     profile = request.user.userprofile
-    pokemon_count = UserPokemon.objects.filter(owner=request.user).count()
 
     # Check daily catch limit
-    today = timezone.now().date()
-    if profile.last_catch_reset != today:
-        profile.daily_catches = 0
-        profile.last_catch_reset = today
-        profile.save()
+    profile.refresh_daily_catches()
 
     context = {
         'profile': profile,
-        'pokemon_count': pokemon_count,
+        'pokemon_count': profile.pokemon_count,
+        'encounter_batch_size': ENCOUNTER_BATCH_SIZE,
+        'max_throws': MAX_THROWS_PER_REQUEST,
     }
     return render(request, 'game/wild_map.html', context)
 
@@ -417,149 +576,107 @@ def encounter_pokemon(request):
         return JsonResponse({'success': False, 'message': "You don't have any Pokeballs!"})
 
     # Check daily catch limit
-    today = timezone.now().date()
-    if profile.last_catch_reset != today:
-        profile.daily_catches = 0
-        profile.last_catch_reset = today
-        profile.save()
+    profile.refresh_daily_catches()
 
-    if profile.daily_catches >= 50:
+    if profile.daily_catches >= settings.DAILY_CATCH_LIMIT:
         return JsonResponse({'success': False, 'message': "You've reached your daily catch limit!"})
 
-    # Get all Pokemon species
-    all_species = list(PokemonSpecies.objects.all())
-    if not all_species:
+    # Weighted random selection based on rarity
+    sampler = get_species_catalog().encounter_sampler
+    if not len(sampler):
         return JsonResponse({'success': False, 'message': 'No Pokemon species available!'})
 
-    # Weighted random selection based on rarity
-    rarity_weights = {
-        'common': 50,
-        'rare': 25,
-        'epic': 15,
-        'legendary': 5,
-        'ultrabeast': 1,
-        'mythical': 1,
-    }
+    return JsonResponse({
+        'success': True,
+        'pokemon': roll_encounter(request.user.id, sampler, profile.level),
+    })
+
+@login_required
+def encounter_batch(request):
+    """Pre-roll several encounters so the map can spawn them client-side"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method'})
 
-    weighted_species = []
-    for species in all_species:
-        weight = rarity_weights.get(species.rarity, 1)
-        weighted_species.extend([species] * weight)
+    profile = request.user.userprofile
 
-    wild_pokemon = random.choice(weighted_species)
-    wild_level = random.randint(1, min(profile.level + 5, 50))
+    if profile.pokeballs <= 0:
+        return JsonResponse({'success': False, 'message': "You don't have any Pokeballs!"})
 
-    # Store encounter in session for catch attempt
-    request.session['current_encounter'] = {
-        'species_id': wild_pokemon.id,
-        'level': wild_level,
-        'timestamp': time.time()
-    }
+    profile.refresh_daily_catches()
+
+    # A soft cap only: it doesn't count tokens handed out by earlier batches.
+    # The limit itself is enforced when a catch is made (attempt_catch).
+    remaining = settings.DAILY_CATCH_LIMIT - profile.daily_catches
+    if remaining <= 0:
+        return JsonResponse({'success': False, 'message': "You've reached your daily catch limit!"})
+
+    try:
+        count = int(json_body(request).get('count', ENCOUNTER_BATCH_SIZE))
+    except (TypeError, ValueError):
+        count = ENCOUNTER_BATCH_SIZE
+    count = max(1, min(count, ENCOUNTER_BATCH_MAX, remaining))
+
+    sampler = get_species_catalog().encounter_sampler
+    if not len(sampler):
+        return JsonResponse({'success': False, 'message': 'No Pokemon species available!'})
+
+    fields = ['id', 'name', 'level', 'rarity', 'token']
+    encounters = []
+    for _ in range(count):
+        encounter = roll_encounter(request.user.id, sampler, profile.level)
+        encounters.append([encounter[field] for field in fields])
 
     return JsonResponse({
         'success': True,
-        'pokemon': {
-            'id': wild_pokemon.id,
-            'name': wild_pokemon.name,
-            'level': wild_level,
-            'rarity': wild_pokemon.rarity
-        }
+        'fields': fields,
+        'encounters': encounters,
+        'max_age': ENCOUNTER_MAX_AGE,
     })
 
 @login_required
 def attempt_catch(request):
-    """Attempt to catch the encountered Pokemon"""
+    """
+    Attempt to catch the encountered Pokemon.
+
+    Sending "throws": N keeps throwing until the Pokemon is caught or N balls
+    are spent, all within this one request.
+    """
     if request.method != 'POST':
         return JsonResponse({'success': False, 'message': 'Invalid request method'})
 
     profile = request.user.userprofile
 
-    # Get encounter from session
-    encounter = request.session.get('current_encounter')
-    if not encounter:
+    data = json_body(request)
+    token = data.get('encounter')
+    if not token:
         return JsonResponse({'success': False, 'message': 'No active encounter!'})
 
-    # Check if encounter is still valid (within 5 minutes)
-    if time.time() - encounter['timestamp'] > 300:
-        del request.session['current_encounter']
+    try:
+        species_id, wild_level, nonce = load_encounter(request.user.id, token)
+    except signing.SignatureExpired:
         return JsonResponse({'success': False, 'message': 'Encounter expired!'})
+    except signing.BadSignature:
+        return JsonResponse({'success': False, 'message': 'No active encounter!'})
 
     # Check if user has pokeballs
     if profile.pokeballs <= 0:
         return JsonResponse({'success': False, 'message': "You don't have any Pokeballs!"})
 
+    # A trainer can hold any number of signed encounters, so the daily
+    # limit is enforced here, where catches are counted
+    profile.refresh_daily_catches()
+    if profile.daily_catches >= settings.DAILY_CATCH_LIMIT:
+        return JsonResponse({'success': False, 'message': "You've reached your daily catch limit!"})
+
     # Get the Pokemon species
-    try:
-        wild_pokemon = PokemonSpecies.objects.get(id=encounter['species_id'])
-    except PokemonSpecies.DoesNotExist:
+    wild_pokemon = get_species_catalog().get(species_id)
+    if wild_pokemon is None:
         return JsonResponse({'success': False, 'message': 'Invalid Pokemon species!'})
 
-    wild_level = encounter['level']
-
-    # Calculate catch chance
-    catch_rate = wild_pokemon.catch_rate
-    level_modifier = max(0.1, 1 - (wild_level - profile.level) * 0.05)
-    catch_chance = (catch_rate / 255) * level_modifier
-
-    # Use pokeball
-    profile.pokeballs -= 1
-
-    if random.random() < catch_chance:
-        # Successful catch!
-        caught_pokemon = UserPokemon.objects.create(
-            owner=request.user,
-            species=wild_pokemon,
-            level=wild_level,
-            iv_hp=random.randint(0, 31),
-            iv_attack=random.randint(0, 31),
-            iv_defense=random.randint(0, 31),
-            iv_speed=random.randint(0, 31),
-        )
-
-        profile.daily_catches += 1
-
-        # Award experience and coins
-        exp_gained = wild_level * 10
-        coins_gained = wild_level * 5
-
-        profile.experience += exp_gained
-        profile.coins += coins_gained
-
-        # Check for level up
-        level_up = False
-        while profile.experience >= profile.level * 1000:
-            profile.experience -= profile.level * 1000
-            profile.level += 1
-            level_up = True
-
-        profile.save()
-
-        # Clear encounter
-        del request.session['current_encounter']
-
-        pokemon_count = UserPokemon.objects.filter(owner=request.user).count()
-
-        message = f"Caught {wild_pokemon.name} (Level {wild_level})!"
-        if level_up:
-            message += f" You leveled up to Level {profile.level}!"
-
-        return JsonResponse({
-            'success': True,
-            'message': message,
-            'pokeballs': profile.pokeballs,
-            'daily_catches': profile.daily_catches,
-            'pokemon_count': pokemon_count,
-            'exp_gained': exp_gained,
-            'coins_gained': coins_gained
-        })
-    else:
-        # Failed catch
-        profile.save()
-
-        return JsonResponse({
-            'success': False,
-            'message': f"{wild_pokemon.name} broke free!",
-            'pokeballs': profile.pokeballs,
-            'daily_catches': profile.daily_catches
-        })
+    # Reserve the encounter so it cannot be caught twice
+    if not claim_encounter(nonce):
+        return JsonResponse({'success': False, 'message': 'This Pokemon is no longer here!'})
 
+    return resolve_catch(
+        request.user, profile, wild_pokemon, wild_level, nonce, parse_throws(data, profile.pokeballs)
+    )
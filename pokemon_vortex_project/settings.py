@@ -105,10 +105,11 @@ REDIS_URL = config('REDIS_URL', default='redis://localhost:6379/0')
 
 # Cache configuration
 if DEBUG:
-    # Use dummy cache for development
+    # Use local memory cache for development (encounter replay protection
+    # needs a cache that actually stores keys)
     CACHES = {
         'default': {
-            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         }
     }
 else:
@@ -211,3 +212,14 @@ POKEMON_API_BASE_URL = 'https://pokeapi.co/api/v2/'
 MAX_POKEMON_PER_USER = 1000
 DAILY_CATCH_LIMIT = 50
 
+# Serve the wild-map encounter/catch endpoints from game.async_views
+# (only worth it when running under ASGI)
+ASYNC_CATCH_VIEWS = config('ASYNC_CATCH_VIEWS', default=False, cast=bool)
+
+# Trainer-vs-trainer battles (game.pvp, served by asgi.py). 'memory' keeps
+# rooms and sockets in one process; 'redis' lets them span ASGI workers.
+PVP_CHANNEL_LAYER = config('PVP_CHANNEL_LAYER', default='memory')
+PVP_TURN_SECONDS = 30
+PVP_JOIN_SECONDS = 120
+# How long a socket waits for its room to answer the join
+PVP_JOIN_ACK_SECONDS = 5